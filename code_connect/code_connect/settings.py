@@ -31,6 +31,7 @@ ALLOWED_HOSTS = ['*']
 LOGIN_URL = "/admin/login/"
 
 AUTH_USER_MODEL = 'members.CustomUser'
+PASSWORD_SETUP_TOKEN_MAX_AGE = 15 * 60  # seconds a newly registered member has to open the setup-password page
 # APPEND_SLASH = True
 
 
@@ -96,6 +97,12 @@ DATABASES = {
     "default": {
         "ENGINE": "django.db.backends.sqlite3",
         "NAME": BASE_DIR / "db.sqlite3",
+        # the test db is a file rather than sqlite's in-memory db, so that the thread and
+        # process pools of `run_tasks` can be tested (a forked process can't see an
+        # in-memory db, and threads sharing one fail on its table locks). It is kept in the
+        # checkout, so that runs from different checkouts don't share it; set TEST_DB_NAME
+        # to run the tests of a single checkout concurrently.
+        "TEST": {"NAME": os.environ.get("TEST_DB_NAME", BASE_DIR / "test_db.sqlite3")},
     }
 }
 
@@ -162,4 +169,26 @@ EMAIL_HOST_USER = os.environ["EMAIL"]
 EMAIL_HOST_PASSWORD = os.environ["EMAIL_APP_PASSWORD"]
 EMAIL_PORT = 587
 EMAIL_USE_TLS = True
-EMAIL_BACKEND = 'django.core.mail.backends.smtp.EmailBackend'
\ No newline at end of file
+EMAIL_BACKEND = 'django.core.mail.backends.smtp.EmailBackend'
+EMAIL_POOL_MAX_MESSAGES = 100   # a pooled connection is reopened after sending this many mails
+EMAIL_ASYNC_CONNECTIONS = 10    # SMTP connections open at once in `run_tasks --async`
+# outgoing mail rate, shared by all the workers on this host (see home/ratelimit.py)
+EMAIL_RATE_LIMIT = 1    # mails per second, None disables the limiter
+EMAIL_RATE_BURST = 5    # mails that may be sent back to back
+# mails per day, None for no cap. Set it to the provider's quota, eg. 500 for a regular Gmail
+# account or 2000 for Workspace. Mails over it are deferred to the next day, not dropped, so
+# a capped bulk invite takes several days to go out.
+EMAIL_DAILY_LIMIT = None
+EMAIL_RATE_STATE_FILE = None    # keeps the daily count across restarts. Defaults to a file in the system temp dir
+
+
+# BACKGROUND TASKS (manage.py run_tasks)
+TASK_WAKEUP_DIR = None  # sockets used to wake up idle workers. Defaults to a dir in the system temp dir
+TASK_POLL_MIN_INTERVAL = 0.5    # seconds an idle worker waits before polling the queue again..
+TASK_POLL_MAX_INTERVAL = 60     # ..doubling up to this while the queue stays empty
+TASK_POLL_FALLBACK_MAX_INTERVAL = 5     # max interval when no wakeup channel is available
+TASK_ARCHIVE_AFTER_DAYS = 30    # completed tasks older than this are moved out by `archive_tasks`
+TASK_HEARTBEAT_INTERVAL = 10    # seconds between two heartbeats of a worker
+TASK_HEARTBEAT_TIMEOUT = 60     # a worker silent for this long is dead, its tasks are requeued
+TASK_DRAIN_TIMEOUT = 30     # seconds a stopping worker waits for its in-flight tasks
+TASK_METRICS_DIR = None   # dir the workers write their metrics to, see `home.metrics`
\ No newline at end of file
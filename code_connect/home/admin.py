@@ -17,10 +17,13 @@ __status__ = "Development"
 
 from django.contrib import admin
 
-from home.models import SendInviteTask, Task
+from home.models import SendInviteTask, ImportInvitesTask, Task, ArchivedTask, WorkerHeartbeat
 
 
 #______________________________________________admin-models_________________________________________________
 
 admin.site.register(Task)
-admin.site.register(SendInviteTask)
\ No newline at end of file
+admin.site.register(SendInviteTask)
+admin.site.register(ImportInvitesTask)
+admin.site.register(ArchivedTask)
+admin.site.register(WorkerHeartbeat)
\ No newline at end of file
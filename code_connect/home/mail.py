@@ -0,0 +1,402 @@
+#_____________________________________________________________________________________________________
+"""
+    - pooled mail connections used by the background tasks.
+
+    Opening an SMTP connection (TLS handshake + AUTH) costs far more than sending a
+    mail over it, so the worker keeps its connections open and reuses them across tasks.
+
+    AsyncConnectionPool does the same for the `run_tasks --async` worker, on top of the
+    optional `aiosmtplib` package.
+"""
+
+__author__ = "Tejaswin Singh, "
+__copyright__ = "Copyright 2024, Code Connect Home"
+__credits__ = ["Tejaswin Singh", "", ]
+__license__ = "GPL"
+__version__ = "1.0.0"
+__maintainer__ = "Tejaswin Singh"
+__email__ = "tejaswin.cs08@gmail.com"
+__status__ = "Development"
+
+#______________________________________________imports_________________________________________________
+
+from django.conf import settings
+from django.core.mail import get_connection, EmailMessage
+from django.core.mail.backends.smtp import EmailBackend as SMTPEmailBackend
+from django.utils.module_loading import import_string
+from asgiref.sync import sync_to_async
+
+from home.ratelimit import RateLimiter, DailyLimitReached, get_limiter
+from home import metrics
+
+from contextlib import contextmanager
+from smtplib import (
+    SMTPException, SMTPServerDisconnected, SMTPResponseException, SMTPRecipientsRefused, SMTPConnectError
+)
+from time import perf_counter
+import asyncio
+import atexit
+import threading
+
+# optional, only used by `run_tasks --async`. Imported on first use, see load_aiosmtplib()
+aiosmtplib = None
+
+
+#___________________________________________connection pool________________________________________________
+
+class PooledConnection:
+    """ an open mail backend along with the number of mails sent over it """
+
+    def __init__(self, backend):
+        self.backend = backend
+        self.sent = 0
+
+    def open(self):
+        self.backend.open()
+        self.sent = 0
+
+    def close(self):
+        self.backend.close()
+
+    def reconnect(self):
+        """ drops the (possibly dead) connection and opens a new one """
+        self.close()
+        self.open()
+
+
+class ConnectionPool:
+    """
+        - pool of long-lived mail connections, safe to share between threads.
+
+        *   a connection is opened on first use and handed back to the pool afterwards,
+            so the TLS handshake and AUTH are paid once per connection, not once per mail.
+        *   if the server dropped the connection (idle timeout, restart..), it is reopened
+            and the mail is sent again once.
+        *   a connection is recycled after {max_messages} mails, since providers limit the
+            number of mails per connection (EMAIL_POOL_MAX_MESSAGES).
+        *   if a {limiter} is given (see `home.ratelimit`), every mail waits for its turn
+            before being sent. DailyLimitReached is raised once the daily budget is spent.
+    """
+
+    RECONNECT_ERRORS = (SMTPServerDisconnected, ConnectionError)
+
+    def __init__(self, max_messages: int = None, backend: str = None, limiter: RateLimiter = None):
+        self.max_messages = max_messages or settings.EMAIL_POOL_MAX_MESSAGES
+        self.backend = backend
+        self.limiter = limiter
+        self._idle = []
+        self._lock = threading.Lock()
+
+    #_____________________________instance methods______________________
+
+    @contextmanager
+    def connection(self):
+        """ yields an open PooledConnection, and returns it to the pool afterwards """
+        conn = self._acquire()
+        try:
+            yield conn
+        except BaseException:
+            # state of the connection is unknown, don't reuse it
+            conn.close()
+            raise
+        else:
+            self._release(conn)
+
+    def send(self, message: EmailMessage) -> None:
+        """ sends {message} over a pooled connection """
+        if self.limiter:
+            self.limiter.acquire()
+        with self.connection() as conn, timed_send():
+            message.connection = conn.backend
+            try:
+                message.send()
+            except self.RECONNECT_ERRORS:
+                conn.reconnect()
+                message.send()
+            conn.sent += 1
+
+    def send_many(self, messages: list) -> list:
+        """
+            - sends all the {messages} over a single pooled connection.
+
+            *   a failing mail doesn't stop the others. Returns a list with the error
+                raised for each message (None if it was sent).
+            *   the connection is recycled mid-batch once it reaches {max_messages}.
+            *   once the daily budget is spent, the remaining messages aren't sent and
+                get the DailyLimitReached error.
+            *   likewise if no connection can be opened (refused, timed out, AUTH failed..),
+                the remaining messages get that error, so it is handled like any failed mail.
+        """
+        errors = []
+        conn = None
+        try:
+            for message in messages:
+                if self.limiter:
+                    try:
+                        self.limiter.acquire()
+                    except DailyLimitReached as e:
+                        errors.extend([e] * (len(messages) - len(errors)))
+                        break
+                if conn is None:
+                    try:
+                        conn = self._acquire()
+                    except Exception as e:
+                        errors.extend([e] * (len(messages) - len(errors)))
+                        break
+                message.connection = conn.backend
+                try:
+                    with timed_send():
+                        try:
+                            message.send()
+                        except self.RECONNECT_ERRORS:
+                            conn.reconnect()
+                            message.send()
+                except Exception as e:
+                    errors.append(e)
+                else:
+                    errors.append(None)
+                    conn.sent += 1
+                if conn.sent >= self.max_messages:
+                    conn.close()
+                    conn = None
+        except BaseException:
+            if conn:
+                conn.close()
+            raise
+        if conn:
+            self._release(conn)
+        return errors
+
+    def close_all(self) -> None:
+        """ closes all the idle connections """
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for conn in idle:
+            conn.close()
+
+    #_____________________________helpers________________________________
+
+    def _acquire(self) -> PooledConnection:
+        with self._lock:
+            if self._idle:
+                return self._idle.pop()
+        conn = PooledConnection(get_connection(self.backend, fail_silently=False))
+        conn.open()
+        return conn
+
+    def _release(self, conn: PooledConnection) -> None:
+        if conn.sent >= self.max_messages:
+            conn.close()
+            return
+        with self._lock:
+            self._idle.append(conn)
+
+
+#___________________________________________async connection pool________________________________________________
+
+class AsyncConnectionPool:
+    """
+        - asyncio version of ConnectionPool, sending mails with aiosmtplib.
+
+        *   up to {size} SMTP connections are open at once (EMAIL_ASYNC_CONNECTIONS),
+            providers refuse more concurrent connections than a few. Any number of
+            coroutines can send through the pool, they wait for a free connection.
+        *   connections are reused, reopened when dropped and recycled after
+            {max_messages} mails, just like in ConnectionPool.
+        *   aiosmtplib errors are raised as their `smtplib` counterparts, so callers
+            handle them (and is_transient() classifies them) the same way.
+    """
+
+    def __init__(self, size: int = None, max_messages: int = None, limiter: RateLimiter = None):
+        load_aiosmtplib()
+        self.size = size or settings.EMAIL_ASYNC_CONNECTIONS
+        self.max_messages = max_messages or settings.EMAIL_POOL_MAX_MESSAGES
+        self.limiter = limiter
+        self._idle = []
+        self._slots = asyncio.Semaphore(self.size)
+
+    #_____________________________instance methods______________________
+
+    async def send(self, message: EmailMessage) -> None:
+        """ sends {message} over a pooled connection """
+        if self.limiter:
+            # reserve() blocks on the file lock shared with other workers, so it runs
+            # off the event loop. Waiting for the turn of the mail happens here.
+            await asyncio.sleep(await sync_to_async(self.limiter.reserve, thread_sensitive=False)())
+        async with self._slots:
+            client = self._idle.pop() if self._idle else await self._connect()
+            try:
+                with timed_send():
+                    try:
+                        try:
+                            await self._send(client, message)
+                        except aiosmtplib.SMTPServerDisconnected:
+                            await self._reconnect(client)
+                            await self._send(client, message)
+                    except aiosmtplib.SMTPException as e:
+                        raise self._translate(e) from e
+            except BaseException:
+                # state of the connection is unknown, don't reuse it
+                client.close()
+                raise
+            client.sent += 1
+            if client.sent >= self.max_messages:
+                await self._quit(client)
+            else:
+                self._idle.append(client)
+
+    async def close_all(self) -> None:
+        """ closes all the idle connections """
+        idle, self._idle = self._idle, []
+        for client in idle:
+            await self._quit(client)
+
+    #_____________________________helpers________________________________
+
+    async def _connect(self):
+        # like django's smtp backend, only log in if both are set
+        login = bool(settings.EMAIL_HOST_USER and settings.EMAIL_HOST_PASSWORD)
+        client = aiosmtplib.SMTP(
+            hostname=settings.EMAIL_HOST,
+            port=settings.EMAIL_PORT,
+            username=settings.EMAIL_HOST_USER if login else None,
+            password=settings.EMAIL_HOST_PASSWORD if login else None,
+            use_tls=settings.EMAIL_USE_SSL,
+            start_tls=settings.EMAIL_USE_TLS,
+            timeout=settings.EMAIL_TIMEOUT,
+        )
+        try:
+            await client.connect()
+        except aiosmtplib.SMTPException as e:
+            raise self._translate(e) from e
+        client.sent = 0
+        return client
+
+    async def _reconnect(self, client) -> None:
+        """ drops the (possibly dead) connection and opens a new one """
+        client.close()
+        await client.connect()
+        client.sent = 0
+
+    async def _send(self, client, message: EmailMessage) -> None:
+        if not client.is_connected:
+            await self._reconnect(client)
+        # same as django's smtp backend
+        await client.sendmail(
+            message.from_email,
+            message.recipients(),
+            message.message().as_bytes(linesep="\r\n"),
+        )
+
+    async def _quit(self, client) -> None:
+        try:
+            await client.quit()
+        except aiosmtplib.SMTPException:
+            client.close()
+
+    @staticmethod
+    def _translate(error: Exception) -> Exception:
+        """ returns the `smtplib` exception matching the aiosmtplib {error} """
+        if isinstance(error, aiosmtplib.SMTPRecipientsRefused):
+            return SMTPRecipientsRefused(
+                {refused.recipient: (refused.code, refused.message) for refused in error.recipients}
+            )
+        if isinstance(error, aiosmtplib.SMTPServerDisconnected):
+            return SMTPServerDisconnected(str(error))
+        if isinstance(error, aiosmtplib.SMTPResponseException):
+            return SMTPResponseException(error.code, error.message)
+        if isinstance(error, OSError):
+            # connect errors and timeouts
+            return ConnectionError(str(error))
+        return SMTPException(str(error))
+
+
+class ThreadedConnectionPool:
+    """
+        - async wrapper around ConnectionPool, sending mails from a thread.
+        Used by `run_tasks --async` when aiosmtplib isn't installed, or when mails
+        don't go out over SMTP (eg. the locmem backend of the test runner).
+    """
+
+    def __init__(self, pool: ConnectionPool):
+        self.pool = pool
+
+    async def send(self, message: EmailMessage) -> None:
+        await sync_to_async(self.pool.send, thread_sensitive=False)(message)
+
+    async def close_all(self) -> None:
+        self.pool.close_all()
+
+
+#___________________________________________utilities________________________________________________
+
+@contextmanager
+def timed_send():
+    """ records the duration of a mail handed over to the server, or its error """
+    start = perf_counter()
+    try:
+        yield
+    except Exception as e:
+        metrics.SMTP_ERRORS.inc(error=type(e).__name__)
+        raise
+    metrics.SMTP_SEND_SECONDS.observe(perf_counter() - start)
+
+def is_transient(error: Exception) -> bool:
+    """
+        - returns True if sending a mail failed for a reason that may go away on its own,
+        so the mail should be retried later rather than given up on:
+
+        *   the connection to the server failed or was dropped.
+        *   the server answered with a 4xx code (eg. Gmail's "421 4.7.0 Try again later"
+            when it is rate limiting us).
+    """
+    if isinstance(error, SMTPRecipientsRefused):
+        codes = [code for code, _ in error.recipients.values()]
+        return bool(codes) and all(400 <= code < 500 for code in codes)
+    if isinstance(error, SMTPConnectError):
+        return True
+    if isinstance(error, SMTPResponseException):
+        return 400 <= error.smtp_code < 500
+    return isinstance(error, (SMTPServerDisconnected, OSError))
+
+def load_aiosmtplib():
+    """
+        - imports aiosmtplib, returns the module or None if it isn't installed. Done on
+        first use rather than along with this module, as only `run_tasks --async` needs it.
+    """
+    global aiosmtplib
+    if aiosmtplib is None:
+        try:
+            import aiosmtplib as module
+        except ImportError:
+            return None
+        aiosmtplib = module
+    return aiosmtplib
+
+_pool = None
+_pool_lock = threading.Lock()
+
+def get_pool() -> ConnectionPool:
+    """ returns the connection pool of the current process, creating it on first use """
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ConnectionPool(limiter=get_limiter())
+            atexit.register(_pool.close_all)
+        return _pool
+
+_async_pool = None
+
+def get_async_pool():
+    """
+        - returns the async connection pool of the current process (which runs a single
+        event loop), creating it on first use. An AsyncConnectionPool if aiosmtplib is
+        installed and mails go out over SMTP, a ThreadedConnectionPool otherwise.
+    """
+    global _async_pool
+    if _async_pool is None:
+        if load_aiosmtplib() and issubclass(import_string(settings.EMAIL_BACKEND), SMTPEmailBackend):
+            _async_pool = AsyncConnectionPool(limiter=get_limiter())
+        else:
+            _async_pool = ThreadedConnectionPool(get_pool())
+    return _async_pool
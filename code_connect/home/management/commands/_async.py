@@ -0,0 +1,108 @@
+#_____________________________________________________________________________________________________
+"""
+    - defines the coroutines used by `run_tasks --async`.
+
+    *   task types listed in ASYNC_TASK_TABLE are executed as coroutines on the event
+        loop, so hundreds of them (eg. invite mails waiting on the SMTP server) can be
+        in flight from one process.
+    *   every other task type runs its TASK_TABLE function in a thread, unchanged.
+"""
+
+__author__ = "Tejaswin Singh, "
+__copyright__ = "Copyright 2024, Code Connect Home"
+__credits__ = ["Tejaswin Singh", "", ]
+__license__ = "GPL"
+__version__ = "1.0.0"
+__maintainer__ = "Tejaswin Singh"
+__email__ = "tejaswin.cs08@gmail.com"
+__status__ = "Development"
+
+#______________________________________________imports_________________________________________________
+
+from django.core.management.base import BaseCommand
+from django.core.exceptions import ValidationError
+from asgiref.sync import sync_to_async
+
+from home.models import SendInviteTask, Task
+from home.mail import get_async_pool
+from home.ratelimit import DailyLimitReached
+from home import metrics
+from ._bg_tasks import execute_pooled_tasks, fail_invite_task, set_pool_command
+
+from smtplib import SMTPException
+import asyncio
+
+
+#___________________________________________utilities________________________________________________
+
+async def execute_tasks_async(cmd: BaseCommand, tasks: list) -> None:
+    """
+        - async version of `execute_tasks`, executes a list of claimed tasks.
+
+        *   tasks whose {task_function_id} has an entry in ASYNC_TASK_TABLE run
+            concurrently on the event loop.
+        *   the others are handed over together to a thread, which executes them
+            through TASK_TABLE/BATCH_TASK_TABLE (see `execute_pooled_tasks`).
+        *   a failing task is aborted without affecting the others.
+    """
+    set_pool_command(cmd)
+    coroutines, sync_tasks = [], []
+    for task in tasks:
+        if task.task_function_id in ASYNC_TASK_TABLE:
+            coroutines.append(execute_task_async(cmd, task))
+        else:
+            sync_tasks.append(task)
+    if sync_tasks:
+        coroutines.append(
+            sync_to_async(execute_pooled_tasks, thread_sensitive=False)(sync_tasks)
+        )
+    await asyncio.gather(*coroutines)
+
+async def execute_task_async(cmd: BaseCommand, task: Task) -> None:
+    """
+        - looks up ASYNC_TASK_TABLE and awaits the appropiate coroutine for the passed task
+    """
+    try:
+        with metrics.EXECUTION_SECONDS.time(function_id=task.task_function_id):
+            await ASYNC_TASK_TABLE[task.task_function_id](cmd, task)
+    except Exception as e:
+        await sync_to_async(task.abort_task)()
+        # red-colored output
+        cmd.stderr.write(
+            cmd.style.ERROR(f'Task failed-\t{e}')
+        )
+
+
+#___________________________________________tasks________________________________________________
+
+async def send_invite(cmd: BaseCommand, task: Task) -> None:
+    """ async version of `_bg_tasks.send_invite` """
+
+    # claimed tasks already are SendInviteTask(s) with their invite fetched
+    if isinstance(task, SendInviteTask):
+        invite_task = task
+    else:
+        invite_task = await SendInviteTask.objects.select_related('invite').aget(pk=task.pk)
+    await sync_to_async(invite_task.start_task)()
+
+    try:
+        await invite_task.asend(get_async_pool())
+        cmd.stderr.write(
+            cmd.style.SUCCESS(f'invite sent to {invite_task.invite.mail_address}')
+        )
+        await sync_to_async(invite_task.clear_task)()
+    except (SMTPException, OSError, ValueError, ValidationError, DailyLimitReached) as e:
+        await sync_to_async(fail_invite_task)(cmd, invite_task, e)
+
+
+#___________________________________________task table________________________________________________
+
+#
+#   * same as TASK_TABLE, for task types that have a coroutine version.
+#   * task types missing here still work with `run_tasks --async`, their
+#   * TASK_TABLE function is called from a thread.
+#
+
+ASYNC_TASK_TABLE = {
+    SendInviteTask.TASK_FUNCTION_ID: send_invite,   # 1
+}
@@ -0,0 +1,117 @@
+#_____________________________________________________________________________________________________
+"""
+    - utilities shared by the `manage.py bench_*` commands.
+"""
+
+__author__ = "Tejaswin Singh, "
+__copyright__ = "Copyright 2024, Code Connect Home"
+__credits__ = ["Tejaswin Singh", "", ]
+__license__ = "GPL"
+__version__ = "1.0.0"
+__maintainer__ = "Tejaswin Singh"
+__email__ = "tejaswin.cs08@gmail.com"
+__status__ = "Development"
+
+#______________________________________________imports_________________________________________________
+
+from django.db import connections, DEFAULT_DB_ALIAS
+from django.db.backends.signals import connection_created
+from django.test.utils import setup_test_environment, teardown_test_environment
+
+from contextlib import contextmanager
+from time import perf_counter
+import os
+import shutil
+import tempfile
+import threading
+
+
+#___________________________________________utilities________________________________________________
+
+@contextmanager
+def benchmark_database(verbosity: int = 0, on_disk: bool = False):
+    """
+        - runs the block against a fresh, fully migrated test database (just like the
+        test runner does), so benchmarks never touch real data. Mails go to the
+        locmem backend unless the benchmark overrides EMAIL_BACKEND.
+
+        *   with {on_disk}, an sqlite test database is a temporary file instead of the
+            in-memory one, whose table locks fail right away when several threads
+            write at once (eg. a `run_tasks --concurrency N` worker).
+    """
+    connection = connections[DEFAULT_DB_ALIAS]
+    old_name = connection.settings_dict["NAME"]
+    test_settings = connection.settings_dict["TEST"]
+    old_test_name = test_settings.get("NAME")
+    tmp_dir = None
+    if on_disk and connection.vendor == "sqlite" and not old_test_name:
+        tmp_dir = tempfile.mkdtemp()
+        test_settings["NAME"] = os.path.join(tmp_dir, "benchmark.sqlite3")
+    setup_test_environment()
+    connection.creation.create_test_db(verbosity=verbosity, autoclobber=True, serialize=False)
+    try:
+        yield connection
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity)
+        teardown_test_environment()
+        if tmp_dir:
+            test_settings["NAME"] = old_test_name
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+
+@contextmanager
+def count_queries():
+    """
+        - counts the queries run inside the block on any db connection, including the
+        ones opened by other threads (eg. the pool of a `run_tasks` worker).
+        Yields a QueryCounter, whose {count} is updated as queries run.
+    """
+    counter = QueryCounter()
+
+    def install(sender, connection, **kwargs):
+        connection.execute_wrappers.append(counter)
+
+    for connection in connections.all():
+        connection.execute_wrappers.append(counter)
+    connection_created.connect(install)
+    try:
+        yield counter
+    finally:
+        connection_created.disconnect(install)
+        counter.active = False
+        for connection in connections.all():
+            if counter in connection.execute_wrappers:
+                connection.execute_wrappers.remove(counter)
+
+def timeit(func, repeat: int) -> list:
+    """ calls {func} {repeat} times, returns the duration of each call in seconds """
+    durations = []
+    for _ in range(repeat):
+        start = perf_counter()
+        func()
+        durations.append(perf_counter() - start)
+    return durations
+
+def percentile(values: list, p: float) -> float:
+    """ {p}th percentile (0-100) of {values}, nearest-rank method """
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(0, min(len(ordered) - 1, round(p / 100 * len(ordered)) - 1))
+    return ordered[rank]
+
+
+#___________________________________________classes________________________________________________
+
+class QueryCounter:
+    """ db execute wrapper counting the queries that go through it, see count_queries() """
+
+    def __init__(self):
+        self.count = 0
+        self.active = True  # connections of other threads may still hold on to it
+        self._lock = threading.Lock()
+
+    def __call__(self, execute, sql, params, many, context):
+        if self.active:
+            with self._lock:
+                self.count += 1
+        return execute(sql, params, many, context)
@@ -18,10 +18,17 @@ __status__ = "Development"
 
 from django.core.management.base import BaseCommand
 from django.core.exceptions import ValidationError
+from django.db import close_old_connections, OperationalError
+from django.utils import timezone
 
-from home.models import SendInviteTask, Task
+from home.models import SendInviteTask, ImportInvitesTask, Task
+from members.models import Invitation
+from home.mail import get_pool, is_transient
+from home.ratelimit import DailyLimitReached
+from home import metrics
 
 from smtplib import SMTPException
+from time import perf_counter
 
 
 #___________________________________________utilities________________________________________________
@@ -32,6 +39,76 @@ def execute_task(cmd: BaseCommand, task: Task) -> None:
     """
     TASK_TABLE[task.task_function_id](cmd, task)
 
+def execute_tasks(cmd: BaseCommand, tasks: list) -> None:
+    """
+        - executes a list of claimed tasks.
+
+        *   tasks whose {task_function_id} has an entry in BATCH_TASK_TABLE are handed
+            over together to that function, the rest are executed one by one.
+        *   a failing task is aborted without affecting the others.
+    """
+    groups = {}
+    for task in tasks:
+        groups.setdefault(task.task_function_id, []).append(task)
+
+    for function_id, group in groups.items():
+        if len(group) > 1 and function_id in BATCH_TASK_TABLE:
+            start = perf_counter()
+            try:
+                BATCH_TASK_TABLE[function_id](cmd, group)
+            except Exception as e:
+                # abort whatever the batch left unfinished
+                Task.abort_tasks(group)
+                cmd.stderr.write(
+                    cmd.style.ERROR(f'Batch of {len(group)} tasks failed-\t{e}')
+                )
+            # the tasks of a batch share its duration
+            elapsed = (perf_counter() - start) / len(group)
+            for _ in group:
+                metrics.EXECUTION_SECONDS.observe(elapsed, function_id=function_id)
+            continue
+
+        for task in group:
+            try:
+                with metrics.EXECUTION_SECONDS.time(function_id=function_id):
+                    execute_task(cmd, task)
+            except Exception as e:
+                task.abort_task()
+                # red-colored output
+                cmd.stderr.write(
+                    cmd.style.ERROR(f'Task failed-\t{e}')
+                )
+
+
+# command used for output by tasks running inside a pool (see `_pool.py`)
+_pool_cmd = None
+
+def set_pool_command(cmd: BaseCommand) -> None:
+    """ sets the command whose stdout/stderr is used by pooled tasks """
+    global _pool_cmd
+    _pool_cmd = cmd
+
+def execute_pooled_tasks(tasks: list) -> None:
+    """
+        - executes claimed tasks inside the thread/process pool of `run_tasks`. The tasks
+        are handed over as claimed (pickled, for a process pool), so nothing is refetched.
+
+        *   each pool thread/process uses its own db connection, which is closed
+            (respecting CONN_MAX_AGE) before and after every batch.
+    """
+    cmd = _pool_cmd or BaseCommand()
+    close_old_connections()
+    try:
+        execute_tasks(cmd, tasks)
+    except Exception as e:
+        Task.abort_tasks(tasks)
+        # red-colored output
+        cmd.stderr.write(
+            cmd.style.ERROR(f'Task failed-\t{e}')
+        )
+    finally:
+        close_old_connections()
+
 #___________________________________________tasks________________________________________________
 
 def hello(cmd: BaseCommand, task: Task) -> None:
@@ -48,22 +125,157 @@ def hello(cmd: BaseCommand, task: Task) -> None:
 def send_invite(cmd: BaseCommand, task: Task) -> None:
     """ called by SendInviteTask """
 
-    invite_task = task.sendinvitetask     # extract SendInviteTask from Task
+    # claimed tasks already are SendInviteTask(s) with their invite fetched
+    if isinstance(task, SendInviteTask):
+        invite_task = task
+    else:
+        invite_task = SendInviteTask.objects.select_related('invite').get(pk=task.pk)
     invite_task.start_task()
 
     try:
-        invite_task.send()
+        invite_task.send(pool=get_pool())   # reuse the worker's open SMTP connections
         cmd.stderr.write(
             cmd.style.SUCCESS(f'invite sent to {invite_task.invite.mail_address}')
         )
         invite_task.clear_task()
-    except (SMTPException, ValueError, ValidationError) as e:
-        invite_task.abort_task()
+    except (SMTPException, OSError, ValueError, ValidationError, DailyLimitReached) as e:
+        fail_invite_task(cmd, invite_task, e)
+
+
+def fail_invite_task(cmd: BaseCommand, invite_task: SendInviteTask, e: Exception) -> None:
+    """
+        - retries {invite_task} later if it failed with a transient error, otherwise
+        (or once it ran out of attempts) gives up on it.
+
+        *   if the daily mail budget is spent, the task is put off until the budget
+            is reset, without counting it as an attempt.
+    """
+    if isinstance(e, DailyLimitReached):
+        invite_task.defer_task(e.retry_at)
+        # yellow colored output
+        cmd.stderr.write(
+            cmd.style.WARNING(f'Task deferred- {str(invite_task)} [{e}]')
+        )
+        return
+
+    if is_transient(e):
+        if invite_task.retry_task(e):
+            # yellow colored output
+            cmd.stderr.write(
+                cmd.style.WARNING(f'Task retried- {str(invite_task)} [attempt {invite_task.attempts}/{invite_task.max_attempts}] [{e}]')
+            )
+            return
+        # log the error
+        cmd.stderr.write(
+            cmd.style.ERROR(f'Task dead- {str(invite_task)} [{e}]')
+        )
+        return
+
+    invite_task.abort_task(e)
+    # log the error
+    cmd.stderr.write(
+        cmd.style.ERROR(f'Task aborted- {str(invite_task)} [{e}]')
+    )
+
+
+def import_invites(cmd: BaseCommand, task: Task) -> None:
+    """ called by ImportInvitesTask """
+
+    # claimed tasks already are ImportInvitesTask(s) with their job fetched
+    if isinstance(task, ImportInvitesTask):
+        import_task = task
+    else:
+        import_task = ImportInvitesTask.objects.select_related('job').get(pk=task.pk)
+    import_task.start_task()
+    job = import_task.job
+
+    if job.is_finished():   # eg. the task was requeued after the job was done
+        import_task.clear_task()
+        return
+    try:
+        job.run()
+    except OperationalError as e:
+        # eg. the db was locked or the connection dropped. The job is left as it is
+        # and resumes from its last chunk once the task is retried.
+        if import_task.retry_task(e):
+            # yellow colored output
+            cmd.stderr.write(
+                cmd.style.WARNING(f'Task retried- {str(job)} [attempt {import_task.attempts}/{import_task.max_attempts}] [{e}]')
+            )
+            return
+        job.fail(e)
+        cmd.stderr.write(
+            cmd.style.ERROR(f'Task dead- {str(job)} [{e}]')
+        )
+        return
+    except Exception as e:
+        job.fail(e)
+        import_task.abort_task(e)
         # log the error
         cmd.stderr.write(
-            cmd.style.ERROR(f'Task aborted- {str(invite_task)} [{e}]')
+            cmd.style.ERROR(f'Task aborted- {str(job)} [{e}]')
+        )
+        return
+
+    import_task.clear_task()
+    if job.state == job.DONE:
+        cmd.stderr.write(
+            cmd.style.SUCCESS(f'{job.created} invitations imported')
+        )
+    else:
+        # yellow colored output
+        cmd.stderr.write(
+            cmd.style.WARNING(f'{str(job)}- {job.error_count} mail(s) could not be invited')
+        )
+
+
+#___________________________________________batch tasks________________________________________________
+
+def send_invites(cmd: BaseCommand, tasks: list) -> None:
+    """
+        - batch version of send_invite.
+
+        *   all the invites are rendered first and then sent over one pooled SMTP connection.
+        *   task states and Invitation.sent_at are then updated with a few bulk queries.
+            The tasks of the sent mails are finished first, so that an error past this
+            point (which aborts the unfinished tasks of the batch) can't abort them.
+        *   a mail that can't be built or sent only fails its own task, which is
+            retried or aborted just like in send_invite.
+    """
+    # claimed tasks already are SendInviteTask(s) with their invite fetched
+    invite_tasks = [task for task in tasks if isinstance(task, SendInviteTask)]
+    if len(invite_tasks) < len(tasks):
+        invite_tasks = Task.fetch_concrete(
+            [(task.pk, task.task_function_id) for task in tasks]
+        )
+
+    ready, messages, failed = [], [], []
+    for invite_task in invite_tasks:
+        try:
+            messages.append(invite_task.build_message())
+            ready.append(invite_task)
+        except ValueError as e:
+            failed.append((invite_task, e))
+
+    errors = get_pool().send_many(messages)
+    sent = []
+    for invite_task, error in zip(ready, errors):
+        if error is None:
+            sent.append(invite_task)
+        else:
+            failed.append((invite_task, error))
+
+    # the mails are out, nothing may abort their tasks now
+    Task.clear_tasks(sent)
+    Invitation.objects.filter(pk__in=[t.invite_id for t in sent]).update(sent_at=timezone.now())
+
+    for invite_task in sent:
+        cmd.stderr.write(
+            cmd.style.SUCCESS(f'invite sent to {invite_task.invite.mail_address}')
         )
-    
+    # failures are rare, they are updated one by one
+    for invite_task, e in failed:
+        fail_invite_task(cmd, invite_task, e)
 
 
 #___________________________________________task table________________________________________________
@@ -78,4 +290,14 @@ def send_invite(cmd: BaseCommand, task: Task) -> None:
 TASK_TABLE = {
     0: hello,
     SendInviteTask.TASK_FUNCTION_ID: send_invite,   # 1
-}
\ No newline at end of file
+    ImportInvitesTask.TASK_FUNCTION_ID: import_invites,     # 2
+}
+
+#
+#   * same as TASK_TABLE, for task types that can be executed in batches.
+#   * The mapped function receives a list of claimed tasks of that type.
+#
+
+BATCH_TASK_TABLE = {
+    SendInviteTask.TASK_FUNCTION_ID: send_invites,  # 1
+}
@@ -0,0 +1,66 @@
+#_____________________________________________________________________________________________________
+"""
+    - entry points for the thread/process pool used by `manage.py run_tasks --concurrency N`.
+
+    NOTE: this module must not import any models at module level. With the `spawn` start
+    method, pool processes import it before Django is set up.
+"""
+
+__author__ = "Tejaswin Singh, "
+__copyright__ = "Copyright 2024, Code Connect Home"
+__credits__ = ["Tejaswin Singh", "", ]
+__license__ = "GPL"
+__version__ = "1.0.0"
+__maintainer__ = "Tejaswin Singh"
+__email__ = "tejaswin.cs08@gmail.com"
+__status__ = "Development"
+
+#______________________________________________imports_________________________________________________
+
+import os
+import signal
+import django
+
+# set in pool processes, whose metrics are sent back to the parent
+_in_process = False
+
+
+#___________________________________________pool entry points________________________________________________
+
+def init_process(settings_module: str) -> None:
+    """
+        - initializer of each pool process. Sets up Django if it isn't already.
+
+        *   Ctrl-C (and a SIGTERM sent to the whole group, eg. by systemd) reaches
+            every process, but stopping is up to the parent (see `run_tasks`), so pool
+            processes ignore them.
+    """
+    global _in_process
+    _in_process = True
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_IGN)
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", settings_module)
+    django.setup()
+
+    # a forked process starts with a copy of the parent's metrics, which must not
+    # be sent back to it along with the ones recorded here
+    from home import metrics
+    metrics.REGISTRY.take()
+
+def init_thread(cmd) -> None:
+    """ initializer of each pool thread. Pooled tasks write to the output of {cmd}. """
+    from ._bg_tasks import set_pool_command
+    set_pool_command(cmd)
+
+def run_tasks(tasks: list) -> dict | None:
+    """
+        - executes the claimed {tasks}.
+
+        *   in a pool process, returns the metrics recorded meanwhile, for the
+            parent to merge (see `home.metrics`). Pool threads record them directly.
+    """
+    from ._bg_tasks import execute_pooled_tasks
+    execute_pooled_tasks(tasks)
+    if _in_process:
+        from home import metrics
+        return metrics.REGISTRY.take()
@@ -0,0 +1,113 @@
+#_____________________________________________________________________________________________________
+"""
+    - local SMTP server accepting (and dropping) every mail, used by `manage.py bench_invites`
+    to measure the workers without sending anything to a real provider.
+
+    Only the part of the protocol that smtplib (and so django's smtp backend) uses without
+    TLS and AUTH is implemented.
+"""
+
+__author__ = "Tejaswin Singh, "
+__copyright__ = "Copyright 2024, Code Connect Home"
+__credits__ = ["Tejaswin Singh", "", ]
+__license__ = "GPL"
+__version__ = "1.0.0"
+__maintainer__ = "Tejaswin Singh"
+__email__ = "tejaswin.cs08@gmail.com"
+__status__ = "Development"
+
+#______________________________________________imports_________________________________________________
+
+from time import sleep
+import random
+import socketserver
+import threading
+
+
+#___________________________________________server________________________________________________
+
+class SMTPHandler(socketserver.StreamRequestHandler):
+    """ one SMTP session, the mails it receives are counted by the server and dropped """
+
+    def handle(self):
+        self.reply(220, "localhost SMTP sink ready")
+        while line := self.rfile.readline():
+            command, _, _ = line.decode("ascii", "replace").strip().partition(" ")
+            command = command.upper()
+            if command == "EHLO":
+                self.wfile.write(b"250-localhost\r\n250 8BITMIME\r\n")
+            elif command in ("HELO", "MAIL", "RCPT", "RSET", "NOOP"):
+                self.reply(250, "OK")
+            elif command == "DATA":
+                self.reply(354, "End data with <CR><LF>.<CR><LF>")
+                if not self.read_data():
+                    return
+                if self.server.accept():
+                    self.reply(250, "OK: queued")
+                else:
+                    self.reply(self.server.fail_code, "Rejected by the sink")
+            elif command == "QUIT":
+                self.reply(221, "Bye")
+                return
+            else:
+                self.reply(502, "Command not implemented")
+
+    def read_data(self) -> bool:
+        """ reads the mail up to its terminating dot, False if the client hung up """
+        while line := self.rfile.readline():
+            if line in (b".\r\n", b".\n"):
+                return True
+        return False
+
+    def reply(self, code: int, text: str):
+        self.wfile.write(f"{code} {text}\r\n".encode())
+
+
+class SMTPSink(socketserver.ThreadingTCPServer):
+    """
+        - SMTP server listening on {host}:{port} (a free port by default, see {port})
+        from a daemon thread, one thread per connection.
+
+        *   every mail waits {latency} seconds before being answered, like a remote
+            server would take to accept it.
+        *   a {fail_rate} fraction of the mails (0 to 1) is rejected with {fail_code},
+            a 5xx code fails the invite for good, a 4xx one gets it retried.
+        *   {received} and {rejected} count the mails so far.
+    """
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, latency: float = 0.0,
+                 fail_rate: float = 0.0, fail_code: int = 554, seed: int = None):
+        super().__init__((host, port), SMTPHandler)
+        self.latency = latency
+        self.fail_rate = fail_rate
+        self.fail_code = fail_code
+        self.received = 0
+        self.rejected = 0
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def __enter__(self):
+        threading.Thread(target=self.serve_forever, name="smtp-sink", daemon=True).start()
+        return self
+
+    def __exit__(self, *args):
+        self.shutdown()
+        self.server_close()
+
+    @property
+    def port(self) -> int:
+        return self.server_address[1]
+
+    def accept(self) -> bool:
+        """ called once a mail is received, returns False if it is to be rejected """
+        if self.latency:
+            sleep(self.latency)
+        with self._lock:
+            self.received += 1
+            if self.fail_rate and self._random.random() < self.fail_rate:
+                self.rejected += 1
+                return False
+            return True
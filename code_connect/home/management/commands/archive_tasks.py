@@ -0,0 +1,69 @@
+#_____________________________________________________________________________________________________
+"""
+    - defines the `manage.py archive_tasks` command
+"""
+
+__author__ = "Tejaswin Singh, "
+__copyright__ = "Copyright 2024, Code Connect Home"
+__credits__ = ["Tejaswin Singh", "", ]
+__license__ = "GPL"
+__version__ = "1.0.0"
+__maintainer__ = "Tejaswin Singh"
+__email__ = "tejaswin.cs08@gmail.com"
+__status__ = "Development"
+
+#______________________________________________imports_________________________________________________
+
+from django.core.management.base import BaseCommand, CommandError
+from django.conf import settings
+
+from home.models import Task
+
+from datetime import timedelta
+import gzip
+
+
+#___________________________________________commands________________________________________________
+
+class Command(BaseCommand):
+    """
+        archive_tasks command. Moves old FINISHED and ABORTED tasks out of the live
+        Task table, which keeps the queue and the admin changelist fast.
+
+        *   by default tasks are copied to the ArchivedTask table.
+        *   with --output, they are appended to a gzip compressed JSON lines file instead.
+    """
+
+    help = "archives completed tasks older than the retention period"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--older-than", type=int, default=settings.TASK_ARCHIVE_AFTER_DAYS,
+            help="archive tasks that completed more than this many days ago"
+        )
+        parser.add_argument(
+            "--chunk-size", type=int, default=1000,
+            help="number of tasks archived per transaction"
+        )
+        parser.add_argument(
+            "--output", default=None,
+            help="path of a .jsonl.gz file to append the tasks to, instead of the ArchivedTask table"
+        )
+
+    def handle(self, *args, **options):
+        if options["older_than"] < 0:
+            raise CommandError("--older-than can't be negative.")
+        if options["chunk_size"] < 1:
+            raise CommandError("--chunk-size must be at least 1.")
+
+        older_than = timedelta(days=options["older_than"])
+        if output := options["output"]:
+            # gzip members can be concatenated, so appending keeps the file valid
+            with gzip.open(output, "at", encoding="utf-8") as stream:
+                archived = Task.archive_completed(older_than, options["chunk_size"], stream=stream)
+        else:
+            archived = Task.archive_completed(older_than, options["chunk_size"])
+
+        self.stderr.write(
+            self.style.SUCCESS(f'Archived {archived} task(s) to {output or "the ArchivedTask table"}')
+        )
@@ -0,0 +1,80 @@
+#_____________________________________________________________________________________________________
+"""
+    - defines the `manage.py bench_invite_render` command
+"""
+
+__author__ = "Tejaswin Singh, "
+__copyright__ = "Copyright 2024, Code Connect Home"
+__credits__ = ["Tejaswin Singh", "", ]
+__license__ = "GPL"
+__version__ = "1.0.0"
+__maintainer__ = "Tejaswin Singh"
+__email__ = "tejaswin.cs08@gmail.com"
+__status__ = "Development"
+
+#______________________________________________imports_________________________________________________
+
+from django.core.management.base import BaseCommand
+from django.template.loader import render_to_string
+from django.utils.html import strip_tags
+
+from home.models import SendInviteTask
+
+from ._bench import timeit, percentile
+
+from itertools import count
+
+
+#___________________________________________commands________________________________________________
+
+class Command(BaseCommand):
+    """
+        bench_invite_render command. Measures the time taken to render the html and
+        text parts of one invitation mail:
+
+        *   before: render_to_string() of the html template, stripped of its tags for
+            the text part (what SendInviteTask.build_message() used to do).
+        *   after: the prerendered templates of SendInviteTask.
+
+        No database or mail server is needed, only the rendering is timed.
+    """
+
+    help = "benchmarks the rendering of the invitation mail"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--repeat", type=int, default=2000,
+            help="mails rendered by each method"
+        )
+
+    def handle(self, *args, **options):
+        home_link, contact = SendInviteTask.HOME_LINK, SendInviteTask.CONTACT
+        numbers = count()
+
+        def values():
+            n = next(numbers)
+            return f"{home_link}/members/registration/?i=CC{n:06d}", f"user{n}@example.com"
+
+        def before():
+            link, email = values()
+            html = render_to_string('home/invitation_mail.html', context={
+                'link': link, 'home_link': home_link, 'email': email, 'contact': contact,
+            })
+            strip_tags(html)
+
+        def after():
+            link, email = values()
+            SendInviteTask.HTML_TEMPLATE.render(link=link, email=email)
+            SendInviteTask.TEXT_TEMPLATE.render(link=link, email=email)
+
+        # first call loads the templates (and prerenders them), not counted
+        before()
+        after()
+
+        self.stdout.write(f"{'method':>8} {'p50 (us)':>10} {'p99 (us)':>10} {'mails/s':>10}")
+        for name, func in (("before", before), ("after", after)):
+            durations = timeit(func, options["repeat"])
+            self.stdout.write(
+                f"{name:>8} {percentile(durations, 50) * 1e6:>10.1f} {percentile(durations, 99) * 1e6:>10.1f}"
+                f" {len(durations) / sum(durations):>10.0f}"
+            )
@@ -0,0 +1,149 @@
+#_____________________________________________________________________________________________________
+"""
+    - defines the `manage.py bench_invites` command
+"""
+
+__author__ = "Tejaswin Singh, "
+__copyright__ = "Copyright 2024, Code Connect Home"
+__credits__ = ["Tejaswin Singh", "", ]
+__license__ = "GPL"
+__version__ = "1.0.0"
+__maintainer__ = "Tejaswin Singh"
+__email__ = "tejaswin.cs08@gmail.com"
+__status__ = "Development"
+
+#______________________________________________imports_________________________________________________
+
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.test.utils import override_settings
+
+from home.models import Task, SendInviteTask
+from members.forms import InviteForm
+
+from ._bench import benchmark_database, count_queries, percentile
+from ._smtp_sink import SMTPSink
+
+from datetime import timedelta
+from io import StringIO
+from time import perf_counter
+from unittest import mock
+
+
+#___________________________________________commands________________________________________________
+
+class Command(BaseCommand):
+    """
+        bench_invites command. Measures the delivery of invite mails end to end:
+
+        *   a local SMTP sink (see `_smtp_sink.py`) stands in for the mail provider,
+            with an optional latency and share of rejected mails.
+        *   --invites mails are invited through InviteForm, like from the invite page
+            (more than InviteForm.JOB_INVITES go through an InviteImportJob).
+        *   a `run_tasks --exit-when-empty` worker then runs in this process until the
+            queue is drained, with the worker options given here.
+        *   reports invites/sec, the p50/p99 latency from Task.arrival to Task.exit of
+            the mails, and the queries made while inviting and while delivering.
+
+        Runs against a throwaway test database, the mail rate limiter is disabled.
+    """
+
+    help = "benchmarks the delivery of invite mails against a local SMTP server"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--invites", type=int, default=500,
+            help="number of mails invited"
+        )
+        parser.add_argument(
+            "--latency", type=float, default=0.0,
+            help="seconds the SMTP sink takes to accept a mail"
+        )
+        parser.add_argument(
+            "--fail-rate", type=float, default=0.0,
+            help="share of the mails (0 to 1) rejected by the SMTP sink"
+        )
+        parser.add_argument(
+            "--fail-code", type=int, default=554,
+            help="SMTP code of the rejected mails, 4xx ones get retried"
+        )
+        parser.add_argument(
+            "--retry-delay", type=float, default=0.0,
+            help="seconds before a retried mail is sent again (Task.RETRY_BASE_DELAY)"
+        )
+        # passed on to `run_tasks`
+        parser.add_argument(
+            "--concurrency", type=int, default=1,
+            help="number of invites (or batches) the worker sends at the same time"
+        )
+        parser.add_argument(
+            "--batch-size", type=int, default=1,
+            help="number of invites the worker claims and sends over one connection at once"
+        )
+        parser.add_argument(
+            "--async", action="store_true", dest="use_async",
+            help="run the worker on an asyncio event loop (needs aiosmtplib)"
+        )
+
+    def handle(self, *args, **options):
+        invites = options["invites"]
+        if invites < 1:
+            raise CommandError("--invites must be at least 1.")
+        if not 0 <= options["fail_rate"] <= 1:
+            raise CommandError("--fail-rate must be between 0 and 1.")
+
+        worker_args = [
+            "--exit-when-empty",
+            "--concurrency", str(options["concurrency"]),
+            "--batch-size", str(options["batch_size"]),
+        ]
+        if options["use_async"]:
+            worker_args.append("--async")
+
+        sink = SMTPSink(latency=options["latency"], fail_rate=options["fail_rate"], fail_code=options["fail_code"])
+        with benchmark_database(on_disk=True), sink, override_settings(
+            EMAIL_BACKEND='django.core.mail.backends.smtp.EmailBackend',
+            EMAIL_HOST=sink.server_address[0],
+            EMAIL_PORT=sink.port,
+            EMAIL_USE_TLS=False,
+            EMAIL_USE_SSL=False,
+            EMAIL_HOST_PASSWORD='',     # no AUTH
+            EMAIL_RATE_LIMIT=None,
+        ), mock.patch.object(Task, "RETRY_BASE_DELAY", timedelta(seconds=options["retry_delay"])):
+            # invite
+            mails = ",".join(f"user{n}@bench.dev" for n in range(invites))
+            with count_queries() as invite_queries:
+                start = perf_counter()
+                form = InviteForm(data={'mail_list': mails})
+                if not form.is_valid():
+                    raise CommandError(f"Inviting failed: {form.errors.as_text()}")
+                invite_seconds = perf_counter() - start
+
+            # deliver
+            with count_queries() as deliver_queries:
+                start = perf_counter()
+                # the worker's output is only shown with -v 2
+                call_command("run_tasks", *worker_args, stderr=self.stderr if options["verbosity"] > 1 else StringIO())
+                deliver_seconds = perf_counter() - start
+
+            tasks = SendInviteTask.objects.filter(exit__isnull=False).values_list('state', 'arrival', 'exit')
+            latencies = [(exit - arrival).total_seconds() for _, arrival, exit in tasks]
+            states = [state for state, _, _ in tasks]
+
+        sent = states.count(Task.FINISHED)
+        self.stdout.write(f"invites: {invites} (via {'an import job' if form.job else 'the form'})")
+        self.stdout.write(
+            f"inviting: {invite_seconds:.2f}s, {invite_queries.count} queries"
+        )
+        self.stdout.write(
+            f"delivering: {deliver_seconds:.2f}s, {deliver_queries.count} queries"
+            f" ({deliver_queries.count / invites:.1f} per invite)"
+        )
+        self.stdout.write(
+            f"mails: {sent} sent, {states.count(Task.ABORTED)} aborted, {states.count(Task.DEAD)} dead"
+            f" ({sink.received} received by the sink, {sink.rejected} rejected)"
+        )
+        self.stdout.write(f"throughput: {sent / deliver_seconds:.1f} invites/s")
+        self.stdout.write(
+            f"latency (arrival to exit): p50 {percentile(latencies, 50):.3f}s, p99 {percentile(latencies, 99):.3f}s"
+        )
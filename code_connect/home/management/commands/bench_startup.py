@@ -0,0 +1,127 @@
+#_____________________________________________________________________________________________________
+"""
+    - defines the `manage.py bench_startup` command
+"""
+
+__author__ = "Tejaswin Singh, "
+__copyright__ = "Copyright 2024, Code Connect Home"
+__credits__ = ["Tejaswin Singh", "", ]
+__license__ = "GPL"
+__version__ = "1.0.0"
+__maintainer__ = "Tejaswin Singh"
+__email__ = "tejaswin.cs08@gmail.com"
+__status__ = "Development"
+
+#______________________________________________imports_________________________________________________
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from ._bench import percentile
+
+from time import perf_counter
+import re
+import subprocess
+import sys
+
+
+#___________________________________________commands________________________________________________
+
+class Command(BaseCommand):
+    """
+        bench_startup command. Measures the cold start of the project:
+
+        *   check: `manage.py check`, the boot of every management command.
+        *   wsgi: importing the WSGI app and loading the urlconf, as done by the first request.
+
+        Each target runs --repeat times in a fresh interpreter with `python -X importtime`.
+        Reports the median wall time, the time spent importing modules, and the packages
+        that took the longest to import (eg. a heavy dependency pulled in at startup).
+        With --budget MS, fails if a median wall time goes over it.
+    """
+
+    help = "benchmarks the startup time of management commands and of the WSGI app"
+
+    TARGETS = {
+        'check': ["manage.py", "check"],
+        'wsgi': [
+            "-c",
+            "from code_connect.wsgi import application; "
+            "from django.urls import get_resolver; get_resolver().url_patterns",
+        ],
+    }
+
+    # a line of `-X importtime`: "import time: self [us] | cumulative | indented module name"
+    IMPORT_TIME_RE = re.compile(r'^import time:\s+(\d+)\s+\|\s+\d+\s+\|\s+(\S+)$')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--repeat", type=int, default=5,
+            help="times each target is started"
+        )
+        parser.add_argument(
+            "--top", type=int, default=10,
+            help="number of slowest packages shown for each target"
+        )
+        parser.add_argument(
+            "--budget", type=float, default=None,
+            help="fail if the median wall time of a target goes over this many ms"
+        )
+        parser.add_argument(
+            "targets", nargs="*",
+            help=f"targets to measure ({', '.join(self.TARGETS)}), all of them by default"
+        )
+
+    def handle(self, *args, **options):
+        if options["repeat"] < 1:
+            raise CommandError("--repeat must be at least 1.")
+        if unknown := set(options["targets"]) - set(self.TARGETS):
+            raise CommandError(f"Unknown targets: {', '.join(sorted(unknown))}")
+
+        over_budget = []
+        for target in options["targets"] or self.TARGETS:
+            walls, imports = [], []
+            for _ in range(options["repeat"]):
+                wall, packages = self.run(self.TARGETS[target])
+                walls.append(wall)
+                imports.append(packages)
+            wall = percentile(walls, 50)
+            # imports of the median run
+            packages = imports[walls.index(wall)]
+
+            self.stdout.write(
+                f"{target}: {wall * 1000:.0f} ms wall (median of {len(walls)}), "
+                f"{sum(packages.values()) / 1000:.0f} ms importing"
+            )
+            slowest = sorted(packages.items(), key=lambda item: item[1], reverse=True)[:options["top"]]
+            for name, duration in slowest:
+                self.stdout.write(f"{duration / 1000:>10.1f} ms  {name}")
+
+            if options["budget"] is not None and wall * 1000 > options["budget"]:
+                over_budget.append(target)
+
+        if over_budget:
+            raise CommandError(
+                f"Over the budget of {options['budget']:g} ms: {', '.join(over_budget)}"
+            )
+
+    def run(self, args: list) -> tuple:
+        """
+            - starts a fresh interpreter with {args}, returns its wall time in seconds and
+            the time (us) spent importing the modules of each package, by top-level package.
+        """
+        start = perf_counter()
+        result = subprocess.run(
+            [sys.executable, "-X", "importtime", *args],
+            cwd=settings.BASE_DIR, capture_output=True, text=True,
+        )
+        wall = perf_counter() - start
+        if result.returncode:
+            raise CommandError(f"`{' '.join(args)}` failed:\n{result.stderr[-2000:]}")
+
+        packages = {}
+        for line in result.stderr.splitlines():
+            if match := self.IMPORT_TIME_RE.match(line):
+                package = match[2].split(".")[0]
+                packages[package] = packages.get(package, 0) + int(match[1])
+        return wall, packages
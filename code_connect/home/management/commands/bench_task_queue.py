@@ -0,0 +1,92 @@
+#_____________________________________________________________________________________________________
+"""
+    - defines the `manage.py bench_task_queue` command
+"""
+
+__author__ = "Tejaswin Singh, "
+__copyright__ = "Copyright 2024, Code Connect Home"
+__credits__ = ["Tejaswin Singh", "", ]
+__license__ = "GPL"
+__version__ = "1.0.0"
+__maintainer__ = "Tejaswin Singh"
+__email__ = "tejaswin.cs08@gmail.com"
+__status__ = "Development"
+
+#______________________________________________imports_________________________________________________
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from home.models import Task
+
+from ._bench import benchmark_database, timeit, percentile
+
+
+#___________________________________________commands________________________________________________
+
+class Command(BaseCommand):
+    """
+        bench_task_queue command. Measures the latency of the query used by `run_tasks`
+        to poll the queue, while the table fills up with FINISHED tasks.
+
+        *   runs against a throwaway test database.
+        *   with --drop-indexes the queue indexes are removed first, to compare against
+            a full table scan.
+    """
+
+    help = "benchmarks the task queue poll query against a growing Task table"
+
+    QUEUED_TASKS = 100  # tasks waiting in the queue at every step
+    CHUNK = 10_000      # rows inserted per bulk_create
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--rows", default="1000,10000,100000,1000000",
+            help="comma separated sizes (FINISHED rows) at which the poll query is measured"
+        )
+        parser.add_argument(
+            "--repeat", type=int, default=200,
+            help="times the poll query is run at every step"
+        )
+        parser.add_argument(
+            "--drop-indexes", action="store_true",
+            help="drop the queue indexes before measuring"
+        )
+
+    def handle(self, *args, **options):
+        try:
+            steps = sorted(int(rows) for rows in options["rows"].split(","))
+        except ValueError:
+            raise CommandError("--rows must be a comma separated list of integers.")
+
+        with benchmark_database() as connection:
+            if options["drop_indexes"]:
+                with connection.schema_editor() as schema_editor:
+                    for index in Task._meta.indexes:
+                        schema_editor.remove_index(Task, index)
+
+            Task.objects.bulk_create(
+                Task(name=f"queued {i}") for i in range(self.QUEUED_TASKS)
+            )
+            # the query of Task.claim_tasks()
+            poll = Task.objects.filter(
+                state=Task.QUEUED, run_at__lte=timezone.now(),
+            ).order_by('priority', 'run_at', 'arrival').values_list('pk', flat=True)[:1]
+
+            self.stdout.write(f"{'finished rows':>14} {'p50 (ms)':>10} {'p99 (ms)':>10}")
+            finished = 0
+            for step in steps:
+                while finished < step:
+                    size = min(self.CHUNK, step - finished)
+                    Task.objects.bulk_create(
+                        Task(name="done", state=Task.FINISHED) for _ in range(size)
+                    )
+                    finished += size
+
+                # .all() clones the queryset, so every run hits the db
+                durations = timeit(lambda: list(poll.all()), options["repeat"])
+                self.stdout.write(
+                    f"{finished:>14} {percentile(durations, 50) * 1000:>10.3f} {percentile(durations, 99) * 1000:>10.3f}"
+                )
+
+            self.stdout.write(f"\nquery plan:\n{poll.explain()}")
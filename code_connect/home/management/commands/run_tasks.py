@@ -1,5 +1,5 @@
 #_____________________________________________________________________________________________________
-""" 
+"""
     - defines the `manage.py run_tasks` command
 """
 
@@ -15,51 +15,533 @@ __status__ = "Development"
 #______________________________________________imports_________________________________________________
 
 from django.core.management.base import BaseCommand, CommandError
+from django.conf import settings
+from django.db import connection, connections
+from asgiref.sync import sync_to_async
+
+from home.models import Task, WorkerHeartbeat
+from home.mail import load_aiosmtplib
+from home.wakeup import open_channel, Backoff
+from home.scheduling import FairShare
+from home import metrics
+
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, wait, FIRST_COMPLETED
+import asyncio
+from time import monotonic
+from datetime import timedelta
+from uuid import uuid4
+import sys, os, socket, signal, threading
+from ._bg_tasks import execute_tasks
+from ._async import execute_tasks_async
+from . import _pool
 
-from home.models import Task
 
-from time import sleep
-import sys, os
-from ._bg_tasks import execute_task
+#___________________________________________exceptions________________________________________________
 
+class WorkerStopped(BaseException):
+    """
+        - raised in the main thread of a serial worker to abandon the task it is
+        executing, once the drain deadline has passed. A BaseException, so that the
+        error handling of the tasks doesn't catch it.
+    """
 
 
 #___________________________________________commands________________________________________________
 
 class Command(BaseCommand):
-    """ run_tasks command. Used for running background tasks. """
+    """
+        run_tasks command. Used for running background tasks.
+
+        *   several workers can run side by side. Each one claims a task with a lease
+            before executing it, so no task is executed twice.
+        *   every worker records a heartbeat (see WorkerHeartbeat) from a background
+            thread, which also renews the leases of the tasks it is executing. Tasks
+            of a worker whose heartbeat stopped are requeued by the other workers,
+            as are tasks whose lease expired.
+        *   on SIGTERM or SIGINT (Ctrl-C) the worker stops claiming, and waits up to
+            --drain-timeout seconds for its in-flight tasks. Tasks still unfinished
+            are then released back to the queue before the worker exits. A second
+            signal stops waiting right away.
+        *   with --concurrency N, claimed tasks are dispatched to a thread or process pool.
+            At most N tasks (or batches) are claimed at any time; the worker stops claiming
+            while the pool is busy.
+        *   with --batch-size K, up to K tasks are claimed at once. Task types listed in
+            BATCH_TASK_TABLE (eg. invite mails) are then executed together.
+        *   with --async, the worker runs an asyncio event loop instead, with up to
+            --concurrency batches in flight. Invite mails are sent without blocking
+            (see `_async.py`), other task types run in threads.
+        *   tasks are claimed from the priority lanes in turn (see `home.scheduling`),
+            so bulk tasks can't hold up interactive ones and vice versa.
+        *   an idle worker blocks on a wakeup channel (see `home.wakeup`) and starts as soon
+            as a new task is queued. The queue is also polled, with an interval growing from
+            TASK_POLL_MIN_INTERVAL to TASK_POLL_MAX_INTERVAL while it stays empty.
+        *   with --archive-after DAYS, the worker also archives old completed tasks
+            once an hour (see `manage.py archive_tasks`).
+        *   metrics of the worker (see `home.metrics`) are served over HTTP with
+            --metrics-port PORT, and written to TASK_METRICS_DIR on every heartbeat
+            if it is set (see `manage.py task_stats`).
+        *   with --exit-when-empty, the worker stops on its own once no task is left
+            queued or processing, eg. for benchmarks (see `manage.py bench_invites`).
+    """
 
     help = "starts executing any queued tasks"
 
+    ARCHIVE_INTERVAL = 60 * 60  # seconds between two archive runs
+    SATURATED_WAIT = 1  # seconds between two stop checks while the pool is busy
+
+    EXECUTORS = {
+        'thread': ThreadPoolExecutor,
+        'process': ProcessPoolExecutor,
+    }
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--lease", type=int, default=int(Task.DEFAULT_LEASE.total_seconds()),
+            help="seconds a claimed task stays reserved for this worker"
+        )
+        parser.add_argument(
+            "--concurrency", type=int, default=1,
+            help="number of tasks executed at the same time"
+        )
+        parser.add_argument(
+            "--batch-size", type=int, default=1,
+            help="number of tasks claimed at once"
+        )
+        parser.add_argument(
+            "--archive-after", type=int, default=None,
+            help="periodically archive tasks that completed more than this many days ago"
+        )
+        parser.add_argument(
+            "--executor", choices=self.EXECUTORS, default=None,
+            help="pool used for executing tasks. Defaults to 'thread' when --concurrency > 1"
+        )
+        parser.add_argument(
+            "--async", action="store_true", dest="use_async",
+            help="execute tasks on an asyncio event loop"
+        )
+        parser.add_argument(
+            "--drain-timeout", type=float, default=settings.TASK_DRAIN_TIMEOUT,
+            help="seconds to wait for in-flight tasks when stopping"
+        )
+        parser.add_argument(
+            "--metrics-port", type=int, default=None,
+            help="serve the metrics of this worker at http://HOST:PORT/metrics"
+        )
+        parser.add_argument(
+            "--exit-when-empty", action="store_true",
+            help="stop once no task is left queued or processing"
+        )
+
     def handle(self, *args, **options):
 
+        self.lease = timedelta(seconds=options["lease"])
+        if self.lease <= timedelta(0):
+            raise CommandError("--lease must be a positive number of seconds.")
+        concurrency = options["concurrency"]
+        if concurrency < 1:
+            raise CommandError("--concurrency must be at least 1.")
+        self.batch_size = options["batch_size"]
+        if self.batch_size < 1:
+            raise CommandError("--batch-size must be at least 1.")
+        self.drain_timeout = options["drain_timeout"]
+        if self.drain_timeout < 0:
+            raise CommandError("--drain-timeout can't be negative.")
+
+        # unique id of this worker, stored on every task it claims
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid4().hex[:8]}"
+        # how often expired leases of other (dead) workers are reclaimed
+        self.reclaim_interval = min(self.lease.total_seconds(), 60)
+        self.next_reclaim = monotonic()
+        self.archive_after = options["archive_after"]
+        if self.archive_after is not None and self.archive_after < 0:
+            raise CommandError("--archive-after can't be negative.")
+        self.next_archive = monotonic()
+
+        executor = options["executor"]
+        if options["use_async"] and executor:
+            raise CommandError("--async can't be used along with --executor.")
+        self.serial = not options["use_async"] and executor is None and concurrency == 1
+        self.exit_when_empty = options["exit_when_empty"]
+
+        # set by stop() once a SIGTERM/SIGINT is received
+        self.stopping = False
+        self.deadline = None
+        self.finished = False
+
+        self.lanes = FairShare(Task.PRIORITY_WEIGHTS)
+        self.channel = open_channel(self.owner)
+        self.backoff = Backoff(
+            settings.TASK_POLL_MIN_INTERVAL,
+            settings.TASK_POLL_MAX_INTERVAL if self.channel.notified else settings.TASK_POLL_FALLBACK_MAX_INTERVAL,
+        )
+
         self.stderr.write(
-            self.style.SUCCESS('Started executing tasks.....')
+            self.style.SUCCESS(f'Started executing tasks as {self.owner}.....')
         )
 
-        while True:
+        metrics.QUEUE_DEPTH.collect = Task.queue_depth
+        self.metrics_file = settings.TASK_METRICS_DIR and metrics.metrics_file(self.owner, settings.TASK_METRICS_DIR)
+        self.metrics_server = None
+        if options["metrics_port"] is not None:
             try:
-                # fetch a queued task from db
-                task = Task.objects.order_by('arrival').filter(state=Task.QUEUED).first()
-                if task:
-                    # call `execute_task` function which looks up TASK_TABLE and 
-                    # calls the appropiate function for the passed task
-                    execute_task(self, task)
-                else:
+                self.metrics_server = metrics.serve(options["metrics_port"])
+            except OSError as e:
+                self.channel.close()
+                raise CommandError(f"Can't serve metrics on port {options['metrics_port']}: {e}")
+            self.stderr.write(
+                self.style.SUCCESS(f'Serving metrics on port {self.metrics_server.server_port}')
+            )
+
+        self.start_heartbeat()
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGINT, self.stop)
+        try:
+            if options["use_async"]:
+                self.run_async(concurrency)
+            elif self.serial:
+                self.run_serial()
+            else:
+                self.run_pooled(executor or 'thread', concurrency)
+        except WorkerStopped:
+            pass
+        finally:
+            self.finish()
+
+    #___________________________________________loops________________________________________________
+
+    def run_serial(self):
+        """ claims and executes one task (or batch) at a time in this process """
+
+        while not self.stopping:
+            tasks = []
+            try:
+                self.reclaim_expired()
+                self.archive_completed()
+                # claim queued tasks from db
+                tasks = self.claim()
+                if tasks:
+                    self.backoff.reset()
+                    # call `execute_tasks` function which looks up TASK_TABLE and
+                    # calls the appropiate function for the passed tasks
+                    execute_tasks(self, tasks)
+                elif not self.stop_if_empty():
                     # don't hammer the db continously
-                    sleep(1)
+                    self.idle_wait()
             except Exception as e:
-                if task:
-                    task.abort_task()
+                if tasks:
+                    Task.abort_tasks(tasks)
                 # red-colored output
                 self.stderr.write(
                     self.style.ERROR(f'Task failed-\t{e}')
                 )
-            except KeyboardInterrupt:
+
+    def run_pooled(self, executor, concurrency):
+        """
+            - claims tasks and dispatches them to a pool of {concurrency} threads/processes.
+
+            *   claimed tasks are sent to the pool as they are, nothing is refetched there.
+            *   backpressure: nothing is claimed while {concurrency} batches are in flight.
+        """
+        if executor == 'process':
+            # forked processes must not share the parent's db connections
+            connections.close_all()
+            pool = ProcessPoolExecutor(
+                max_workers=concurrency,
+                initializer=_pool.init_process,
+                initargs=(os.environ["DJANGO_SETTINGS_MODULE"],),
+            )
+        else:
+            pool = ThreadPoolExecutor(
+                max_workers=concurrency,
+                initializer=_pool.init_thread,
+                initargs=(self,),
+            )
+
+        self.stderr.write(
+            self.style.SUCCESS(f'Dispatching to a {executor} pool of {concurrency}')
+        )
+
+        in_flight = set()
+        while not self.stopping:
+            try:
+                if len(in_flight) >= concurrency:
+                    # pool is saturated, wait for a slot instead of claiming more
+                    done, in_flight = wait(in_flight, timeout=self.SATURATED_WAIT, return_when=FIRST_COMPLETED)
+                    self.reap(done)
+                    continue
+
+                self.reclaim_expired()
+                self.archive_completed()
+                tasks = self.claim()
+                if tasks:
+                    self.backoff.reset()
+                    future = pool.submit(_pool.run_tasks, tasks)
+                    # a free slot wakes up the loop, in case it is idle
+                    future.add_done_callback(lambda _: self.channel.interrupt())
+                    in_flight.add(future)
+                else:
+                    if not in_flight and self.stop_if_empty():
+                        continue
+                    # don't hammer the db continously
+                    self.idle_wait()
+                    # reap finished tasks
+                    done, in_flight = wait(in_flight, timeout=0)
+                    self.reap(done)
+            except Exception as e:
+                # red-colored output
+                self.stderr.write(
+                    self.style.ERROR(f'Dispatch failed-\t{e}')
+                )
+
+        # drain: batches that haven't started are cancelled, their tasks get released
+        pool.shutdown(wait=False, cancel_futures=True)
+        done, pending = wait(in_flight, timeout=self.remaining())
+        self.reap(done)
+        if pending:
+            if executor == 'process':
+                # a running task can't be interrupted, kill its process instead (SIGTERM is ignored there)
+                for process in list((getattr(pool, '_processes', None) or {}).values()):
+                    process.kill()
+            self.abandon(len(pending))
+
+    def run_async(self, concurrency):
+        """ runs the event loop of `run_tasks --async` """
+        self.stderr.write(
+            self.style.SUCCESS(f'Running an event loop with up to {concurrency} batches in flight')
+        )
+        if load_aiosmtplib() is None:
+            self.stderr.write(
+                self.style.WARNING('aiosmtplib is not installed, invites are sent from a thread pool instead')
+            )
+        asyncio.run(self.async_loop(concurrency))
+
+    async def async_loop(self, concurrency):
+        """
+            - claims tasks and executes them as asyncio tasks, see run_pooled().
+
+            *   db queries run in a single thread (sync_to_async), the event loop
+                itself never blocks on the db.
+            *   while the queue is empty, the wakeup channel is waited on from a thread,
+                so in-flight tasks keep running.
+        """
+        in_flight = set()
+        while not self.stopping:
+            try:
+                if len(in_flight) >= concurrency:
+                    # loop is saturated, wait for a slot instead of claiming more
+                    done, in_flight = await asyncio.wait(
+                        in_flight, timeout=self.SATURATED_WAIT, return_when=asyncio.FIRST_COMPLETED
+                    )
+                    self.reap(done)
+                    continue
+
+                await sync_to_async(self.reclaim_expired)()
+                await sync_to_async(self.archive_completed)()
+                tasks = await Task.aclaim_tasks(
+                    self.owner, self.lease, limit=self.batch_size, lanes=self.lanes.order()
+                )
+                if tasks:
+                    self.backoff.reset()
+                    future = asyncio.create_task(execute_tasks_async(self, tasks))
+                    # a free slot wakes up the loop, in case it is idle
+                    future.add_done_callback(lambda _: self.channel.interrupt())
+                    in_flight.add(future)
+                else:
+                    if not in_flight and await sync_to_async(self.stop_if_empty)():
+                        continue
+                    # don't hammer the db continously
+                    await asyncio.to_thread(self.idle_wait)
+                    # reap finished tasks
+                    done = {future for future in in_flight if future.done()}
+                    in_flight -= done
+                    self.reap(done)
+            except Exception as e:
+                # red-colored output
+                self.stderr.write(
+                    self.style.ERROR(f'Dispatch failed-\t{e}')
+                )
+
+        # drain
+        if in_flight:
+            done, pending = await asyncio.wait(in_flight, timeout=self.remaining())
+            self.reap(done)
+            if pending:
+                # tasks executed in threads can't be cancelled, and the event loop
+                # would wait for these threads before closing
+                await sync_to_async(self.abandon)(len(pending))
+
+    #___________________________________________shutdown________________________________________________
+
+    def stop(self, signum, frame):
+        """
+            - SIGTERM/SIGINT handler. Stops claiming tasks and starts draining, a
+            second signal ends the drain right away.
+        """
+        if self.stopping:
+            self.deadline = monotonic()
+            if self.serial:
+                raise WorkerStopped()
+            return
+
+        self.stopping = True
+        self.deadline = monotonic() + self.drain_timeout
+        # yellow colored output
+        self.stderr.write(
+            self.style.WARNING(
+                f'{signal.Signals(signum).name} received\t--stopping, waiting up to '
+                f'{self.drain_timeout:g}s for in-flight tasks'
+            )
+        )
+        if self.serial and hasattr(signal, 'setitimer'):
+            # the task runs in this very thread, interrupt it once the deadline passes
+            signal.signal(signal.SIGALRM, self.drain_expired)
+            signal.setitimer(signal.ITIMER_REAL, max(self.drain_timeout, 0.001))
+        # wake up the loop, in case it is idle
+        self.channel.interrupt()
+
+    def drain_expired(self, signum, frame):
+        """ SIGALRM handler of a serial worker, see stop() """
+        raise WorkerStopped()
+
+    def remaining(self) -> float:
+        """ seconds left before the drain deadline """
+        return max(0.0, self.deadline - monotonic())
+
+    def abandon(self, pending: int):
+        """
+            - called when {pending} batches are still running after the drain deadline.
+            Their tasks are released and the process exits without waiting for them,
+            as running threads can't be stopped otherwise.
+        """
+        self.stderr.write(
+            self.style.ERROR(f'Drain timed out\t--abandoning {pending} running batch(es)')
+        )
+        self.finish()
+        sys.stdout.flush()
+        sys.stderr.flush()
+        os._exit(1)
+
+    def finish(self):
+        """ releases the tasks this worker didn't finish, and unregisters it """
+        if self.finished:
+            return
+        self.finished = True
+        if self.serial and hasattr(signal, 'setitimer'):
+            signal.setitimer(signal.ITIMER_REAL, 0)
+        self.heartbeat_stopped.set()
+        try:
+            if released := Task.release_tasks(self.owner):
+                # yellow colored output
                 self.stderr.write(
-                    self.style.ERROR(f'Keyboard Interrupt\t--stoped running tasks')
+                    self.style.WARNING(f'Released {released} unfinished task(s)')
                 )
+            WorkerHeartbeat.stop(self.owner)
+        finally:
+            self.channel.close()
+            if self.metrics_server:
+                self.metrics_server.shutdown()
+            if self.metrics_file:
+                # a stopped worker's counters would otherwise be summed up forever
                 try:
-                    sys.exit(130)
-                except SystemExit:
-                        os._exit(130)
\ No newline at end of file
+                    os.remove(self.metrics_file)
+                except FileNotFoundError:
+                    pass
+        self.stderr.write(
+            self.style.SUCCESS('Stopped running tasks')
+        )
+
+    #___________________________________________heartbeat________________________________________________
+
+    def start_heartbeat(self):
+        """ registers this worker, then keeps its heartbeat going from a daemon thread """
+        WorkerHeartbeat.beat(
+            self.owner, self.lease, hostname=socket.gethostname(), pid=os.getpid()
+        )
+        self.heartbeat_stopped = threading.Event()
+        threading.Thread(target=self.heartbeat_loop, name="heartbeat", daemon=True).start()
+
+    def heartbeat_loop(self):
+        """ sends a heartbeat every TASK_HEARTBEAT_INTERVAL seconds until the worker stops """
+        try:
+            while not self.heartbeat_stopped.wait(settings.TASK_HEARTBEAT_INTERVAL):
+                try:
+                    WorkerHeartbeat.beat(
+                        self.owner, self.lease,
+                        state=WorkerHeartbeat.DRAINING if self.stopping else WorkerHeartbeat.RUNNING,
+                    )
+                    if self.metrics_file:
+                        metrics.write_file(self.metrics_file)
+                except Exception as e:
+                    # red-colored output
+                    self.stderr.write(
+                        self.style.ERROR(f'Heartbeat failed-\t{e}')
+                    )
+        finally:
+            # the db connection of this thread
+            connection.close()
+
+    #___________________________________________helpers________________________________________________
+
+    def claim(self) -> list:
+        """ claims the next batch of tasks, from the lane whose turn it is """
+        return Task.claim_tasks(self.owner, self.lease, limit=self.batch_size, lanes=self.lanes.order())
+
+    def idle_wait(self):
+        """ waits until a task gets queued, a pool slot frees up or the poll interval runs out """
+        if self.channel.wait(self.backoff.next()):
+            self.backoff.reset()
+
+    def stop_if_empty(self) -> bool:
+        """
+            - with --exit-when-empty, stops the worker if no task is left queued or
+            processing. Only called while nothing is in flight, so there is nothing to drain.
+        """
+        if not self.exit_when_empty:
+            return False
+        if Task.objects.filter(state__in=[Task.QUEUED, Task.PROCESSING]).exists():
+            return False
+        self.stopping = True
+        self.deadline = monotonic()
+        self.stderr.write(
+            self.style.SUCCESS('Queue is empty\t--stopping')
+        )
+        return True
+
+    def reclaim_expired(self):
+        """ periodically requeues tasks of dead workers and tasks whose lease has expired """
+        if monotonic() < self.next_reclaim:
+            return
+        if requeued := WorkerHeartbeat.requeue_dead():
+            self.stderr.write(
+                self.style.WARNING(f'Requeued {requeued} task(s) of dead workers')
+            )
+        if requeued := Task.requeue_expired():
+            self.stderr.write(
+                self.style.WARNING(f'Requeued {requeued} task(s) with expired leases')
+            )
+        self.next_reclaim = monotonic() + self.reclaim_interval
+
+    def archive_completed(self):
+        """ archives old completed tasks once every ARCHIVE_INTERVAL, if enabled """
+        if self.archive_after is None or monotonic() < self.next_archive:
+            return
+        self.next_archive = monotonic() + self.ARCHIVE_INTERVAL
+        if archived := Task.archive_completed(timedelta(days=self.archive_after)):
+            self.stderr.write(
+                self.style.SUCCESS(f'Archived {archived} completed task(s)')
+            )
+
+    def reap(self, futures):
+        """
+            - handles finished batches: logs errors raised inside the pool that weren't
+            handled by the task itself, and merges metrics sent back by pool processes.
+        """
+        for future in futures:
+            if future.cancelled():
+                continue
+            if e := future.exception():
+                self.stderr.write(
+                    self.style.ERROR(f'Task failed-\t{e}')
+                )
+            elif isinstance(snapshot := future.result(), dict):
+                metrics.REGISTRY.merge(snapshot)
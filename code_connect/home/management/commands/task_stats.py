@@ -0,0 +1,150 @@
+#_____________________________________________________________________________________________________
+"""
+    - defines the `manage.py task_stats` command
+"""
+
+__author__ = "Tejaswin Singh, "
+__copyright__ = "Copyright 2024, Code Connect Home"
+__credits__ = ["Tejaswin Singh", "", ]
+__license__ = "GPL"
+__version__ = "1.0.0"
+__maintainer__ = "Tejaswin Singh"
+__email__ = "tejaswin.cs08@gmail.com"
+__status__ = "Development"
+
+#______________________________________________imports_________________________________________________
+
+from django.core.management.base import BaseCommand
+from django.conf import settings
+from django.db.models import Count, Min, Q
+from django.utils import timezone
+
+from home.models import Task, WorkerHeartbeat
+from home import metrics
+
+from collections import defaultdict
+from datetime import timedelta
+import glob
+import os
+
+
+#___________________________________________commands________________________________________________
+
+class Command(BaseCommand):
+    """
+        task_stats command. Summarizes the state of the task queue, eg. to check on a
+        bulk invite while it is sent.
+
+        *   queue depth, oldest due task and outcomes of the last hour come from the db.
+        *   latencies (p50/p95/p99) and counters come from the metrics files the workers
+            write to TASK_METRICS_DIR (see `home.metrics`), summed up over all workers.
+    """
+
+    help = "shows statistics of the task queue and its workers"
+
+    QUANTILES = (0.5, 0.95, 0.99)
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--metrics-dir", default=settings.TASK_METRICS_DIR,
+            help="dir the workers write their metrics to (TASK_METRICS_DIR)"
+        )
+
+    def handle(self, *args, **options):
+        self.show_queue()
+        self.show_workers()
+        if options["metrics_dir"]:
+            self.show_metrics(options["metrics_dir"])
+        else:
+            # yellow colored output
+            self.stderr.write(
+                self.style.WARNING('TASK_METRICS_DIR is not set\t--no worker metrics to show')
+            )
+
+    #___________________________________________db________________________________________________
+
+    def show_queue(self):
+        now = timezone.now()
+        unfinished = Task.objects.filter(state__in=[Task.QUEUED, Task.PROCESSING, Task.DEAD])
+
+        self.stdout.write(self.style.MIGRATE_HEADING("Queue"))
+        self.stdout.write(f"  {'state':<12} {'priority':<8} {'due':>7} {'scheduled':>9}")
+        rows = unfinished.values('state', 'priority').annotate(
+            due=Count('pk', filter=Q(run_at__lte=now)),
+            scheduled=Count('pk', filter=Q(run_at__gt=now)),
+        ).order_by('state', 'priority')
+        for row in rows:
+            self.stdout.write(
+                f"  {Task.STATE_CHOICES[row['state']]:<12} {Task.PRIORITY_CHOICES[row['priority']]:<8} "
+                f"{row['due']:>7} {row['scheduled']:>9}"
+            )
+
+        oldest = Task.objects.filter(state=Task.QUEUED, run_at__lte=now).aggregate(Min('run_at'))['run_at__min']
+        if oldest:
+            self.stdout.write(f"  oldest due task waiting for {format_seconds((now - oldest).total_seconds())}")
+
+        outcomes = dict(
+            Task.objects.filter(exit__gte=now - timedelta(hours=1))
+            .values_list('state').annotate(n=Count('pk')).order_by()
+        )
+        self.stdout.write(
+            "  last hour: " + ", ".join(
+                f"{outcomes.get(state, 0)} {Task.STATE_CHOICES[state].lower()}"
+                for state in (Task.FINISHED, Task.ABORTED, Task.DEAD)
+            )
+        )
+
+    def show_workers(self):
+        workers = list(WorkerHeartbeat.objects.all())
+        alive = [worker for worker in workers if worker.is_alive()]
+        self.stdout.write(self.style.MIGRATE_HEADING("Workers"))
+        self.stdout.write(f"  {len(alive)} alive, {len(workers) - len(alive)} dead (see `manage.py workers`)")
+
+    #___________________________________________metrics________________________________________________
+
+    def show_metrics(self, directory):
+        paths = glob.glob(os.path.join(str(directory), "*.prom"))
+        self.stdout.write(self.style.MIGRATE_HEADING(f"Metrics ({len(paths)} worker file(s))"))
+
+        # sample name -> labels (without 'le') -> summed value / buckets
+        totals = defaultdict(lambda: defaultdict(float))
+        buckets = defaultdict(lambda: defaultdict(lambda: defaultdict(float)))
+        for path in paths:
+            try:
+                with open(path) as file:
+                    text = file.read()
+            except FileNotFoundError:
+                continue    # the worker stopped meanwhile
+            for name, labels, value in metrics.parse(text):
+                if name.endswith("_bucket"):
+                    bound = float(labels.pop("le"))
+                    buckets[name[:-len("_bucket")]][freeze(labels)][bound] += value
+                elif name != metrics.QUEUE_DEPTH.name:     # already shown from the db
+                    totals[name][freeze(labels)] += value
+
+        self.stdout.write(f"  {'latency (s)':<44} {'count':>7} " + " ".join(f"{f'p{q * 100:g}':>8}" for q in self.QUANTILES))
+        for histogram in (metrics.CLAIM_SECONDS, metrics.WAIT_SECONDS, metrics.EXECUTION_SECONDS, metrics.SMTP_SEND_SECONDS):
+            for labels, counts in sorted(buckets[histogram.name].items()):
+                cumulative = sorted(counts.items())
+                estimates = " ".join(
+                    f"{metrics.histogram_quantile(q, cumulative):>8.3f}" for q in self.QUANTILES
+                )
+                self.stdout.write(f"  {histogram.name + format_labels(labels):<44} {cumulative[-1][1]:>7g} {estimates}")
+
+        for counter in (metrics.OUTCOMES, metrics.REQUEUED, metrics.SMTP_ERRORS):
+            for labels, value in sorted(totals[counter.name].items()):
+                self.stdout.write(f"  {counter.name + format_labels(labels):<44} {value:>7g}")
+
+
+#___________________________________________utilities________________________________________________
+
+def freeze(labels: dict) -> tuple:
+    return tuple(sorted(labels.items()))
+
+def format_labels(labels: tuple) -> str:
+    return metrics.format_labels(dict(labels))
+
+def format_seconds(seconds: float) -> str:
+    minutes, seconds = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours}h {minutes:02}m {seconds:02}s" if hours else f"{minutes}m {seconds:02}s"
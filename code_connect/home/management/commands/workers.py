@@ -0,0 +1,59 @@
+#_____________________________________________________________________________________________________
+"""
+    - defines the `manage.py workers` command
+"""
+
+__author__ = "Tejaswin Singh, "
+__copyright__ = "Copyright 2024, Code Connect Home"
+__credits__ = ["Tejaswin Singh", "", ]
+__license__ = "GPL"
+__version__ = "1.0.0"
+__maintainer__ = "Tejaswin Singh"
+__email__ = "tejaswin.cs08@gmail.com"
+__status__ = "Development"
+
+#______________________________________________imports_________________________________________________
+
+from django.core.management.base import BaseCommand
+from django.db.models import Count
+
+from home.models import Task, WorkerHeartbeat
+
+
+#___________________________________________commands________________________________________________
+
+class Command(BaseCommand):
+    """
+        workers command. Lists the registered `run_tasks` workers, eg. for a supervisor
+        checking on them during a deploy.
+
+        *   a worker is DEAD once it hasn't sent a heartbeat for TASK_HEARTBEAT_TIMEOUT.
+        *   with --requeue-dead, the PROCESSING tasks of dead workers are put back in
+            the queue (running workers also do this on their own, periodically).
+    """
+
+    help = "lists the run_tasks workers and their heartbeats"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--requeue-dead", action="store_true",
+            help="requeue the tasks of dead workers"
+        )
+
+    def handle(self, *args, **options):
+        processing = dict(
+            Task.objects.filter(state=Task.PROCESSING).values_list('owner').annotate(n=Count('pk'))
+        )
+
+        self.stdout.write(f"{'worker':<40} {'state':<9} {'tasks':>5}  last seen")
+        for worker in WorkerHeartbeat.objects.order_by('started_at'):
+            state = worker.STATE_CHOICES[worker.state] if worker.is_alive() else 'DEAD'
+            self.stdout.write(
+                f"{worker.owner:<40} {state:<9} {processing.get(worker.owner, 0):>5}  {worker.last_seen:%Y-%m-%d %H:%M:%S}"
+            )
+
+        if options["requeue_dead"]:
+            requeued = WorkerHeartbeat.requeue_dead()
+            self.stderr.write(
+                self.style.SUCCESS(f'Requeued {requeued} task(s) of dead workers')
+            )
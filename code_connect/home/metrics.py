@@ -0,0 +1,335 @@
+#_____________________________________________________________________________________________________
+"""
+    - metrics of the background task queue, in the Prometheus text format.
+
+    Every `run_tasks` worker keeps its metrics in memory (REGISTRY) and exposes them:
+
+    *   over HTTP, with `run_tasks --metrics-port PORT` (GET /metrics).
+    *   as a file written next to the other workers' in TASK_METRICS_DIR, every
+        TASK_HEARTBEAT_INTERVAL seconds. The dir can be scraped by node_exporter's
+        textfile collector, and is summed up by `manage.py task_stats`.
+
+    No client library is needed, the few metric types used are implemented here.
+"""
+
+__author__ = "Tejaswin Singh, "
+__copyright__ = "Copyright 2024, Code Connect Home"
+__credits__ = ["Tejaswin Singh", "", ]
+__license__ = "GPL"
+__version__ = "1.0.0"
+__maintainer__ = "Tejaswin Singh"
+__email__ = "tejaswin.cs08@gmail.com"
+__status__ = "Development"
+
+#______________________________________________imports_________________________________________________
+
+from bisect import bisect_left
+from contextlib import contextmanager
+from time import perf_counter
+import math
+import os
+import re
+import tempfile
+import threading
+
+
+#___________________________________________metric types________________________________________________
+
+class Metric:
+    """
+        - base metric. Holds one value per combination of label values.
+
+        *   labels are passed as keyword arguments, eg. inc(function_id=1).
+    """
+
+    TYPE = None
+
+    def __init__(self, name: str, help: str, labelnames: tuple = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = labelnames
+        self._values = {}   # tuple of label values -> value
+        self._lock = threading.Lock()
+
+    def samples(self):
+        """ yields (sample name, labels dict, value) for each value, in exposition order """
+        with self._lock:
+            values = dict(self._values)
+        for key, value in sorted(values.items()):
+            yield self.name, dict(zip(self.labelnames, key)), value
+
+    def _key(self, labels: dict) -> tuple:
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+
+class Counter(Metric):
+    """ value that only goes up, eg. the number of finished tasks """
+
+    TYPE = 'counter'
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(Metric):
+    """
+        - value that goes up and down, eg. the queue depth.
+
+        *   if {collect} is set, it is called whenever the gauge is rendered and returns
+            the current values as {tuple of label values: value}.
+    """
+
+    TYPE = 'gauge'
+
+    def __init__(self, name: str, help: str, labelnames: tuple = (), collect=None):
+        super().__init__(name, help, labelnames)
+        self.collect = collect
+
+    def set(self, value: float, **labels) -> None:
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def samples(self):
+        if self.collect:
+            values = {tuple(str(v) for v in key): value for key, value in self.collect().items()}
+            with self._lock:
+                self._values = values
+        yield from super().samples()
+
+
+class Histogram(Metric):
+    """
+        - distribution of observed values (eg. durations) over fixed {buckets}, from
+        which percentiles are estimated (see `task_stats`).
+
+        *   each value is stored as [count per bucket (last one is +Inf), sum, count].
+    """
+
+    TYPE = 'histogram'
+
+    # seconds, from a fast db query to a slow SMTP server
+    DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+    def __init__(self, name: str, help: str, labelnames: tuple = (), buckets: tuple = DEFAULT_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            if key not in self._values:
+                self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            counts = self._values[key]
+            counts[0][index] += 1
+            counts[1] += value
+            counts[2] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        """ observes the duration of the `with` block """
+        start = perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(perf_counter() - start, **labels)
+
+    def samples(self):
+        with self._lock:
+            values = {key: [list(counts), total, count] for key, (counts, total, count) in self._values.items()}
+        for key, (counts, total, count) in sorted(values.items()):
+            labels = dict(zip(self.labelnames, key))
+            cumulative = 0
+            for bound, bucket in zip(self.buckets + (math.inf,), counts):
+                cumulative += bucket
+                yield f"{self.name}_bucket", {**labels, 'le': format_value(bound)}, cumulative
+            yield f"{self.name}_sum", labels, total
+            yield f"{self.name}_count", labels, count
+
+
+#___________________________________________registry________________________________________________
+
+class Registry:
+    """ the metrics of a process """
+
+    def __init__(self):
+        self.metrics = []
+
+    def register(self, metric: Metric) -> Metric:
+        self.metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        """ returns all the metrics in the Prometheus text format """
+        lines = []
+        for metric in self.metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.TYPE}")
+            for name, labels, value in metric.samples():
+                lines.append(f"{name}{format_labels(labels)} {format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+    def take(self) -> dict:
+        """
+            - returns the values of the counters and histograms (picklable) and resets
+            them, eg. to send what a pool process recorded to its parent (see merge()).
+        """
+        snapshot = {}
+        for metric in self.metrics:
+            if isinstance(metric, Gauge):
+                continue
+            with metric._lock:
+                snapshot[metric.name], metric._values = metric._values, {}
+        return snapshot
+
+    def merge(self, snapshot: dict) -> None:
+        """ adds the values take()n from another process """
+        for metric in self.metrics:
+            for key, value in snapshot.get(metric.name, {}).items():
+                with metric._lock:
+                    if isinstance(metric, Histogram):
+                        current = metric._values.setdefault(key, [[0] * (len(metric.buckets) + 1), 0.0, 0])
+                        current[0] = [a + b for a, b in zip(current[0], value[0])]
+                        current[1] += value[1]
+                        current[2] += value[2]
+                    else:
+                        metric._values[key] = metric._values.get(key, 0) + value
+
+
+#___________________________________________exposition________________________________________________
+
+def format_labels(labels: dict) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{name}="{escape(value)}"' for name, value in labels.items()) + "}"
+
+def escape(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def format_value(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+SAMPLE_RE = re.compile(r'^(?P<name>[a-zA-Z_:][a-zA-Z0-9_:]*)(?:\{(?P<labels>.*)\})?\s+(?P<value>\S+)$')
+LABEL_RE = re.compile(r'([a-zA-Z_][a-zA-Z0-9_]*)="((?:[^"\\]|\\.)*)"')
+
+def parse(text: str):
+    """ yields (sample name, labels dict, value) for each sample of a Prometheus text file """
+    for line in text.splitlines():
+        if not line or line.startswith("#"):
+            continue
+        if match := SAMPLE_RE.match(line):
+            labels = {
+                name: value.replace('\\"', '"').replace('\\\\', '\\')
+                for name, value in LABEL_RE.findall(match["labels"] or "")
+            }
+            yield match["name"], labels, float(match["value"])
+
+def histogram_quantile(q: float, buckets: list) -> float:
+    """
+        - estimates the {q} quantile (0 < q < 1) of a histogram from its cumulative
+        {buckets}, as (upper bound, count) sorted by bound, interpolating linearly
+        inside the bucket it falls in (same as Prometheus' histogram_quantile()).
+
+        *   returns NaN if the histogram is empty, and the highest finite bound if the
+            quantile falls in the +Inf bucket.
+    """
+    if not buckets or buckets[-1][1] == 0:
+        return math.nan
+    rank = q * buckets[-1][1]
+    lower, below = 0.0, 0
+    for bound, count in buckets:
+        if count >= rank:
+            if bound == math.inf:
+                return lower
+            if count == below:
+                return bound
+            return lower + (bound - lower) * (rank - below) / (count - below)
+        lower, below = bound, count
+    return lower
+
+def write_file(path: str, registry: Registry = None) -> None:
+    """ writes the metrics to {path}, atomically so a scraper never reads half a file """
+    registry = registry or REGISTRY
+    directory = os.path.dirname(path) or '.'
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=directory, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w") as file:
+            file.write(registry.render())
+        os.replace(tmp, path)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+
+def metrics_file(owner: str, directory: str) -> str:
+    """ path of the metrics file of the worker {owner} inside {directory} """
+    return os.path.join(str(directory), re.sub(r'[^a-zA-Z0-9_.-]', '_', owner) + ".prom")
+
+def serve(port: int, registry: Registry = None, host: str = ""):
+    """ serves the metrics at http://{host}:{port}/metrics from a daemon thread """
+    # only workers started with --metrics-port need it, not every process importing home.models
+    from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+    registry = registry or REGISTRY
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] != "/metrics":
+                self.send_error(404)
+                return
+            body = registry.render().encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass    # no line on stderr for every scrape
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    threading.Thread(target=server.serve_forever, name="metrics", daemon=True).start()
+    return server
+
+
+#___________________________________________metrics________________________________________________
+
+REGISTRY = Registry()
+
+QUEUE_DEPTH = REGISTRY.register(Gauge(
+    "tasks_queue_depth", "Number of unfinished tasks.", ("state", "priority"),
+))  # {collect} is set by `run_tasks`, it queries the db
+CLAIM_SECONDS = REGISTRY.register(Histogram(
+    "tasks_claim_duration_seconds", "Time taken by the query claiming tasks.",
+))
+WAIT_SECONDS = REGISTRY.register(Histogram(
+    "tasks_wait_seconds", "Time a task waited in the queue after its run_at before being claimed.",
+    ("function_id",), buckets=(0.1, 0.5, 1, 5, 10, 30, 60, 300, 900, 3600, 4 * 3600, 24 * 3600),
+))
+EXECUTION_SECONDS = REGISTRY.register(Histogram(
+    "tasks_execution_seconds", "Time taken to execute a task (a batch is spread over its tasks).",
+    ("function_id",),
+))
+OUTCOMES = REGISTRY.register(Counter(
+    "tasks_outcomes_total", "Tasks by outcome (finished, aborted, retried, dead, deferred).",
+    ("function_id", "outcome"),
+))
+REQUEUED = REGISTRY.register(Counter(
+    "tasks_requeued_total", "Claimed tasks put back in the queue (released, expired lease, dead worker).",
+    ("reason",),
+))
+SMTP_SEND_SECONDS = REGISTRY.register(Histogram(
+    "smtp_send_duration_seconds", "Time taken to hand a mail over to the SMTP server.",
+))
+SMTP_ERRORS = REGISTRY.register(Counter(
+    "smtp_errors_total", "Mails the SMTP server didn't accept, by error.", ("error",),
+))
+
+def count_outcome(tasks, outcome: str) -> None:
+    """ counts the {outcome} of each of the {tasks} """
+    for task in tasks:
+        OUTCOMES.inc(function_id=task.task_function_id, outcome=outcome)
@@ -0,0 +1,23 @@
+# Generated by Django 5.0.3 on 2026-10-17 19:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('home', '0006_sendinvitetask_delete_sendemailtask'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='task',
+            name='lease_expires_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='task',
+            name='owner',
+            field=models.CharField(blank=True, default='', max_length=255),
+        ),
+    ]
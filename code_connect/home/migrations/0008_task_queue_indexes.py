@@ -0,0 +1,21 @@
+# Generated by Django 5.0.3 on 2026-10-17 19:09
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('home', '0007_task_owner_task_lease_expires_at'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='task',
+            index=models.Index(fields=['state', 'arrival'], name='task_state_arrival_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='task',
+            index=models.Index(condition=models.Q(('state', 'Q')), fields=['arrival'], name='task_queued_arrival_idx'),
+        ),
+    ]
@@ -0,0 +1,52 @@
+# Generated by Django 5.0.3 on 2026-10-17 20:02
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+def fill_run_at(apps, schema_editor):
+    """ tasks that weren't retried (no run_at yet) are due since their arrival """
+    Task = apps.get_model('home', 'Task')
+    Task.objects.filter(run_at__isnull=True).update(run_at=models.F('arrival'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('home', '0010_task_retries'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='task',
+            name='task_state_arrival_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='task',
+            name='task_queued_arrival_idx',
+        ),
+        migrations.AddField(
+            model_name='task',
+            name='priority',
+            field=models.PositiveSmallIntegerField(choices=[(0, 'HIGH'), (1, 'NORMAL'), (2, 'BULK')], default=1),
+        ),
+        migrations.RenameField(
+            model_name='task',
+            old_name='next_run_at',
+            new_name='run_at',
+        ),
+        migrations.RunPython(fill_run_at, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='task',
+            name='run_at',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+        migrations.AddIndex(
+            model_name='task',
+            index=models.Index(fields=['state', 'priority', 'run_at', 'arrival'], name='task_state_priority_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='task',
+            index=models.Index(condition=models.Q(('state', 'Q')), fields=['priority', 'run_at', 'arrival'], name='task_queued_priority_idx'),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.0.3 on 2026-10-17 19:44
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('home', '0012_workerheartbeat'),
+        ('members', '0015_inviteimportjob'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ImportInvitesTask',
+            fields=[
+                ('task_ptr', models.OneToOneField(auto_created=True, on_delete=django.db.models.deletion.CASCADE, parent_link=True, primary_key=True, serialize=False, to='home.task')),
+                ('job', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='members.inviteimportjob')),
+            ],
+            bases=('home.task',),
+        ),
+    ]
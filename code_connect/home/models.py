@@ -15,12 +15,37 @@ __status__ = "Development"
 #______________________________________________imports_________________________________________________
 
 
-from django.db import models
-from django.core.mail import send_mail
+from django.db import models, transaction, connection
+from django.core.mail import EmailMultiAlternatives
 from django.conf import settings
-from django.template.loader import render_to_string
-from django.utils.html import strip_tags
 from django.utils import timezone
+from django.core.serializers.json import DjangoJSONEncoder
+from asgiref.sync import sync_to_async
+
+from home.wakeup import notify_workers
+from home.rendering import PrerenderedTemplate
+from home import metrics
+
+from datetime import timedelta
+from contextlib import nullcontext
+import json
+import os
+import random
+
+#___________________________________________utilities________________________________________________
+
+def sync_stream(stream) -> None:
+    """
+        - writes what {stream} buffers down to the disk. A gzip stream (gzip.open()) flushes
+        its compressor too, so what was written so far can be decompressed from the file.
+        Streams without a file (eg. StringIO) are only flushed.
+    """
+    stream.flush()
+    try:
+        os.fsync(stream.fileno())
+    except OSError:     # includes io.UnsupportedOperation
+        pass
+
 
 #___________________________________________base model________________________________________________
 
@@ -36,12 +61,47 @@ class Task(models.Model):
     PROCESSING = 'P'
     FINISHED = 'F'
     ABORTED = 'A'
+    DEAD = 'D'      # failed {max_attempts} times, kept for inspection (dead-letter)
 
     STATE_CHOICES = {
         QUEUED: 'QUEUED',
         PROCESSING: 'PROCESSING',
         FINISHED: 'FINISHED',
-        ABORTED: 'ABORTED'
+        ABORTED: 'ABORTED',
+        DEAD: 'DEAD',
+    }
+
+    # lanes of the queue. Lower values are claimed first, see PRIORITY_WEIGHTS
+    HIGH = 0        # interactive work, eg. a few invites sent by an admin
+    NORMAL = 1
+    BULK = 2        # large batches, eg. invites imported from a csv file
+
+    PRIORITY_CHOICES = {
+        HIGH: 'HIGH',
+        NORMAL: 'NORMAL',
+        BULK: 'BULK',
+    }
+
+    #_____________________________const________________________________
+
+    # how long a claimed task stays reserved for its worker. If the worker
+    # dies before finishing, the task is requeued once the lease runs out.
+    DEFAULT_LEASE = timedelta(minutes=5)
+
+    # retries of failed tasks are delayed by RETRY_BASE_DELAY * 2^(attempts - 1),
+    # capped at RETRY_MAX_DELAY, with a random jitter of up to -50%
+    RETRY_BASE_DELAY = timedelta(seconds=30)
+    RETRY_MAX_DELAY = timedelta(hours=1)
+
+    # related objects fetched along with tasks of this type (see concrete_model())
+    RELATED_FIELDS = ()
+
+    # share of the claims that go to each lane while all of them have work
+    # (see FairShare). Bulk work keeps moving, but can't hold up interactive work.
+    PRIORITY_WEIGHTS = {
+        HIGH: 8,
+        NORMAL: 4,
+        BULK: 1,
     }
 
     #_____________________________fields________________________________
@@ -51,38 +111,390 @@ class Task(models.Model):
     exit = models.DateTimeField(blank=True, null=True)
     state = models.CharField(max_length=1, choices=STATE_CHOICES, default=QUEUED)
     task_function_id = models.PositiveSmallIntegerField(default=0)  # function id in TASK_TABLE
+    owner = models.CharField(max_length=255, blank=True, default='')  # id of the worker that claimed the task
+    lease_expires_at = models.DateTimeField(blank=True, null=True)
+    attempts = models.PositiveSmallIntegerField(default=0)  # number of failed attempts so far
+    max_attempts = models.PositiveSmallIntegerField(default=5)
+    priority = models.PositiveSmallIntegerField(choices=PRIORITY_CHOICES, default=NORMAL)
+    run_at = models.DateTimeField(default=timezone.now)  # the task isn't claimed before this
+    last_error = models.TextField(blank=True, default='')
 
     # NOTE: child class must have their own definitions of the fields below
     # result = models.CharField(max_length=255)
 
+    class Meta:
+        indexes = [
+            # hot query of the workers: filter on {state}, then by
+            # {priority}, {run_at} and {arrival} (see claim_tasks())
+            models.Index(fields=['state', 'priority', 'run_at', 'arrival'], name='task_state_priority_idx'),
+            # same, but only covering QUEUED rows, so it stays tiny no matter how
+            # many finished tasks pile up (only on backends with partial indexes)
+            models.Index(
+                fields=['priority', 'run_at', 'arrival'], condition=models.Q(state='Q'),
+                name='task_queued_priority_idx',
+            ),
+        ]
+
     #_____________________________instance methods______________________
-    
+
+    def save(self, *args, **kwargs):
+        """ Custom save. Wakes up idle workers once a new task gets committed. """
+        created = self._state.adding
+        super(Task, self).save(*args, **kwargs)
+        if created and self.state == Task.QUEUED:
+            transaction.on_commit(notify_workers)
+
+    # NOTE: the state changes below only write the Task table. A full save() of a child
+    # task would validate and rewrite both the parent and the child table.
+
     def start_task(self):
         """ call before performing the task """
 
+        if self.state == Task.PROCESSING:
+            return  # already moved there by claim_tasks()
         self.state = Task.PROCESSING
-        self.full_clean()
-        self.save()
+        self.save(update_fields=['state'])
 
     def clear_task(self):
         """ call after the task is performed """
 
         self.state = Task.FINISHED
         self.exit = timezone.now()
-        self.full_clean()
-        self.save()
+        self.lease_expires_at = None
+        self.save(update_fields=['state', 'exit', 'lease_expires_at'])
+        metrics.count_outcome([self], 'finished')
 
-    def abort_task(self):
+    def abort_task(self, error=None):
         """ call if there was some error while performing the task """
 
         self.state = Task.ABORTED
         self.exit = timezone.now()
-        self.full_clean()
-        self.save()
+        self.lease_expires_at = None
+        if error is not None:
+            self.last_error = str(error)
+        self.save(update_fields=['state', 'exit', 'lease_expires_at', 'last_error'])
+        metrics.count_outcome([self], 'aborted')
+
+    def retry_task(self, error) -> bool:
+        """
+            - call if the task failed with a transient error (eg. the mail server is
+            rate limiting us). Returns True if the task was requeued.
+
+            *   the task is queued again, but isn't claimed before {run_at}
+                (see retry_delay()).
+            *   once it has failed {max_attempts} times, it is moved to DEAD instead.
+        """
+        self.attempts += 1
+        self.last_error = str(error)
+        self.owner = ''
+        self.lease_expires_at = None
+        if self.attempts >= self.max_attempts:
+            self.state = Task.DEAD
+            self.exit = timezone.now()
+        else:
+            self.state = Task.QUEUED
+            self.run_at = timezone.now() + self.retry_delay(self.attempts)
+        self.save(update_fields=[
+            'attempts', 'last_error', 'owner', 'lease_expires_at', 'state', 'exit', 'run_at'
+        ])
+        metrics.count_outcome([self], 'retried' if self.state == Task.QUEUED else 'dead')
+        return self.state == Task.QUEUED
+
+    def defer_task(self, until) -> None:
+        """
+            - queues the task again, to be run at {until}. Unlike retry_task() this
+            doesn't count as a failed attempt, eg. when the daily mail budget is spent.
+        """
+        self.state = Task.QUEUED
+        self.owner = ''
+        self.lease_expires_at = None
+        self.run_at = until
+        self.save(update_fields=['state', 'owner', 'lease_expires_at', 'run_at'])
+        metrics.count_outcome([self], 'deferred')
+
+    def archive_data(self) -> dict:
+        """ type specific data kept in the ArchivedTask. Overridden by child classes. """
+        return {}
+
+    def archive_record(self) -> dict:
+        """ the fields of this task that are kept once it's archived """
+        return {
+            'task_id': self.pk,
+            'name': self.name,
+            'task_function_id': self.task_function_id,
+            'state': self.state,
+            'arrival': self.arrival,
+            'exit': self.exit,
+            'data': self.archive_data(),
+        }
 
     def __str__(self) -> str:
         return f"Task: {self.name} [State: {self.STATE_CHOICES[self.state]}]"
 
+    #_____________________________class methods_________________________
+
+    @classmethod
+    def retry_delay(cls, attempts: int) -> timedelta:
+        """ delay before retrying a task that failed {attempts} times """
+        # the exponent is capped, the delay hits RETRY_MAX_DELAY long before anyway
+        delay = min(cls.RETRY_BASE_DELAY * 2 ** min(attempts - 1, 20), cls.RETRY_MAX_DELAY)
+        # jitter, so tasks that failed together don't all come back at once
+        return delay * random.uniform(0.5, 1)
+
+    @classmethod
+    def claim_tasks(cls, owner: str, lease: timedelta = DEFAULT_LEASE, limit: int = 1, lanes: list = None) -> list:
+        """
+            - atomically claims up to {limit} due QUEUED tasks (their {run_at} has passed)
+            for {owner} and returns them. Returns an empty list if no task is due.
+
+            *   tasks are taken by {priority} first, then by {run_at} and {arrival}.
+            *   if {lanes} (a list of priorities, see FairShare) is given, the lanes are
+                tried in that order and all the tasks come from the first non-empty one
+                (see _due()).
+            *   tasks are returned as instances of their concrete class, with their
+                RELATED_FIELDS already fetched (see fetch_concrete()).
+
+            *   tasks are moved to PROCESSING with a conditional update, so if two
+                workers pick the same rows each row is only won by one of them.
+            *   on backends that support it, candidate rows are locked with
+                SELECT ... FOR UPDATE SKIP LOCKED so workers don't even contend.
+        """
+        with metrics.CLAIM_SECONDS.time():
+            tasks = cls._claim(owner, lease, limit, lanes)
+        now = timezone.now()
+        for task in tasks:
+            metrics.WAIT_SECONDS.observe((now - task.run_at).total_seconds(), function_id=task.task_function_id)
+        return tasks
+
+    @classmethod
+    def _claim(cls, owner: str, lease: timedelta, limit: int, lanes: list = None) -> list:
+        """ claims up to {limit} due QUEUED tasks from {lanes}, see claim_tasks() """
+        skip_locked = connection.features.has_select_for_update_skip_locked
+        while True:
+            # row locks only live inside a transaction. Elsewhere (eg. sqlite) the
+            # conditional update alone is atomic, and keeping the select out of a
+            # transaction lets it wait on the db lock instead of failing
+            with transaction.atomic() if skip_locked else nullcontext():
+                now = timezone.now()
+                queued = cls.objects.filter(
+                    state=cls.QUEUED, run_at__lte=now
+                ).order_by('priority', 'run_at', 'arrival')
+                if skip_locked:
+                    queued = queued.select_for_update(skip_locked=True)
+                rows = cls._due(queued, limit, lanes)
+                if not rows:
+                    return []
+                pks = [pk for pk, _ in rows]
+                lease_expires_at = now + lease
+                claimed = cls.objects.filter(pk__in=pks, state=cls.QUEUED).update(
+                    state=cls.PROCESSING,
+                    owner=owner,
+                    lease_expires_at=lease_expires_at,
+                )
+            if claimed:
+                # not matched on {lease_expires_at}, the heartbeat may renew the lease meanwhile
+                return cls.fetch_concrete(rows, state=cls.PROCESSING, owner=owner)
+            # other workers claimed these rows first, try the next ones
+
+    @classmethod
+    def _due(cls, queued, limit: int, lanes: list = None) -> list:
+        """
+            - returns (pk, task_function_id) of up to {limit} tasks of {queued} (due QUEUED
+            tasks, by priority), all from the first non-empty of the {lanes}.
+
+            *   FairShare gives the lane whose turn it is, then the others by priority.
+                So the first non-empty lane is either that lane, or the non-empty lane of
+                the lowest priority (which the index hands out first).
+            *   an idle worker polls with a single query over all the lanes. A second one
+                is only needed when lanes[0] may have work behind a lower priority lane.
+            *   both are range scans of the queue index, whatever the size of the backlog.
+        """
+        if lanes is None:
+            return list(queued.values_list('pk', 'task_function_id')[:limit])
+
+        rows = list(queued.filter(priority__in=lanes).values_list('pk', 'task_function_id', 'priority')[:limit])
+        if rows and lanes[0] > rows[0][2]:
+            rows = list(queued.filter(priority=lanes[0]).values_list('pk', 'task_function_id', 'priority')[:limit]) or rows
+        return [(pk, task_function_id) for pk, task_function_id, priority in rows if priority == rows[0][2]]
+
+    @classmethod
+    async def aclaim_tasks(cls, owner: str, lease: timedelta = DEFAULT_LEASE, limit: int = 1, lanes: list = None) -> list:
+        """ async version of claim_tasks(), for `run_tasks --async` """
+        return await sync_to_async(cls.claim_tasks)(owner, lease, limit, lanes)
+
+    @classmethod
+    def claim_next(cls, owner: str, lease: timedelta = DEFAULT_LEASE):
+        """ claims the next due QUEUED task for {owner}. Returns None if no task is due. """
+        tasks = cls.claim_tasks(owner, lease, limit=1)
+        return tasks[0] if tasks else None
+
+    @classmethod
+    def clear_tasks(cls, tasks: list) -> int:
+        """ bulk version of clear_task(), for the claimed {tasks} still PROCESSING """
+        cleared = cls.objects.filter(pk__in=[t.pk for t in tasks], state=cls.PROCESSING).update(
+            state=cls.FINISHED, exit=timezone.now(), lease_expires_at=None
+        )
+        metrics.count_outcome(tasks, 'finished')
+        return cleared
+
+    @classmethod
+    def abort_tasks(cls, tasks: list) -> int:
+        """ bulk version of abort_task(), for the claimed {tasks} still PROCESSING """
+        aborted = cls.objects.filter(pk__in=[t.pk for t in tasks], state=cls.PROCESSING).update(
+            state=cls.ABORTED, exit=timezone.now(), lease_expires_at=None
+        )
+        metrics.count_outcome(tasks, 'aborted')
+        return aborted
+
+    @classmethod
+    def create_tasks(cls, tasks: list) -> list:
+        """
+            - bulk version of save() for new {tasks} of this class, eg. SendInviteTask.create_tasks().
+            Call it inside a transaction, a child task is split over two tables.
+
+            *   bulk_create() doesn't support multi-table inheritance, so the Task rows are
+                inserted first and the child rows, pointing to them, right after. Two queries
+                (per batch) in all, instead of two per task.
+            *   like save(), sets {task_function_id} and wakes up idle workers on commit.
+        """
+        if not tasks:
+            return tasks
+        for task in tasks:
+            task.task_function_id = getattr(cls, 'TASK_FUNCTION_ID', task.task_function_id)
+        if cls is Task:
+            tasks = Task.objects.bulk_create(tasks)
+        else:
+            # only direct children of Task exist (see concrete_model())
+            fields = [f for f in Task._meta.concrete_fields if not f.primary_key]
+            parents = Task.objects.bulk_create([
+                Task(**{f.attname: getattr(task, f.attname) for f in fields}) for task in tasks
+            ])
+            for task, parent in zip(tasks, parents):
+                task.pk = parent.pk     # sets the pointer to the parent row
+                task.id = parent.pk
+                task.arrival = parent.arrival
+            child_fields = cls._meta.local_concrete_fields
+            batch_size = max(connection.ops.bulk_batch_size(child_fields, tasks), 1)
+            for start in range(0, len(tasks), batch_size):
+                cls._base_manager._insert(tasks[start:start + batch_size], fields=child_fields)
+            for task in tasks:
+                task._state.adding = False
+                task._state.db = parents[0]._state.db
+        transaction.on_commit(notify_workers)
+        return tasks
+
+    @classmethod
+    def concrete_model(cls, task_function_id: int):
+        """ returns the Task class (this one or a child) with the given {task_function_id} """
+        for subclass in cls.__subclasses__():
+            if getattr(subclass, 'TASK_FUNCTION_ID', None) == task_function_id:
+                return subclass
+        return cls
+
+    @classmethod
+    def fetch_concrete(cls, rows, **filters) -> list:
+        """
+            - fetches tasks as instances of their concrete class, with their RELATED_FIELDS
+            joined in. Takes one query per task type instead of one per task and relation.
+
+            *   {rows} are (pk, task_function_id) pairs, {filters} further restrict the tasks.
+            *   returns the tasks sorted by {arrival}.
+        """
+        groups = {}
+        for pk, task_function_id in rows:
+            groups.setdefault(task_function_id, []).append(pk)
+
+        tasks = []
+        for task_function_id, pks in groups.items():
+            model = cls.concrete_model(task_function_id)
+            tasks.extend(
+                model.objects.select_related(*model.RELATED_FIELDS).filter(pk__in=pks, **filters)
+            )
+        tasks.sort(key=lambda task: (task.arrival, task.pk))
+        return tasks
+
+    @classmethod
+    def archive_completed(cls, older_than: timedelta, chunk_size: int = 1000, stream=None) -> int:
+        """
+            - moves FINISHED and ABORTED tasks that exited more than {older_than} ago out of
+            the live table. Returns the number of archived tasks.
+
+            *   tasks are copied to ArchivedTask, or written as JSON lines to {stream}
+                (a text file object) if one is passed, and then deleted.
+            *   works in chunks of {chunk_size} tasks, each in its own transaction, so
+                huge backlogs don't hold long locks on the queue table.
+            *   with a {stream}, each chunk is flushed down to the disk (see sync_stream())
+                before its rows are deleted. If the process dies in between, the chunk is
+                archived twice rather than lost.
+        """
+        cutoff = timezone.now() - older_than
+        completed = cls.objects.filter(
+            state__in=[cls.FINISHED, cls.ABORTED], exit__lt=cutoff
+        ).order_by('pk')
+
+        archived = 0
+        while chunk := list(completed.values_list('pk', 'task_function_id')[:chunk_size]):
+            records = [task.archive_record() for task in cls.fetch_concrete(chunk)]
+
+            if stream is not None:
+                for record in records:
+                    stream.write(json.dumps(record, cls=DjangoJSONEncoder) + '\n')
+                sync_stream(stream)
+            with transaction.atomic():
+                if stream is None:
+                    ArchivedTask.objects.bulk_create(ArchivedTask(**record) for record in records)
+                cls.objects.filter(pk__in=[pk for pk, _ in chunk]).delete()
+            archived += len(chunk)
+
+        return archived
+
+    @classmethod
+    def release_tasks(cls, owner: str, pks=None) -> int:
+        """
+            - puts the PROCESSING tasks of {owner} (only those in {pks}, if given) back
+            in the queue, eg. when a worker stops before it could execute them. This
+            doesn't count as a failed attempt. Returns the number of released tasks.
+        """
+        tasks = cls.objects.filter(state=cls.PROCESSING, owner=owner)
+        if pks is not None:
+            tasks = tasks.filter(pk__in=pks)
+        released = tasks.update(state=cls.QUEUED, owner='', lease_expires_at=None)
+        metrics.REQUEUED.inc(released, reason='released')
+        return released
+
+    @classmethod
+    def renew_leases(cls, owner: str, lease: timedelta = DEFAULT_LEASE) -> int:
+        """ extends the leases of the PROCESSING tasks of {owner}, which is still alive """
+        return cls.objects.filter(state=cls.PROCESSING, owner=owner).update(
+            lease_expires_at=timezone.now() + lease
+        )
+
+    @classmethod
+    def requeue_expired(cls) -> int:
+        """
+            - puts PROCESSING tasks whose lease has run out (i.e their worker crashed
+            or got killed) back in the queue. Returns the number of requeued tasks.
+        """
+        requeued = cls.objects.filter(
+            state=cls.PROCESSING, lease_expires_at__lt=timezone.now()
+        ).update(state=cls.QUEUED, owner='', lease_expires_at=None)
+        metrics.REQUEUED.inc(requeued, reason='expired')
+        return requeued
+
+    @classmethod
+    def queue_depth(cls) -> dict:
+        """
+            - returns the number of unfinished (QUEUED, PROCESSING) and DEAD tasks as
+            {(state, priority): count}, see `home.metrics`.
+        """
+        rows = cls.objects.filter(
+            state__in=[cls.QUEUED, cls.PROCESSING, cls.DEAD]
+        ).values_list('state', 'priority').annotate(count=models.Count('pk')).order_by()
+        return {
+            (cls.STATE_CHOICES[state], cls.PRIORITY_CHOICES[priority]): count
+            for state, priority, count in rows
+        }
+
 
 
 #___________________________________________derived models____________________________________________
@@ -102,6 +514,20 @@ class SendInviteTask(Task):
     )
     result = None
     TASK_FUNCTION_ID = 1
+    RELATED_FIELDS = ('invite',)
+
+    HOME_LINK = 'http://127.0.0.1:8000'
+    CONTACT = "codeconnectcuj@mail.edu"
+
+    # the invitation mail, only {link} and {email} differ between recipients
+    HTML_TEMPLATE = PrerenderedTemplate(
+        'home/invitation_mail.html', fields=('link', 'email'),
+        context={'home_link': HOME_LINK, 'contact': CONTACT},
+    )
+    TEXT_TEMPLATE = PrerenderedTemplate(
+        'home/invitation_mail.txt', fields=('link', 'email'),
+        context={'home_link': HOME_LINK, 'contact': CONTACT}, autoescape=False,
+    )
 
     #_____________________________instance methods______________________________
 
@@ -111,36 +537,207 @@ class SendInviteTask(Task):
         # call the real save() method
         super(SendInviteTask, self).save(*args, **kwargs)
 
-    def send(self) -> None:
-        """ Sends the invitation email for the referenced {invite} """
+    def build_message(self) -> EmailMultiAlternatives:
+        """ Builds the invitation email for the referenced {invite} """
 
         if not self.invite:
             raise ValueError("Invite is set to null.")
-        
+
         invite = self.invite
         email = invite.mail_address
-        home_link = f'http://127.0.0.1:8000'
-        link = f'{home_link}/members/registration/?i={invite.code}'
-        contact = "codeconnectcuj@mail.edu"
+        link = f'{self.HOME_LINK}/members/registration/?i={invite.code}'
 
-        # send customized html email
-        html_message = render_to_string('home/invitation_mail.html', context={'link': link, 'home_link': home_link, 'email': email, 'contact': contact})
-        send_mail(
+        # customized html email, with a plain text version written for it
+        html_message = self.HTML_TEMPLATE.render(link=link, email=email)
+        message = EmailMultiAlternatives(
             subject = f"Mail from Code Connect!",
-            message = strip_tags(html_message),
+            body = self.TEXT_TEMPLATE.render(link=link, email=email),
             from_email = settings.EMAIL_HOST_USER,
-            recipient_list = [f'{email}'],
-            fail_silently = False,
-            html_message=html_message
+            to = [f'{email}'],
         )
+        message.attach_alternative(html_message, "text/html")
+        return message
+
+    def send(self, pool=None) -> None:
+        """
+            Sends the invitation email for the referenced {invite}. If a
+            ConnectionPool (see `home.mail`) is passed, the mail is sent over
+            one of its connections instead of opening a new one.
+        """
+
+        message = self.build_message()
+        if pool:
+            pool.send(message)
+        else:
+            message.send(fail_silently=False)
+
+        # now update the invite object
+        invite = self.invite
+        invite.sent_at = timezone.now()
+        invite.save(update_fields=['sent_at'])
+
+    async def asend(self, pool) -> None:
+        """
+            async version of send(), for `run_tasks --async`. The mail is sent
+            through {pool}, an async pool returned by `home.mail.get_async_pool()`.
+        """
+
+        message = self.build_message()
+        await pool.send(message)
 
         # now update the invite object
+        invite = self.invite
         invite.sent_at = timezone.now()
-        invite.full_clean()
-        invite.save()
+        await invite.asave(update_fields=['sent_at'])
+
+    def archive_data(self) -> dict:
+        return {
+            'invite_id': self.invite_id,
+            'mail_address': self.invite.mail_address if self.invite else None,
+        }
 
     def __str__(self) -> None:
         if self.invite:
             return f"Task: Send mail to {self.invite.mail_address} [State: {self.STATE_CHOICES[self.state]}]"
         else:
-            return super(SendInviteTask, self).__str__()
\ No newline at end of file
+            return super(SendInviteTask, self).__str__()
+
+
+
+class ImportInvitesTask(Task):
+    """
+        - task responsible for a bulk invite submitted through the invite page.
+        Creates the Invitations of its {job} (see InviteImportJob.run()).
+    """
+
+    #_________________________________fields___________________________________
+
+    job = models.ForeignKey(
+        "members.InviteImportJob",
+        on_delete=models.CASCADE,
+    )
+    TASK_FUNCTION_ID = 2
+    RELATED_FIELDS = ('job',)
+
+    #_____________________________instance methods______________________________
+
+    def save(self, *args, **kwargs):
+        """ Custom save. Sets {task_function_id} """
+        self.task_function_id = self.TASK_FUNCTION_ID
+        # call the real save() method
+        super(ImportInvitesTask, self).save(*args, **kwargs)
+
+    def archive_data(self) -> dict:
+        return {
+            'job_id': self.job_id,
+        }
+
+
+
+#___________________________________________archive model____________________________________________
+
+class ArchivedTask(models.Model):
+    """
+        - compact copy of a FINISHED or ABORTED Task that was moved out of the live
+        queue table by `manage.py archive_tasks` (see Task.archive_completed()).
+
+        *   data: type specific fields of the task, eg. the invite of a SendInviteTask.
+    """
+
+    #_____________________________fields________________________________
+
+    task_id = models.BigIntegerField(db_index=True)
+    name = models.CharField(max_length=255)
+    task_function_id = models.PositiveSmallIntegerField()
+    state = models.CharField(max_length=1, choices=Task.STATE_CHOICES)
+    arrival = models.DateTimeField()
+    exit = models.DateTimeField(blank=True, null=True)
+    data = models.JSONField(default=dict, blank=True)
+    archived_at = models.DateTimeField(auto_now_add=True)
+
+    #_____________________________instance methods______________________
+
+    def __str__(self) -> str:
+        return f"Archived Task: {self.name} [State: {Task.STATE_CHOICES[self.state]}]"
+
+
+
+#___________________________________________worker model____________________________________________
+
+class WorkerHeartbeat(models.Model):
+    """
+        - a running `run_tasks` worker. Each worker updates {last_seen} every
+        TASK_HEARTBEAT_INTERVAL seconds, and deletes its row when it stops.
+
+        *   a worker silent for TASK_HEARTBEAT_TIMEOUT seconds is dead (killed, host
+            crashed..). Any other worker, or `manage.py workers --requeue-dead`, then
+            puts its PROCESSING tasks back in the queue (see requeue_dead()).
+    """
+
+    #_____________________________choices______________________________
+
+    RUNNING = 'R'
+    DRAINING = 'D'  # stopping, finishing its in-flight tasks
+
+    STATE_CHOICES = {
+        RUNNING: 'RUNNING',
+        DRAINING: 'DRAINING',
+    }
+
+    #_____________________________fields________________________________
+
+    owner = models.CharField(max_length=255, unique=True)  # same as Task.owner
+    hostname = models.CharField(max_length=255)
+    pid = models.PositiveIntegerField()
+    state = models.CharField(max_length=1, choices=STATE_CHOICES, default=RUNNING)
+    started_at = models.DateTimeField(auto_now_add=True)
+    last_seen = models.DateTimeField(default=timezone.now, db_index=True)
+
+    #_____________________________instance methods______________________
+
+    def is_alive(self) -> bool:
+        """ returns True if the worker sent a heartbeat recently """
+        return timezone.now() - self.last_seen < self.timeout()
+
+    def __str__(self) -> str:
+        return f"Worker: {self.owner} [State: {self.STATE_CHOICES[self.state]}]"
+
+    #_____________________________class methods______________________
+
+    @classmethod
+    def timeout(cls) -> timedelta:
+        return timedelta(seconds=settings.TASK_HEARTBEAT_TIMEOUT)
+
+    @classmethod
+    def beat(cls, owner: str, lease: timedelta = Task.DEFAULT_LEASE, state: str = RUNNING, **fields) -> None:
+        """
+            - records that the worker {owner} is alive, and renews the leases of the
+            tasks it is executing, so long tasks don't get requeued under it.
+        """
+        cls.objects.update_or_create(
+            owner=owner, defaults={'last_seen': timezone.now(), 'state': state, **fields}
+        )
+        Task.renew_leases(owner, lease)
+
+    @classmethod
+    def stop(cls, owner: str) -> None:
+        """ called by a worker that exits cleanly """
+        cls.objects.filter(owner=owner).delete()
+
+    @classmethod
+    def requeue_dead(cls) -> int:
+        """
+            - puts the PROCESSING tasks of dead workers back in the queue and forgets
+            about these workers. Returns the number of requeued tasks.
+        """
+        dead = list(cls.objects.filter(
+            last_seen__lt=timezone.now() - cls.timeout()
+        ).values_list('owner', flat=True))
+        if not dead:
+            return 0
+        requeued = Task.objects.filter(state=Task.PROCESSING, owner__in=dead).update(
+            state=Task.QUEUED, owner='', lease_expires_at=None
+        )
+        cls.objects.filter(owner__in=dead, last_seen__lt=timezone.now() - cls.timeout()).delete()
+        metrics.REQUEUED.inc(requeued, reason='dead_worker')
+        return requeued
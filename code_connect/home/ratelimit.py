@@ -0,0 +1,165 @@
+#_____________________________________________________________________________________________________
+"""
+    - rate limiter for outgoing mail, shared by all the `run_tasks` workers on a host.
+
+    Mail providers throttle (and eventually block) accounts that send too fast or too
+    much in a day, eg. Gmail allows 500 (2000 for Workspace) mails a day. Workers ask the
+    limiter before every mail and wait for their turn instead of getting rejected.
+
+    The daily cap (EMAIL_DAILY_LIMIT) is off by default, set it to the quota of the account.
+"""
+
+__author__ = "Tejaswin Singh, "
+__copyright__ = "Copyright 2024, Code Connect Home"
+__credits__ = ["Tejaswin Singh", "", ]
+__license__ = "GPL"
+__version__ = "1.0.0"
+__maintainer__ = "Tejaswin Singh"
+__email__ = "tejaswin.cs08@gmail.com"
+__status__ = "Development"
+
+#______________________________________________imports_________________________________________________
+
+from django.conf import settings
+from django.core.mail.backends.smtp import EmailBackend as SMTPEmailBackend
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from contextlib import contextmanager
+from datetime import datetime, time as dt_time, timedelta
+from time import sleep, time
+import json
+import os
+import tempfile
+import threading
+
+try:
+    import fcntl
+except ImportError:     # not available on Windows, the limit is then per process
+    fcntl = None
+
+
+#___________________________________________exceptions________________________________________________
+
+class DailyLimitReached(Exception):
+    """ raised when the daily mail budget is spent. Mails can be sent again at {retry_at}. """
+
+    def __init__(self, retry_at: datetime):
+        super().__init__(f"Daily mail limit reached, retry at {retry_at}")
+        self.retry_at = retry_at
+
+
+#___________________________________________rate limiter________________________________________________
+
+class RateLimiter:
+    """
+        - token bucket allowing {rate} mails per second (bursts of up to {burst} mails),
+        and at most {daily_limit} mails per (local) day.
+
+        *   the bucket lives in the JSON file at {path}, locked with flock() while it
+            is updated, so every process on the host shares it and restarting the
+            workers doesn't reset the daily budget.
+        *   a caller reserves its mail right away and is told how long to wait for it.
+            The bucket goes below zero meanwhile, so concurrent callers queue up behind
+            each other instead of all sending at once.
+    """
+
+    def __init__(self, rate: float, burst: int, daily_limit: int, path: str):
+        self.rate = rate
+        self.burst = burst
+        self.daily_limit = daily_limit
+        self.path = str(path)
+        self._lock = threading.Lock()
+
+    #_____________________________instance methods______________________
+
+    def acquire(self) -> None:
+        """
+            - blocks until one more mail may be sent. Raises DailyLimitReached
+            if today's budget is spent.
+        """
+        wait = self.reserve()
+        if wait > 0:
+            sleep(wait)
+
+    def reserve(self) -> float:
+        """
+            - reserves one mail, returns the seconds to wait before sending it.
+            Raises DailyLimitReached if today's budget is spent.
+        """
+        with self._locked_state() as state:
+            now = time()
+            today = timezone.localdate().isoformat()
+            if state.get('day') != today:
+                state['day'] = today
+                state['sent'] = 0
+            if self.daily_limit and state['sent'] >= self.daily_limit:
+                raise DailyLimitReached(self.next_day())
+
+            # refill the bucket for the time elapsed since the last update
+            tokens = state.get('tokens', self.burst)
+            elapsed = max(0.0, now - state.get('updated', now))
+            tokens = min(self.burst, tokens + elapsed * self.rate) - 1
+
+            state.update(tokens=tokens, updated=now, sent=state['sent'] + 1)
+            return max(0.0, -tokens / self.rate)
+
+    def next_day(self) -> datetime:
+        """ start of the next (local) day, when the daily budget is reset """
+        tomorrow = timezone.localdate() + timedelta(days=1)
+        return timezone.make_aware(datetime.combine(tomorrow, dt_time.min))
+
+    #_____________________________helpers________________________________
+
+    @contextmanager
+    def _locked_state(self):
+        """ yields the state dict, written back to {path} afterwards """
+        with self._lock:
+            os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+            with open(self.path, 'a+') as file:
+                if fcntl:
+                    fcntl.flock(file, fcntl.LOCK_EX)
+                file.seek(0)
+                try:
+                    state = json.loads(file.read() or '{}')
+                except ValueError:
+                    state = {}      # corrupted file, start over
+                try:
+                    yield state
+                finally:
+                    file.seek(0)
+                    file.truncate()
+                    file.write(json.dumps(state))
+                    file.flush()
+                    # closing the file releases the flock
+
+
+#___________________________________________utilities________________________________________________
+
+_limiter = None
+
+def get_state_file() -> str:
+    """ default EMAIL_RATE_STATE_FILE, runtime state kept out of the source tree """
+    return os.path.join(tempfile.gettempdir(), "code_connect_mail_rate_limit.json")
+
+def get_limiter() -> RateLimiter | None:
+    """
+        - returns the process-wide rate limiter configured by the EMAIL_RATE_* settings.
+
+        *   None if EMAIL_RATE_LIMIT is not set, or if mails don't go out over SMTP
+            (eg. the locmem backend of the test runner), as the provider's limits
+            don't apply then.
+    """
+    global _limiter
+    if not settings.EMAIL_RATE_LIMIT:
+        return None
+    if not issubclass(import_string(settings.EMAIL_BACKEND), SMTPEmailBackend):
+        return None
+    if _limiter is None:
+        _limiter = RateLimiter(
+            settings.EMAIL_RATE_LIMIT,
+            settings.EMAIL_RATE_BURST,
+            settings.EMAIL_DAILY_LIMIT,
+            settings.EMAIL_RATE_STATE_FILE or get_state_file(),
+        )
+    return _limiter
@@ -0,0 +1,77 @@
+#_____________________________________________________________________________________________________
+"""
+    - renders templates whose output only differs in a few values between calls, eg. the
+    invitation mail, which is the same for every recipient except for their link and address.
+
+    Rendering a template walks its whole node tree every time. Instead, a PrerenderedTemplate
+    is rendered once with placeholders in place of the varying values, and every call then
+    only joins the prerendered text with the (escaped) values.
+"""
+
+__author__ = "Tejaswin Singh, "
+__copyright__ = "Copyright 2024, Code Connect Home"
+__credits__ = ["Tejaswin Singh", "", ]
+__license__ = "GPL"
+__version__ = "1.0.0"
+__maintainer__ = "Tejaswin Singh"
+__email__ = "tejaswin.cs08@gmail.com"
+__status__ = "Development"
+
+#______________________________________________imports_________________________________________________
+
+from django.template.loader import get_template
+from django.utils.html import conditional_escape
+
+from uuid import uuid4
+import re
+import threading
+
+
+#___________________________________________templates________________________________________________
+
+class PrerenderedTemplate:
+    """
+        - template {name} rendered once with the fixed {context}, to be completed with
+        the values of {fields} on every render().
+
+        *   the {fields} must be output as they are by the template, eg. `{{ link }}`.
+            A field that goes through a filter (`{{ link|upper }}`) wouldn't be found
+            in the output, so the template is then rendered in full on every call.
+        *   values are escaped like the template would, if {autoescape} is on (html).
+        *   prerendering happens on first use, and once per process.
+    """
+
+    def __init__(self, name: str, fields: tuple, context: dict = None, autoescape: bool = True):
+        self.name = name
+        self.fields = tuple(fields)
+        self.context = dict(context or {})
+        self.autoescape = autoescape
+        self._parts = None  # prerendered text and field names, alternating
+        self._lock = threading.Lock()
+
+    def render(self, **values) -> str:
+        """ returns the template rendered with {values} for its {fields} """
+        parts = self._parts or self._prerender()
+        if parts is False:
+            return get_template(self.name).render({**self.context, **values})
+        escape = conditional_escape if self.autoescape else str
+        return "".join(
+            part if i % 2 == 0 else escape(values[part]) for i, part in enumerate(parts)
+        )
+
+    def _prerender(self):
+        with self._lock:
+            if self._parts is None:
+                # placeholders, unique enough not to be found in the template itself
+                markers = {field: f"prerendered{uuid4().hex}{field}" for field in self.fields}
+                text = get_template(self.name).render({**self.context, **markers})
+                if all(marker in text for marker in markers.values()):
+                    pattern = "(" + "|".join(re.escape(marker) for marker in markers.values()) + ")"
+                    fields = {marker: field for field, marker in markers.items()}
+                    self._parts = [
+                        part if i % 2 == 0 else fields[part]
+                        for i, part in enumerate(re.split(pattern, text))
+                    ]
+                else:
+                    self._parts = False
+            return self._parts
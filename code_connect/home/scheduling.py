@@ -0,0 +1,46 @@
+#_____________________________________________________________________________________________________
+"""
+    - fair-share scheduling of the priority lanes of the task queue.
+
+    Always claiming the highest priority first would let a steady stream of interactive
+    tasks starve the bulk ones forever. Instead every lane gets a share of the claims
+    proportional to its weight (see Task.PRIORITY_WEIGHTS), and an empty lane gives its
+    turn away to the others.
+"""
+
+__author__ = "Tejaswin Singh, "
+__copyright__ = "Copyright 2024, Code Connect Home"
+__credits__ = ["Tejaswin Singh", "", ]
+__license__ = "GPL"
+__version__ = "1.0.0"
+__maintainer__ = "Tejaswin Singh"
+__email__ = "tejaswin.cs08@gmail.com"
+__status__ = "Development"
+
+
+#___________________________________________scheduler________________________________________________
+
+class FairShare:
+    """
+        - smooth weighted round robin over the lanes in {weights} (lane -> weight).
+
+        *   with weights {0: 8, 1: 4, 2: 1}, out of every 13 claims lane 0 goes first
+            8 times, lane 1 4 times and lane 2 once, spread out evenly.
+        *   each worker keeps its own FairShare, no state is shared through the db.
+    """
+
+    def __init__(self, weights: dict):
+        self.weights = weights
+        self.total = sum(weights.values())
+        self.current = {lane: 0 for lane in weights}
+
+    def order(self) -> list:
+        """
+            - returns the lanes in the order they should be tried for the next claim:
+            the lane whose turn it is, then the others by priority (lowest first).
+        """
+        for lane, weight in self.weights.items():
+            self.current[lane] += weight
+        first = max(self.current, key=lambda lane: (self.current[lane], -lane))
+        self.current[first] -= self.total
+        return [first] + sorted(lane for lane in self.weights if lane != first)
@@ -0,0 +1,154 @@
+#_____________________________________________________________________________________________________
+"""
+    - defines tests for `run_tasks --async` (see `home/management/commands/_async.py`).
+"""
+
+__author__ = "Tejaswin Singh, "
+__copyright__ = "Copyright 2024, Code Connect Home"
+__credits__ = ["Tejaswin Singh", "", ]
+__license__ = "GPL"
+__version__ = "1.0.0"
+__maintainer__ = "Tejaswin Singh"
+__email__ = "tejaswin.cs08@gmail.com"
+__status__ = "Development"
+
+#______________________________________________imports_________________________________________________
+
+from django.test import TransactionTestCase, SimpleTestCase, override_settings
+from django.core import mail
+from django.core.mail import EmailMessage
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from asgiref.sync import async_to_sync
+
+from home.models import Task
+from home.mail import AsyncConnectionPool, load_aiosmtplib, is_transient
+from home.management.commands._async import execute_tasks_async
+from home.management.commands._smtp_sink import SMTPSink
+from members.models import Invitation
+
+from io import StringIO
+from unittest import mock
+import signal
+import threading
+import unittest
+
+aiosmtplib = load_aiosmtplib()
+
+
+class ExecuteTasksAsyncTests(TransactionTestCase):
+    """
+        - tests for execute_tasks_async(). A TransactionTestCase, since sync tasks
+        run in other threads (with their own db connection).
+    """
+
+    #_______________________utilities_________________________
+
+    def create_simple_invitation(self, mail_address):
+        i = Invitation(mail_address=mail_address)
+        i.full_clean()
+        i.save()    # also queues a SendInviteTask
+        return i
+
+    def create_cmd(self):
+        return BaseCommand(stdout=StringIO(), stderr=StringIO())
+
+    #_______________________tests______________________________
+
+    def test_async_and_sync_tasks(self):
+        """
+            - tests that invites are sent from the event loop and that other tasks
+            run their TASK_TABLE function
+        """
+        invites = [self.create_simple_invitation(f"async{i}@mail.dev") for i in range(3)]
+        Task(name="hello").save()
+        tasks = Task.claim_tasks(owner="worker", limit=10)
+        self.assertEqual(len(tasks), 4)
+
+        cmd = self.create_cmd()
+        async_to_sync(execute_tasks_async)(cmd, tasks)
+
+        self.assertEqual(len(mail.outbox), 3)
+        self.assertEqual(Task.objects.filter(state=Task.FINISHED).count(), 4)
+        for i in invites:
+            i.refresh_from_db()
+            self.assertNotEqual(i.sent_at, None)
+        self.assertIn("hello world hello", cmd.stderr.getvalue())
+
+    def test_failure_aborts_task(self):
+        """
+            - tests that an invite that can't be built only aborts its own task
+        """
+        self.create_simple_invitation("kept@mail.dev")
+        self.create_simple_invitation("deleted@mail.dev").delete()
+        tasks = Task.claim_tasks(owner="worker", limit=10)
+
+        async_to_sync(execute_tasks_async)(self.create_cmd(), tasks)
+
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(Task.objects.filter(state=Task.FINISHED).count(), 1)
+        self.assertEqual(Task.objects.filter(state=Task.ABORTED).count(), 1)
+
+
+class AsyncWorkerTests(TransactionTestCase):
+    """ tests for the startup of `run_tasks --async` """
+
+    #_______________________utilities_________________________
+
+    def tearDown(self):
+        signal.signal(signal.SIGTERM, signal.SIG_DFL)
+        signal.signal(signal.SIGINT, signal.default_int_handler)
+
+    #_______________________tests______________________________
+
+    def test_warns_without_aiosmtplib(self):
+        """
+            - tests that the worker warns that it falls back to a thread pool when
+            aiosmtplib is not installed, and only then
+        """
+        for module, warned in ((None, True), (object(), False)):
+            stderr = StringIO()
+            with mock.patch("home.management.commands.run_tasks.load_aiosmtplib", return_value=module):
+                call_command("run_tasks", "--async", "--exit-when-empty", stderr=stderr)
+            self.assertEqual("aiosmtplib is not installed" in stderr.getvalue(), warned)
+
+
+@unittest.skipUnless(aiosmtplib, "aiosmtplib is not installed")
+class AsyncConnectionPoolTests(SimpleTestCase):
+    """ tests for AsyncConnectionPool """
+
+    def test_errors_translated(self):
+        """
+            - tests that aiosmtplib errors are classified like their smtplib counterparts
+        """
+        translate = AsyncConnectionPool._translate
+        self.assertTrue(is_transient(translate(aiosmtplib.SMTPServerDisconnected("gone"))))
+        self.assertTrue(is_transient(translate(aiosmtplib.SMTPResponseException(421, "Try again later"))))
+        self.assertFalse(is_transient(translate(aiosmtplib.SMTPResponseException(554, "Rejected"))))
+
+    def test_limiter_off_event_loop(self):
+        """
+            - tests that the rate limiter, which blocks on a file lock, isn't called on
+            the event loop
+        """
+        threads = {}
+
+        class Limiter:
+            def reserve(self):
+                threads['limiter'] = threading.get_ident()
+                return 0.0
+
+        async def send():
+            threads['loop'] = threading.get_ident()
+            pool = AsyncConnectionPool(size=1, limiter=Limiter())
+            await pool.send(EmailMessage("subject", "body", "from@mail.dev", ["to@mail.dev"]))
+            await pool.close_all()
+
+        sink = SMTPSink()
+        with sink, override_settings(
+            EMAIL_HOST=sink.server_address[0], EMAIL_PORT=sink.port,
+            EMAIL_USE_TLS=False, EMAIL_USE_SSL=False, EMAIL_HOST_PASSWORD='',
+        ):
+            async_to_sync(send)()
+        self.assertEqual(sink.received, 1)
+        self.assertNotEqual(threads['limiter'], threads['loop'])
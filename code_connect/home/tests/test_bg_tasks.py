@@ -0,0 +1,205 @@
+#_____________________________________________________________________________________________________
+"""
+    - defines tests for the functions executed by `manage.py run_tasks`.
+"""
+
+__author__ = "Tejaswin Singh, "
+__copyright__ = "Copyright 2024, Code Connect Home"
+__credits__ = ["Tejaswin Singh", "", ]
+__license__ = "GPL"
+__version__ = "1.0.0"
+__maintainer__ = "Tejaswin Singh"
+__email__ = "tejaswin.cs08@gmail.com"
+__status__ = "Development"
+
+#______________________________________________imports_________________________________________________
+
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.db import connection, OperationalError
+from django.core import mail
+from django.core.management.base import BaseCommand
+
+from home.models import Task, SendInviteTask, ImportInvitesTask
+from home.mail import ConnectionPool
+from home.ratelimit import RateLimiter
+from home.management.commands._bg_tasks import execute_tasks
+from members.models import Invitation, InviteImportJob
+
+from io import StringIO
+from smtplib import SMTPDataError
+from unittest import mock
+import os
+import socket
+import tempfile
+
+
+class SendInvitesBatchTests(TestCase):
+    """ tests for the batch execution of SendInviteTask(s) """
+
+    #_______________________utilities_________________________
+
+    def create_simple_invitation(self, mail_address):
+        i = Invitation(mail_address=mail_address)
+        i.full_clean()
+        i.save()    # also queues a SendInviteTask
+        return i
+
+    def create_cmd(self):
+        return BaseCommand(stdout=StringIO(), stderr=StringIO())
+
+    #_______________________tests______________________________
+
+    def test_batch_sent(self):
+        """
+            - tests that all the claimed invites are sent and their tasks and
+            invitations updated
+        """
+        invites = [self.create_simple_invitation(f"batch{i}@mail.dev") for i in range(3)]
+        tasks = Task.claim_tasks(owner="worker", limit=10)
+        self.assertEqual(len(tasks), 3)
+
+        execute_tasks(self.create_cmd(), tasks)
+
+        self.assertEqual(len(mail.outbox), 3)
+        self.assertEqual(
+            Task.objects.filter(state=Task.FINISHED, exit__isnull=False).count(), 3
+        )
+        for i in invites:
+            i.refresh_from_db()
+            self.assertNotEqual(i.sent_at, None)
+
+    def test_failure_aborts_only_affected_task(self):
+        """
+            - tests that an invite that can't be sent only aborts its own task
+        """
+        self.create_simple_invitation("ok1@mail.dev")
+        deleted = self.create_simple_invitation("deleted@mail.dev")
+        self.create_simple_invitation("ok2@mail.dev")
+        deleted_task = SendInviteTask.objects.get(invite=deleted)
+        deleted.delete()    # send() now raises "Invite is set to null."
+
+        execute_tasks(self.create_cmd(), Task.claim_tasks(owner="worker", limit=10))
+
+        self.assertEqual(len(mail.outbox), 2)
+        self.assertEqual(Task.objects.get(pk=deleted_task.pk).state, Task.ABORTED)
+        self.assertEqual(Task.objects.filter(state=Task.FINISHED).count(), 2)
+
+    def test_claimed_tasks_are_concrete(self):
+        """
+            - tests that claimed invite tasks come back as SendInviteTask(s) with their
+            invite already fetched, so no further queries are needed to send them
+        """
+        for i in range(3):
+            self.create_simple_invitation(f"typed{i}@mail.dev")
+        with self.assertNumQueries(3):  # select + conditional update + typed fetch
+            tasks = Task.claim_tasks(owner="worker", limit=10)
+        with self.assertNumQueries(0):
+            for task in tasks:
+                self.assertIsInstance(task, SendInviteTask)
+                task.invite.mail_address
+
+    def test_batch_queries_constant(self):
+        """
+            - tests that the number of queries taken by a batch doesn't grow with its size
+        """
+        def count_queries(size, prefix):
+            for i in range(size):
+                self.create_simple_invitation(f"{prefix}{i}@mail.dev")
+            tasks = Task.claim_tasks(owner="worker", limit=size)
+            with CaptureQueriesContext(connection) as ctx:
+                execute_tasks(self.create_cmd(), tasks)
+            return len(ctx.captured_queries)
+
+        self.assertEqual(count_queries(2, "small"), count_queries(8, "large"))
+
+    def test_transient_failure_retried(self):
+        """
+            - tests that invites rejected with a transient error are requeued for a
+            later retry, instead of being aborted
+        """
+        self.create_simple_invitation("throttled@mail.dev")
+        self.create_simple_invitation("throttled2@mail.dev")
+        pool = ConnectionPool(max_messages=100)
+        with mock.patch.object(pool, "send_many", return_value=[SMTPDataError(421, b"4.7.0 Try again later")] * 2), \
+                mock.patch("home.management.commands._bg_tasks.get_pool", return_value=pool):
+            execute_tasks(self.create_cmd(), Task.claim_tasks(owner="worker", limit=10))
+
+        for task in Task.objects.all():
+            self.assertEqual(task.state, Task.QUEUED)
+            self.assertEqual(task.attempts, 1)
+            self.assertNotEqual(task.run_at, None)
+        self.assertEqual(Invitation.objects.filter(sent_at__isnull=False).count(), 0)
+
+    def test_daily_limit_defers_tasks(self):
+        """
+            - tests that once the daily mail budget is spent, the remaining invites are
+            put off until the next day without counting as an attempt
+        """
+        for i in range(3):
+            self.create_simple_invitation(f"limited{i}@mail.dev")
+        with tempfile.TemporaryDirectory() as tmp:
+            limiter = RateLimiter(rate=1000, burst=10, daily_limit=2, path=os.path.join(tmp, "rate.json"))
+            pool = ConnectionPool(max_messages=100, limiter=limiter)
+            with mock.patch("home.management.commands._bg_tasks.get_pool", return_value=pool):
+                execute_tasks(self.create_cmd(), Task.claim_tasks(owner="worker", limit=10))
+
+        self.assertEqual(len(mail.outbox), 2)
+        deferred = Task.objects.get(state=Task.QUEUED)
+        self.assertEqual(deferred.attempts, 0)
+        self.assertEqual(deferred.run_at, limiter.next_day())
+        self.assertEqual(Task.objects.filter(state=Task.FINISHED).count(), 2)
+
+    def test_connection_failure_retried(self):
+        """
+            - tests that if the batch's connection can't be opened, its invites are
+            retried later like any transient failure, instead of being aborted
+        """
+        for i in range(3):
+            self.create_simple_invitation(f"refused{i}@mail.dev")
+        # a port nothing listens on
+        with socket.socket() as s:
+            s.bind(("127.0.0.1", 0))
+            port = s.getsockname()[1]
+        with override_settings(EMAIL_HOST="127.0.0.1", EMAIL_PORT=port, EMAIL_USE_TLS=False, EMAIL_USE_SSL=False):
+            pool = ConnectionPool(max_messages=100, backend='django.core.mail.backends.smtp.EmailBackend')
+            with mock.patch("home.management.commands._bg_tasks.get_pool", return_value=pool):
+                execute_tasks(self.create_cmd(), Task.claim_tasks(owner="worker", limit=10))
+
+        self.assertEqual(Task.objects.count(), 3)
+        for task in Task.objects.all():
+            self.assertEqual(task.state, Task.QUEUED)
+            self.assertEqual(task.attempts, 1)
+
+    def test_sent_tasks_not_aborted(self):
+        """
+            - tests that once the mails of a batch are sent, a db error while updating their
+            invitations doesn't abort their tasks
+        """
+        for i in range(2):
+            self.create_simple_invitation(f"sent{i}@mail.dev")
+        tasks = Task.claim_tasks(owner="worker", limit=10)
+        with mock.patch.object(Invitation.objects, "filter", side_effect=OperationalError("database is locked")):
+            execute_tasks(self.create_cmd(), tasks)
+
+        self.assertEqual(len(mail.outbox), 2)
+        self.assertEqual(Task.objects.filter(state=Task.FINISHED).count(), 2)
+
+
+class ImportInvitesTaskTests(TestCase):
+    """ tests for the execution of ImportInvitesTask(s) """
+
+    def test_import_invites(self):
+        """
+            - tests that a claimed import task runs its job, and queues the invites
+        """
+        job = InviteImportJob.enqueue({"import1@mail.dev", "import2@mail.dev"})
+        tasks = Task.claim_tasks(owner="worker", limit=10)
+        self.assertEqual([t.task_function_id for t in tasks], [ImportInvitesTask.TASK_FUNCTION_ID])
+
+        execute_tasks(BaseCommand(stdout=StringIO(), stderr=StringIO()), tasks)
+
+        job.refresh_from_db()
+        self.assertEqual(job.state, job.DONE)
+        self.assertEqual(Task.objects.get(pk=tasks[0].pk).state, Task.FINISHED)
+        self.assertEqual(SendInviteTask.objects.filter(state=Task.QUEUED).count(), 2)
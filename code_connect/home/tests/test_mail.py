@@ -0,0 +1,135 @@
+#_____________________________________________________________________________________________________
+"""
+    - defines tests for `home.mail`.
+"""
+
+__author__ = "Tejaswin Singh, "
+__copyright__ = "Copyright 2024, Code Connect Home"
+__credits__ = ["Tejaswin Singh", "", ]
+__license__ = "GPL"
+__version__ = "1.0.0"
+__maintainer__ = "Tejaswin Singh"
+__email__ = "tejaswin.cs08@gmail.com"
+__status__ = "Development"
+
+#______________________________________________imports_________________________________________________
+
+from django.test import SimpleTestCase, override_settings
+from django.core.mail import EmailMessage
+from django.core.mail.backends.base import BaseEmailBackend
+
+from home.mail import ConnectionPool, is_transient
+from home.management.commands._smtp_sink import SMTPSink
+
+from smtplib import SMTPServerDisconnected, SMTPDataError, SMTPRecipientsRefused
+
+
+#______________________________________________fake backends_________________________________________________
+
+class CountingBackend(BaseEmailBackend):
+    """ records how often connections are opened and mails are sent """
+
+    opened = 0
+    sent = 0
+    # number of upcoming sends that fail as if the server hung up
+    disconnects = 0
+
+    def open(self):
+        CountingBackend.opened += 1
+
+    def send_messages(self, messages):
+        if CountingBackend.disconnects:
+            CountingBackend.disconnects -= 1
+            raise SMTPServerDisconnected("Connection unexpectedly closed")
+        CountingBackend.sent += len(messages)
+        return len(messages)
+
+
+class ConnectionPoolTests(SimpleTestCase):
+    """ tests for ConnectionPool """
+
+    BACKEND = f"{__name__}.CountingBackend"
+
+    #_______________________utilities_________________________
+
+    def setUp(self):
+        CountingBackend.opened = 0
+        CountingBackend.sent = 0
+        CountingBackend.disconnects = 0
+
+    def create_message(self):
+        return EmailMessage("subject", "body", "from@mail.dev", ["to@mail.dev"])
+
+    #_______________________tests______________________________
+
+    def test_connection_reused(self):
+        """
+            - tests that consecutive mails are sent over the same connection
+        """
+        pool = ConnectionPool(max_messages=100, backend=self.BACKEND)
+        for _ in range(5):
+            pool.send(self.create_message())
+        self.assertEqual(CountingBackend.sent, 5)
+        self.assertEqual(CountingBackend.opened, 1)
+
+    def test_connection_recycled(self):
+        """
+            - tests that a connection is reopened after {max_messages} mails
+        """
+        pool = ConnectionPool(max_messages=2, backend=self.BACKEND)
+        for _ in range(5):
+            pool.send(self.create_message())
+        self.assertEqual(CountingBackend.sent, 5)
+        self.assertEqual(CountingBackend.opened, 3)
+
+    def test_reconnect_on_disconnect(self):
+        """
+            - tests that a mail is sent again over a new connection if the server
+            dropped the pooled one
+        """
+        pool = ConnectionPool(max_messages=100, backend=self.BACKEND)
+        pool.send(self.create_message())
+        CountingBackend.disconnects = 1
+        pool.send(self.create_message())
+        self.assertEqual(CountingBackend.sent, 2)
+        self.assertEqual(CountingBackend.opened, 2)
+
+    def test_smtp_sink(self):
+        """
+            - tests sending mails over SMTP to the sink used by `bench_invites`,
+            including mails it rejects
+        """
+        sink = SMTPSink()
+        with sink, override_settings(
+            EMAIL_HOST=sink.server_address[0], EMAIL_PORT=sink.port,
+            EMAIL_USE_TLS=False, EMAIL_USE_SSL=False, EMAIL_HOST_PASSWORD='',
+        ):
+            pool = ConnectionPool(max_messages=100, backend='django.core.mail.backends.smtp.EmailBackend')
+            self.assertEqual(pool.send_many([self.create_message() for _ in range(3)]), [None] * 3)
+            sink.fail_rate = 1
+            errors = pool.send_many([self.create_message()])
+            pool.close_all()
+        self.assertEqual((sink.received, sink.rejected), (4, 1))
+        self.assertIsInstance(errors[0], SMTPDataError)
+        self.assertFalse(is_transient(errors[0]))
+
+
+class IsTransientTests(SimpleTestCase):
+    """ tests for is_transient() """
+
+    def test_transient_errors(self):
+        """
+            - tests that dropped connections and 4xx replies are retried
+        """
+        self.assertTrue(is_transient(SMTPServerDisconnected()))
+        self.assertTrue(is_transient(ConnectionRefusedError()))
+        self.assertTrue(is_transient(SMTPDataError(421, b"4.7.0 Try again later")))
+        self.assertTrue(is_transient(SMTPRecipientsRefused({"a@mail.dev": (450, b"4.2.1 Slow down")})))
+
+    def test_permanent_errors(self):
+        """
+            - tests that 5xx replies and other errors are not retried
+        """
+        self.assertFalse(is_transient(SMTPDataError(554, b"5.7.1 Rejected")))
+        self.assertFalse(is_transient(SMTPRecipientsRefused({"a@mail.dev": (550, b"5.1.1 No such user")})))
+        self.assertFalse(is_transient(ValueError("Invite is set to null.")))
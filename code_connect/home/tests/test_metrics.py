@@ -0,0 +1,136 @@
+#_____________________________________________________________________________________________________
+"""
+    - defines tests for `home.metrics`.
+"""
+
+__author__ = "Tejaswin Singh, "
+__copyright__ = "Copyright 2024, Code Connect Home"
+__credits__ = ["Tejaswin Singh", "", ]
+__license__ = "GPL"
+__version__ = "1.0.0"
+__maintainer__ = "Tejaswin Singh"
+__email__ = "tejaswin.cs08@gmail.com"
+__status__ = "Development"
+
+#______________________________________________imports_________________________________________________
+
+from django.core.management import call_command
+from django.test import SimpleTestCase, TestCase, override_settings
+
+from home import metrics
+from home.models import Task
+
+from io import StringIO
+import math
+import pickle
+import tempfile
+
+
+class MetricsTests(SimpleTestCase):
+    """ tests for the metric types and the exposition format """
+
+    #_______________________utilities_________________________
+
+    def setUp(self):
+        self.registry = metrics.Registry()
+        self.counter = self.registry.register(metrics.Counter("jobs_total", "Jobs.", ("outcome",)))
+        self.histogram = self.registry.register(metrics.Histogram("job_seconds", "Job time.", buckets=(1, 5)))
+
+    #_______________________tests______________________________
+
+    def test_render_parse(self):
+        """
+            - tests that rendered metrics parse back to the same samples
+        """
+        self.counter.inc(outcome='ok')
+        self.counter.inc(2, outcome='say "hi"')
+        for value in (0.5, 3, 3, 10):
+            self.histogram.observe(value)
+
+        samples = {(name, tuple(labels.items())): value for name, labels, value in metrics.parse(self.registry.render())}
+        self.assertEqual(samples[("jobs_total", (("outcome", "ok"),))], 1)
+        self.assertEqual(samples[("jobs_total", (("outcome", 'say "hi"'),))], 2)
+        # buckets are cumulative
+        self.assertEqual(samples[("job_seconds_bucket", (("le", "1"),))], 1)
+        self.assertEqual(samples[("job_seconds_bucket", (("le", "5"),))], 3)
+        self.assertEqual(samples[("job_seconds_bucket", (("le", "+Inf"),))], 4)
+        self.assertEqual(samples[("job_seconds_sum", ())], 16.5)
+        self.assertEqual(samples[("job_seconds_count", ())], 4)
+
+    def test_take_merge(self):
+        """
+            - tests that values taken from a (pool) process are added to another registry
+        """
+        self.counter.inc(outcome='ok')
+        self.histogram.observe(3)
+        snapshot = pickle.loads(pickle.dumps(self.registry.take()))
+        self.assertNotIn("jobs_total", self.registry.render().split("# TYPE jobs_total counter\n")[1])
+
+        self.counter.inc(outcome='ok')
+        self.registry.merge(snapshot)
+        self.registry.merge(snapshot)
+        samples = {(name, tuple(labels.items())): value for name, labels, value in metrics.parse(self.registry.render())}
+        self.assertEqual(samples[("jobs_total", (("outcome", "ok"),))], 3)
+        self.assertEqual(samples[("job_seconds_count", ())], 2)
+
+    def test_histogram_quantile(self):
+        """
+            - tests that quantiles are interpolated inside their bucket
+        """
+        buckets = [(1, 10), (5, 30), (math.inf, 40)]
+        self.assertEqual(metrics.histogram_quantile(0.25, buckets), 1)
+        self.assertEqual(metrics.histogram_quantile(0.5, buckets), 3)
+        # falls in the +Inf bucket
+        self.assertEqual(metrics.histogram_quantile(0.99, buckets), 5)
+        self.assertTrue(math.isnan(metrics.histogram_quantile(0.5, [(1, 0), (math.inf, 0)])))
+
+
+class TaskMetricsTests(TestCase):
+    """ tests for the metrics recorded by Task and `manage.py task_stats` """
+
+    #_______________________utilities_________________________
+
+    def count(self, outcome):
+        return metrics.OUTCOMES._values.get(('0', outcome), 0)
+
+    #_______________________tests______________________________
+
+    def test_outcomes_counted(self):
+        """
+            - tests that finished and aborted tasks are counted
+        """
+        finished, aborted = self.count('finished'), self.count('aborted')
+        tasks = [Task.objects.create(name=f"Task {i}") for i in range(3)]
+        for task in tasks:
+            task.start_task()
+        tasks[0].clear_task()
+        Task.abort_tasks(tasks[1:])
+        self.assertEqual(self.count('finished'), finished + 1)
+        self.assertEqual(self.count('aborted'), aborted + 2)
+
+        self.assertEqual(Task.queue_depth(), {})
+        Task.objects.create(name="Queued", priority=Task.HIGH)
+        self.assertEqual(Task.queue_depth(), {('QUEUED', 'HIGH'): 1})
+
+    def test_task_stats(self):
+        """
+            - tests that task_stats sums up the metrics files of the workers
+        """
+        Task.objects.create(name="Queued")
+        with tempfile.TemporaryDirectory() as tmp:
+            for owner in ("worker-1", "worker-2"):
+                registry = metrics.Registry()
+                registry.register(metrics.Counter(metrics.OUTCOMES.name, "", ("function_id", "outcome"))).inc(
+                    5, function_id=1, outcome='finished'
+                )
+                registry.register(metrics.Histogram(metrics.SMTP_SEND_SECONDS.name, "")).observe(0.2)
+                metrics.write_file(metrics.metrics_file(owner, tmp), registry)
+
+            out = StringIO()
+            with override_settings(TASK_METRICS_DIR=tmp):
+                call_command("task_stats", stdout=out, stderr=StringIO())
+        output = out.getvalue()
+        self.assertIn("2 worker file(s)", output)
+        self.assertRegex(output, r'tasks_outcomes_total\{function_id="1",outcome="finished"\}\s+10\b')
+        self.assertRegex(output, r'smtp_send_duration_seconds\s+2\b')
+        self.assertRegex(output, r'QUEUED\s+NORMAL\s+1\s+0')
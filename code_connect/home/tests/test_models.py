@@ -15,8 +15,22 @@ __status__ = "Development"
 #______________________________________________imports_________________________________________________
 
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.db import connection
+from django.db.models import QuerySet
+from django.template.loader import render_to_string
+from django.utils import timezone
 
-from home.models import Task, SendInviteTask
+from datetime import timedelta
+from io import StringIO
+from unittest import mock
+import gzip
+import json
+import os
+import tempfile
+import unittest
+
+from home.models import Task, SendInviteTask, ArchivedTask
 from members.models import Invitation
 
 class TaskModelTests(TestCase):
@@ -26,10 +40,12 @@ class TaskModelTests(TestCase):
 
     def create_simple_task(
         self,
-        name="Example Task"
+        name="Example Task",
+        priority=Task.NORMAL,
     ):
         fields = {
             'name': name,
+            'priority': priority,
         }
         t = Task(**(fields))
         t.full_clean()
@@ -68,6 +84,249 @@ class TaskModelTests(TestCase):
         t.abort_task()
         self.assertEqual(t.state, t.ABORTED)
 
+    def test_claim_next(self):
+        """
+            - tests that claim_next() hands out the oldest queued task, leases it
+            to the worker and never hands out the same task twice
+        """
+        t1 = self.create_simple_task(name="first")
+        t2 = self.create_simple_task(name="second")
+
+        claimed = Task.claim_next(owner="worker-1")
+        self.assertEqual(claimed.pk, t1.pk)
+        self.assertEqual(claimed.state, Task.PROCESSING)
+        self.assertEqual(claimed.owner, "worker-1")
+        self.assertGreater(claimed.lease_expires_at, timezone.now())
+
+        claimed = Task.claim_next(owner="worker-2")
+        self.assertEqual(claimed.pk, t2.pk)
+        self.assertEqual(Task.claim_next(owner="worker-3"), None)
+
+    def test_claim_tasks(self):
+        """
+            - tests that claim_tasks() claims at most {limit} tasks, oldest first
+        """
+        tasks = [self.create_simple_task(name=f"task {i}") for i in range(3)]
+
+        claimed = Task.claim_tasks(owner="worker-1", limit=2)
+        self.assertEqual([t.pk for t in claimed], [t.pk for t in tasks[:2]])
+        claimed = Task.claim_tasks(owner="worker-2", limit=2)
+        self.assertEqual([t.pk for t in claimed], [tasks[2].pk])
+        self.assertEqual(Task.claim_tasks(owner="worker-3", limit=2), [])
+
+    def test_claim_by_priority(self):
+        """
+            - tests that tasks are claimed by {priority} first, and only once their
+            {run_at} has passed
+        """
+        bulk = self.create_simple_task(name="bulk", priority=Task.BULK)
+        high = self.create_simple_task(name="high", priority=Task.HIGH)
+        later = self.create_simple_task(name="later", priority=Task.HIGH)
+        Task.objects.filter(pk=later.pk).update(run_at=timezone.now() + timedelta(hours=1))
+
+        self.assertEqual(Task.claim_next(owner="worker").pk, high.pk)
+        self.assertEqual(Task.claim_next(owner="worker").pk, bulk.pk)
+        self.assertEqual(Task.claim_next(owner="worker"), None)
+
+    def test_claim_from_lanes(self):
+        """
+            - tests that with {lanes}, tasks come from the first non-empty lane only
+        """
+        high = [self.create_simple_task(name=f"high {i}", priority=Task.HIGH) for i in range(2)]
+        bulk = self.create_simple_task(name="bulk", priority=Task.BULK)
+
+        claimed = Task.claim_tasks(owner="worker", limit=5, lanes=[Task.BULK, Task.HIGH, Task.NORMAL])
+        self.assertEqual([t.pk for t in claimed], [bulk.pk])
+        claimed = Task.claim_tasks(owner="worker", limit=5, lanes=[Task.BULK, Task.HIGH, Task.NORMAL])
+        self.assertEqual([t.pk for t in claimed], [t.pk for t in high])
+
+    def test_claim_from_lanes_queries(self):
+        """
+            - tests that polling the lanes doesn't take one query per lane: a single one
+            when the queue is empty, or when the lane whose turn it is can be skipped
+        """
+        lanes = [Task.HIGH, Task.NORMAL, Task.BULK]
+        with self.assertNumQueries(1):
+            self.assertEqual(Task.claim_tasks(owner="worker", limit=5, lanes=lanes), [])
+
+        bulk = self.create_simple_task(name="bulk", priority=Task.BULK)
+        normal = self.create_simple_task(name="normal", priority=Task.NORMAL)
+        # HIGH is empty, NORMAL comes first: select + update + fetch
+        with self.assertNumQueries(3):
+            claimed = Task.claim_tasks(owner="worker", limit=5, lanes=lanes)
+        self.assertEqual([t.pk for t in claimed], [normal.pk])
+        claimed = Task.claim_tasks(owner="worker", limit=5, lanes=lanes)
+        self.assertEqual([t.pk for t in claimed], [bulk.pk])
+
+    @unittest.skipUnless(connection.vendor == 'sqlite', "reads sqlite's query plan")
+    def test_claim_uses_index(self):
+        """
+            - tests that the select of claim_tasks() is a range scan of a queue index,
+            without sorting the queue, however many finished tasks pile up
+        """
+        Task.objects.bulk_create(Task(name="done", state=Task.FINISHED) for _ in range(500))
+        self.create_simple_task()
+        with CaptureQueriesContext(connection) as ctx:
+            Task.claim_tasks(owner="worker", limit=5, lanes=[Task.HIGH, Task.NORMAL, Task.BULK])
+        select = ctx.captured_queries[0]['sql']
+        self.assertTrue(select.startswith("SELECT"))
+
+        with connection.cursor() as cursor:
+            cursor.execute(f"EXPLAIN QUERY PLAN {select}")
+            plan = " ".join(row[-1] for row in cursor.fetchall())
+        self.assertRegex(plan, r"USING (COVERING )?INDEX task_(state|queued)_priority_idx")
+        self.assertNotIn("TEMP B-TREE", plan)
+
+    def test_claim_while_leases_renewed(self):
+        """
+            - tests that tasks are still returned if the worker's heartbeat renews its
+            leases between the claim and the fetch of the claimed tasks
+        """
+        tasks = [self.create_simple_task(name=f"task {i}") for i in range(2)]
+        fetch_concrete = Task.fetch_concrete
+
+        def renew_then_fetch(rows, **filters):
+            Task.renew_leases("worker", lease=timedelta(minutes=10))
+            return fetch_concrete(rows, **filters)
+
+        with mock.patch.object(Task, "fetch_concrete", side_effect=renew_then_fetch):
+            claimed = Task.claim_tasks(owner="worker", limit=2)
+        self.assertEqual([t.pk for t in claimed], [t.pk for t in tasks])
+
+    def test_retry_task(self):
+        """
+            - tests that a retried task is requeued, but isn't claimed before its
+            {run_at}, and that it is moved to DEAD once it runs out of attempts
+        """
+        t = self.create_simple_task()
+        t.max_attempts = 2
+        t.save()
+
+        t = Task.claim_next(owner="worker")
+        self.assertTrue(t.retry_task("421 try again later"))
+        self.assertEqual(t.state, Task.QUEUED)
+        self.assertEqual(t.attempts, 1)
+        self.assertGreater(t.run_at, timezone.now())
+        self.assertEqual(Task.claim_next(owner="worker"), None)   # not due yet
+
+        Task.objects.filter(pk=t.pk).update(run_at=timezone.now())
+        t = Task.claim_next(owner="worker")
+        self.assertFalse(t.retry_task("421 try again later"))
+        t.refresh_from_db()
+        self.assertEqual(t.state, Task.DEAD)
+        self.assertEqual(t.last_error, "421 try again later")
+        self.assertNotEqual(t.exit, None)
+
+    def test_retry_delay(self):
+        """
+            - tests that the retry delay grows exponentially, with jitter, up to its cap
+        """
+        for attempts in range(1, 4):
+            delay = Task.RETRY_BASE_DELAY * 2 ** (attempts - 1)
+            self.assertTrue(delay / 2 <= Task.retry_delay(attempts) <= delay)
+        self.assertLessEqual(Task.retry_delay(50), Task.RETRY_MAX_DELAY)
+
+    def test_requeue_expired(self):
+        """
+            - tests that tasks whose lease has expired are put back in the queue,
+            while tasks with a live lease are left alone
+        """
+        expired = self.create_simple_task(name="expired")
+        live = self.create_simple_task(name="live")
+        Task.claim_next(owner="dead-worker", lease=timedelta(seconds=-1))
+        Task.claim_next(owner="live-worker")
+
+        self.assertEqual(Task.requeue_expired(), 1)
+        expired.refresh_from_db()
+        live.refresh_from_db()
+        self.assertEqual(expired.state, Task.QUEUED)
+        self.assertEqual(expired.owner, '')
+        self.assertEqual(live.state, Task.PROCESSING)
+
+
+class ArchiveCompletedTests(TestCase):
+    """ tests for Task.archive_completed() """
+
+    #_______________________utilities_________________________
+
+    def create_completed_task(self, state, days_ago, name="Example Task"):
+        t = Task(name=name, state=state)
+        t.save()
+        Task.objects.filter(pk=t.pk).update(exit=timezone.now() - timedelta(days=days_ago))
+        return t
+
+    #_______________________tests______________________________
+
+    def test_archive_to_table(self):
+        """
+            - tests that only old FINISHED/ABORTED tasks are moved to ArchivedTask
+        """
+        old_finished = self.create_completed_task(Task.FINISHED, days_ago=40)
+        old_aborted = self.create_completed_task(Task.ABORTED, days_ago=40)
+        recent = self.create_completed_task(Task.FINISHED, days_ago=1)
+        queued = Task(name="queued")
+        queued.save()
+
+        archived = Task.archive_completed(timedelta(days=30), chunk_size=1)
+        self.assertEqual(archived, 2)
+        self.assertEqual(
+            set(Task.objects.values_list('pk', flat=True)), {recent.pk, queued.pk}
+        )
+        self.assertEqual(
+            set(ArchivedTask.objects.values_list('task_id', flat=True)),
+            {old_finished.pk, old_aborted.pk}
+        )
+
+    def test_archive_to_stream(self):
+        """
+            - tests that archived tasks are written as JSON lines, along with the
+            data of their concrete type, when a stream is passed
+        """
+        invite = Invitation(mail_address="archived@mail.dev")
+        invite.full_clean()
+        invite.save()   # creates a SendInviteTask
+        task = SendInviteTask.objects.get(invite=invite)
+        Task.objects.filter(pk=task.pk).update(
+            state=Task.FINISHED, exit=timezone.now() - timedelta(days=40)
+        )
+
+        stream = StringIO()
+        self.assertEqual(Task.archive_completed(timedelta(days=30), stream=stream), 1)
+        record = json.loads(stream.getvalue())
+        self.assertEqual(record['task_id'], task.pk)
+        self.assertEqual(record['data']['mail_address'], "archived@mail.dev")
+        self.assertFalse(SendInviteTask.objects.filter(pk=task.pk).exists())
+        self.assertEqual(ArchivedTask.objects.count(), 0)
+
+    def test_archive_synced_before_delete(self):
+        """
+            - tests that with a gzip file, the tasks of a chunk can be read back from the
+            file before their rows are deleted (the file is still open then)
+        """
+        tasks = [self.create_completed_task(Task.FINISHED, days_ago=40, name=f"old {i}") for i in range(2)]
+        on_disk = []
+        delete = QuerySet.delete
+
+        def read_then_delete(queryset):
+            lines = []
+            with gzip.open(path, "rt", encoding="utf-8") as file:
+                try:
+                    for line in file:
+                        lines.append(line)
+                except EOFError:    # the gzip member isn't closed yet
+                    pass
+            on_disk.append([json.loads(line)['task_id'] for line in lines])
+            return delete(queryset)
+
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "archive.jsonl.gz")
+            with gzip.open(path, "at", encoding="utf-8") as stream, \
+                    mock.patch.object(QuerySet, "delete", autospec=True, side_effect=read_then_delete):
+                Task.archive_completed(timedelta(days=30), chunk_size=1, stream=stream)
+
+        self.assertEqual(on_disk, [[tasks[0].pk], [tasks[0].pk, tasks[1].pk]])
+        self.assertFalse(Task.objects.exists())
+
 
 class SendInviteTaskModelTests(TestCase):
     """ tests for SendInviteTask """
@@ -136,4 +395,26 @@ class SendInviteTaskModelTests(TestCase):
         t = self.create_simple_send_invite_task(invite=i)
         self.assertEqual(i.sent_at, None)
         t.send()
-        self.assertNotEqual(i.sent_at, None)
\ No newline at end of file
+        self.assertNotEqual(i.sent_at, None)
+
+    def test_build_message(self):
+        """
+            - tests that the prerendered html part is the same as the template rendered
+            in full (with escaped values), and that the text part has no markup
+        """
+        i = self.create_simple_invitation(mail_address="o'neil&co@mail.dev")
+        t = self.create_simple_send_invite_task(invite=i)
+        message = t.build_message()
+
+        html, mimetype = message.alternatives[0]
+        self.assertEqual(mimetype, "text/html")
+        self.assertEqual(html, render_to_string('home/invitation_mail.html', context={
+            'link': f'{SendInviteTask.HOME_LINK}/members/registration/?i={i.code}',
+            'home_link': SendInviteTask.HOME_LINK,
+            'email': i.mail_address,
+            'contact': SendInviteTask.CONTACT,
+        }))
+        self.assertIn(f"Hi, {i.mail_address}!", message.body)
+        self.assertIn(f"/members/registration/?i={i.code}", message.body)
+        self.assertNotIn("<", message.body)
+        self.assertNotIn("{", message.body)
@@ -0,0 +1,98 @@
+#_____________________________________________________________________________________________________
+"""
+    - defines tests for `home.ratelimit`.
+"""
+
+__author__ = "Tejaswin Singh, "
+__copyright__ = "Copyright 2024, Code Connect Home"
+__credits__ = ["Tejaswin Singh", "", ]
+__license__ = "GPL"
+__version__ = "1.0.0"
+__maintainer__ = "Tejaswin Singh"
+__email__ = "tejaswin.cs08@gmail.com"
+__status__ = "Development"
+
+#______________________________________________imports_________________________________________________
+
+from django.test import SimpleTestCase, override_settings
+from django.conf import settings
+
+from home.ratelimit import RateLimiter, DailyLimitReached, get_limiter
+
+import os
+import tempfile
+from unittest import mock
+
+
+class RateLimiterTests(SimpleTestCase):
+    """ tests for RateLimiter """
+
+    #_______________________utilities_________________________
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, "rate.json")
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def create_limiter(self, rate=2, burst=3, daily_limit=100):
+        return RateLimiter(rate, burst, daily_limit, self.path)
+
+    #_______________________tests______________________________
+
+    def test_burst_then_paced(self):
+        """
+            - tests that {burst} mails go out at once and the following ones are spaced
+            1/{rate} seconds apart
+        """
+        limiter = self.create_limiter()
+        with mock.patch("home.ratelimit.time", return_value=1000.0):
+            waits = [limiter.reserve() for _ in range(5)]
+        self.assertEqual(waits, [0, 0, 0, 0.5, 1.0])
+
+    def test_bucket_refills(self):
+        """
+            - tests that tokens come back with time, up to {burst}
+        """
+        limiter = self.create_limiter()
+        with mock.patch("home.ratelimit.time", return_value=1000.0):
+            for _ in range(3):
+                limiter.reserve()
+        with mock.patch("home.ratelimit.time", return_value=1010.0):
+            self.assertEqual([limiter.reserve() for _ in range(4)], [0, 0, 0, 0.5])
+
+    def test_state_shared(self):
+        """
+            - tests that limiters using the same file (ie. other workers, or this one
+            after a restart) share the bucket and the daily count
+        """
+        with mock.patch("home.ratelimit.time", return_value=1000.0):
+            self.create_limiter(daily_limit=4).reserve()
+            self.create_limiter(daily_limit=4).reserve()
+            self.create_limiter(daily_limit=4).reserve()
+            self.assertEqual(self.create_limiter(daily_limit=4).reserve(), 0.5)
+            with self.assertRaises(DailyLimitReached) as error:
+                self.create_limiter(daily_limit=4).reserve()
+        self.assertEqual(error.exception.retry_at, self.create_limiter().next_day())
+
+    def test_limiter_disabled(self):
+        """
+            - tests that no limit applies unless mails go out over SMTP
+        """
+        self.assertIsNone(get_limiter())    # the test runner uses the locmem backend
+        with override_settings(EMAIL_RATE_LIMIT=None, EMAIL_BACKEND='django.core.mail.backends.smtp.EmailBackend'):
+            self.assertIsNone(get_limiter())
+
+    def test_default_state_file(self):
+        """
+            - tests that by default the state of the limiter is kept out of the source tree,
+            and no daily cap applies
+        """
+        with override_settings(
+            EMAIL_BACKEND='django.core.mail.backends.smtp.EmailBackend', EMAIL_RATE_STATE_FILE=None
+        ), mock.patch("home.ratelimit._limiter", None):
+            limiter = get_limiter()
+        self.assertEqual(os.path.dirname(limiter.path), tempfile.gettempdir())
+        self.assertFalse(limiter.path.startswith(str(settings.BASE_DIR)))
+        self.assertIsNone(limiter.daily_limit)
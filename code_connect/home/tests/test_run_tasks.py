@@ -0,0 +1,232 @@
+#_____________________________________________________________________________________________________
+"""
+    - defines tests for the `run_tasks` command and WorkerHeartbeat.
+"""
+
+__author__ = "Tejaswin Singh, "
+__copyright__ = "Copyright 2024, Code Connect Home"
+__credits__ = ["Tejaswin Singh", "", ]
+__license__ = "GPL"
+__version__ = "1.0.0"
+__maintainer__ = "Tejaswin Singh"
+__email__ = "tejaswin.cs08@gmail.com"
+__status__ = "Development"
+
+#______________________________________________imports_________________________________________________
+
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.core.management import call_command
+from django.db.models import F
+from django.utils import timezone
+
+from home.models import Task, WorkerHeartbeat
+from home.management.commands._bg_tasks import TASK_TABLE
+from home import metrics
+
+from datetime import timedelta
+from io import StringIO
+from time import monotonic, sleep
+from unittest import mock
+import os
+import signal
+import unittest
+
+
+class WorkerHeartbeatTests(TestCase):
+    """ tests for WorkerHeartbeat """
+
+    #_______________________utilities_________________________
+
+    def create_claimed_task(self, owner, name="Example Task"):
+        Task(name=name).save()
+        return Task.claim_next(owner=owner)
+
+    #_______________________tests______________________________
+
+    def test_beat_renews_leases(self):
+        """
+            - tests that a heartbeat extends the leases of the tasks of its worker only
+        """
+        mine = self.create_claimed_task("worker-1")
+        other = self.create_claimed_task("worker-2")
+        Task.objects.update(lease_expires_at=timezone.now())
+
+        WorkerHeartbeat.beat("worker-1", timedelta(minutes=5), hostname="host", pid=1)
+        mine.refresh_from_db()
+        other.refresh_from_db()
+        self.assertGreater(mine.lease_expires_at, timezone.now() + timedelta(minutes=4))
+        self.assertLess(other.lease_expires_at, timezone.now())
+        self.assertTrue(WorkerHeartbeat.objects.get(owner="worker-1").is_alive())
+
+    def test_requeue_dead(self):
+        """
+            - tests that the tasks of a silent worker are requeued, and that it is forgotten
+        """
+        dead = self.create_claimed_task("dead-worker")
+        alive = self.create_claimed_task("alive-worker")
+        WorkerHeartbeat.beat("dead-worker", hostname="host", pid=1)
+        WorkerHeartbeat.beat("alive-worker", hostname="host", pid=2)
+        WorkerHeartbeat.objects.filter(owner="dead-worker").update(
+            last_seen=timezone.now() - WorkerHeartbeat.timeout() - timedelta(seconds=1)
+        )
+
+        self.assertEqual(WorkerHeartbeat.requeue_dead(), 1)
+        dead.refresh_from_db()
+        alive.refresh_from_db()
+        self.assertEqual((dead.state, dead.owner, dead.attempts), (Task.QUEUED, '', 0))
+        self.assertEqual(alive.state, Task.PROCESSING)
+        self.assertEqual(list(WorkerHeartbeat.objects.values_list('owner', flat=True)), ["alive-worker"])
+
+
+@unittest.skipUnless(hasattr(signal, "setitimer"), "needs unix signals")
+@override_settings(TASK_HEARTBEAT_INTERVAL=3600)
+class GracefulShutdownTests(TestCase):
+    """ tests for the SIGTERM/SIGINT handling of `run_tasks` """
+
+    #_______________________utilities_________________________
+
+    def run_worker(self, execute_tasks, *args):
+        stderr = StringIO()
+        with mock.patch("home.management.commands.run_tasks.execute_tasks", execute_tasks):
+            call_command("run_tasks", *args, stderr=stderr)
+        return stderr.getvalue()
+
+    def tearDown(self):
+        signal.signal(signal.SIGTERM, signal.SIG_DFL)
+        signal.signal(signal.SIGINT, signal.default_int_handler)
+
+    #_______________________tests______________________________
+
+    def test_stop_after_current_task(self):
+        """
+            - tests that on SIGTERM the worker finishes the task it is executing,
+            claims nothing more and unregisters itself
+        """
+        for i in range(2):
+            Task(name=f"task {i}").save()
+
+        def execute_tasks(cmd, tasks):
+            os.kill(os.getpid(), signal.SIGTERM)
+            for task in tasks:
+                task.clear_task()
+
+        output = self.run_worker(execute_tasks)
+        self.assertIn("SIGTERM received", output)
+        self.assertEqual(Task.objects.filter(state=Task.FINISHED).count(), 1)
+        self.assertEqual(Task.objects.filter(state=Task.QUEUED).count(), 1)
+        self.assertFalse(WorkerHeartbeat.objects.exists())
+
+    def test_unfinished_task_released(self):
+        """
+            - tests that a task still running once the drain deadline passes is
+            interrupted and put back in the queue
+        """
+        Task(name="slow task").save()
+
+        def execute_tasks(cmd, tasks):
+            os.kill(os.getpid(), signal.SIGINT)
+            sleep(5)
+
+        start = monotonic()
+        output = self.run_worker(execute_tasks, "--drain-timeout", "0.2")
+        self.assertLess(monotonic() - start, 4)
+        self.assertIn("Released 1 unfinished task(s)", output)
+        task = Task.objects.get()
+        self.assertEqual((task.state, task.owner, task.attempts), (Task.QUEUED, '', 0))
+
+
+@override_settings(TASK_HEARTBEAT_INTERVAL=3600)
+class ExitWhenEmptyTests(TestCase):
+    """ tests for `run_tasks --exit-when-empty` """
+
+    def tearDown(self):
+        signal.signal(signal.SIGTERM, signal.SIG_DFL)
+        signal.signal(signal.SIGINT, signal.default_int_handler)
+
+    def test_exit_when_empty(self):
+        """
+            - tests that the worker executes the queued tasks, and then stops on its own
+            and unregisters itself
+        """
+        for i in range(3):
+            Task(name=f"task {i}").save()
+
+        def execute_tasks(cmd, tasks):
+            for task in tasks:
+                task.clear_task()
+
+        stderr = StringIO()
+        with mock.patch("home.management.commands.run_tasks.execute_tasks", execute_tasks):
+            call_command("run_tasks", "--exit-when-empty", "--batch-size", "2", stderr=stderr)
+        self.assertIn("Queue is empty", stderr.getvalue())
+        self.assertEqual(Task.objects.filter(state=Task.FINISHED).count(), 3)
+        self.assertFalse(WorkerHeartbeat.objects.exists())
+
+
+@override_settings(TASK_HEARTBEAT_INTERVAL=3600)
+class PooledWorkerTests(TransactionTestCase):
+    """
+        - tests for `run_tasks --concurrency N` with a thread or a process pool. A
+        TransactionTestCase, since the pool threads/processes use their own db connections
+        and only see committed tasks (the test db is a file, see DATABASES).
+    """
+
+    #_______________________utilities_________________________
+
+    def tearDown(self):
+        signal.signal(signal.SIGTERM, signal.SIG_DFL)
+        signal.signal(signal.SIGINT, signal.default_int_handler)
+
+    def count(self, outcome):
+        return metrics.OUTCOMES._values.get(('0', outcome), 0)
+
+    def run_pooled(self, *args, tasks=12):
+        """
+            - queues {tasks} tasks and drains them with a pooled worker. Returns the
+            worker's output and the number of finished tasks its metrics counted.
+        """
+        for i in range(tasks):
+            Task(name=f"task {i}").save()
+
+        def count_executions(cmd, task):
+            # counted in the db, which every thread/process of the pool shares
+            Task.objects.filter(pk=task.pk).update(attempts=F('attempts') + 1)
+            sleep(0.01)
+            task.clear_task()
+
+        # a finished task counted before the worker starts, that a forked pool
+        # process must not send back again
+        Task.objects.create(name="before").clear_task()
+        finished = self.count('finished')
+        stderr = StringIO()
+        with mock.patch.dict(TASK_TABLE, {0: count_executions}):
+            call_command("run_tasks", "--exit-when-empty", *args, stderr=stderr)
+        return stderr.getvalue(), self.count('finished') - finished
+
+    def assertExecutedOnce(self, tasks=12):
+        executed = Task.objects.exclude(name="before")
+        self.assertEqual(executed.count(), tasks)
+        self.assertEqual(executed.filter(state=Task.FINISHED, attempts=1).count(), tasks)
+
+    #_______________________tests______________________________
+
+    def test_thread_pool(self):
+        """
+            - tests that a thread pool executes every task exactly once, batches included
+        """
+        output, finished = self.run_pooled("--concurrency", "4", "--batch-size", "2")
+        self.assertIn("Dispatching to a thread pool of 4", output)
+        self.assertExecutedOnce()
+        self.assertEqual(finished, 12)
+        self.assertFalse(WorkerHeartbeat.objects.exists())
+
+    def test_process_pool(self):
+        """
+            - tests that a process pool executes every task exactly once, and that the
+            metrics recorded in the pool processes are sent back to the worker
+        """
+        output, finished = self.run_pooled("--executor", "process", "--concurrency", "3", "--batch-size", "2")
+        self.assertIn("Dispatching to a process pool of 3", output)
+        self.assertExecutedOnce()
+        self.assertEqual(finished, 12)
+        self.assertFalse(WorkerHeartbeat.objects.exists())
@@ -0,0 +1,40 @@
+#_____________________________________________________________________________________________________
+"""
+    - defines tests for `home.scheduling`.
+"""
+
+__author__ = "Tejaswin Singh, "
+__copyright__ = "Copyright 2024, Code Connect Home"
+__credits__ = ["Tejaswin Singh", "", ]
+__license__ = "GPL"
+__version__ = "1.0.0"
+__maintainer__ = "Tejaswin Singh"
+__email__ = "tejaswin.cs08@gmail.com"
+__status__ = "Development"
+
+#______________________________________________imports_________________________________________________
+
+from django.test import SimpleTestCase
+
+from home.scheduling import FairShare
+
+from collections import Counter
+
+
+class FairShareTests(SimpleTestCase):
+    """ tests for FairShare """
+
+    def test_shares_follow_weights(self):
+        """
+            - tests that every lane goes first in proportion to its weight
+        """
+        lanes = FairShare({0: 8, 1: 4, 2: 1})
+        turns = Counter(lanes.order()[0] for _ in range(130))
+        self.assertEqual(turns, {0: 80, 1: 40, 2: 10})
+
+    def test_other_lanes_follow(self):
+        """
+            - tests that the other lanes are tried afterwards, by priority
+        """
+        lanes = FairShare({0: 1, 1: 1, 2: 1})
+        self.assertEqual([lanes.order() for _ in range(3)], [[0, 1, 2], [1, 0, 2], [2, 0, 1]])
@@ -0,0 +1,96 @@
+#_____________________________________________________________________________________________________
+"""
+    - defines tests for `home.wakeup`.
+"""
+
+__author__ = "Tejaswin Singh, "
+__copyright__ = "Copyright 2024, Code Connect Home"
+__credits__ = ["Tejaswin Singh", "", ]
+__license__ = "GPL"
+__version__ = "1.0.0"
+__maintainer__ = "Tejaswin Singh"
+__email__ = "tejaswin.cs08@gmail.com"
+__status__ = "Development"
+
+#______________________________________________imports_________________________________________________
+
+from django.test import SimpleTestCase, override_settings
+
+from home.wakeup import SocketWakeupChannel, WakeupChannel, Backoff, notify_workers
+
+import os
+import socket
+import tempfile
+import unittest
+
+
+@unittest.skipUnless(hasattr(socket, "AF_UNIX"), "unix sockets are not available")
+class SocketWakeupChannelTests(SimpleTestCase):
+    """ tests for SocketWakeupChannel """
+
+    #_______________________utilities_________________________
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.settings_override = override_settings(TASK_WAKEUP_DIR=self.tmp.name)
+        self.settings_override.enable()
+
+    def tearDown(self):
+        self.settings_override.disable()
+        self.tmp.cleanup()
+
+    #_______________________tests______________________________
+
+    def test_notify_wakes_up_workers(self):
+        """
+            - tests that every idle worker is woken up by notify_workers()
+        """
+        channels = [SocketWakeupChannel(f"worker-{i}") for i in range(2)]
+        try:
+            for channel in channels:
+                self.assertFalse(channel.wait(0))
+            notify_workers()
+            for channel in channels:
+                self.assertTrue(channel.wait(1))
+                # the wakeup was consumed
+                self.assertFalse(channel.wait(0))
+        finally:
+            for channel in channels:
+                channel.close()
+
+    def test_stale_socket_removed(self):
+        """
+            - tests that sockets left behind by crashed workers are cleaned up
+        """
+        stale = os.path.join(self.tmp.name, "stale.sock")
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        sock.bind(stale)
+        sock.close()    # nobody is listening on it anymore
+
+        notify_workers()
+        self.assertFalse(os.path.exists(stale))
+
+
+class WakeupChannelTests(SimpleTestCase):
+    """ tests for WakeupChannel and Backoff """
+
+    def test_interrupt(self):
+        """
+            - tests that interrupt() wakes up wait()
+        """
+        channel = WakeupChannel()
+        try:
+            self.assertFalse(channel.wait(0))
+            channel.interrupt()
+            self.assertTrue(channel.wait(1))
+        finally:
+            channel.close()
+
+    def test_backoff(self):
+        """
+            - tests that the poll interval doubles up to its maximum and can be reset
+        """
+        backoff = Backoff(0.5, 3)
+        self.assertEqual([backoff.next() for _ in range(5)], [0.5, 1, 2, 3, 3])
+        backoff.reset()
+        self.assertEqual(backoff.next(), 0.5)
@@ -0,0 +1,231 @@
+#_____________________________________________________________________________________________________
+"""
+    - wakeup channel between the code that queues Tasks and the `run_tasks` workers.
+
+    Instead of polling the queue every second, an idle worker blocks on its channel and
+    is woken up as soon as a new task is committed:
+
+    *   on PostgreSQL, through LISTEN/NOTIFY.
+    *   elsewhere, every worker binds a unix datagram socket inside TASK_WAKEUP_DIR and
+        notify_workers() sends a byte to each of them. This only reaches workers on the
+        same host, which is all a sqlite database allows anyway.
+
+    The queue is still polled (with exponential backoff) in case a wakeup gets lost.
+"""
+
+__author__ = "Tejaswin Singh, "
+__copyright__ = "Copyright 2024, Code Connect Home"
+__credits__ = ["Tejaswin Singh", "", ]
+__license__ = "GPL"
+__version__ = "1.0.0"
+__maintainer__ = "Tejaswin Singh"
+__email__ = "tejaswin.cs08@gmail.com"
+__status__ = "Development"
+
+#______________________________________________imports_________________________________________________
+
+from django.conf import settings
+from django.db import connections, DEFAULT_DB_ALIAS
+
+from hashlib import sha1
+import os
+import select
+import socket
+import tempfile
+
+
+#___________________________________________const________________________________________________
+
+# name of the postgres NOTIFY channel
+CHANNEL = "run_tasks"
+
+
+#___________________________________________utilities________________________________________________
+
+def get_wakeup_dir(using: str = DEFAULT_DB_ALIAS) -> str:
+    """
+        - returns the directory holding the sockets of the workers. Unless TASK_WAKEUP_DIR
+        is set, it is derived from the db name, so separate databases (eg. test dbs) don't
+        wake up each other's workers.
+    """
+    if settings.TASK_WAKEUP_DIR:
+        return str(settings.TASK_WAKEUP_DIR)
+    db_name = str(connections[using].settings_dict["NAME"])
+    return os.path.join(tempfile.gettempdir(), f"code_connect_wakeup_{sha1(db_name.encode()).hexdigest()[:12]}")
+
+def notify_workers(using: str = DEFAULT_DB_ALIAS) -> None:
+    """
+        - wakes up the idle workers. Call it once new tasks have been committed
+        (see Task.save()). Never raises, a lost wakeup is picked up by polling.
+    """
+    conn = connections[using]
+    try:
+        if conn.vendor == "postgresql":
+            with conn.cursor() as cursor:
+                cursor.execute("SELECT pg_notify(%s, '')", [CHANNEL])
+            return
+
+        if not hasattr(socket, "AF_UNIX"):
+            return
+        directory = get_wakeup_dir(using)
+        try:
+            names = os.listdir(directory)
+        except FileNotFoundError:
+            return  # no worker is running
+
+        with socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM) as sock:
+            sock.setblocking(False)
+            for name in names:
+                path = os.path.join(directory, name)
+                try:
+                    sock.sendto(b"\0", path)
+                except (ConnectionRefusedError, FileNotFoundError):
+                    # socket left behind by a worker that crashed
+                    try:
+                        os.unlink(path)
+                    except OSError:
+                        pass
+                except OSError:
+                    pass    # buffer full, the worker already has a pending wakeup
+    except Exception:
+        pass
+
+
+#___________________________________________channels________________________________________________
+
+class WakeupChannel:
+    """
+        - base channel. Only supports local wakeups through interrupt(), eg. from a pool
+        thread that finished a task. Used as is when no notification mechanism is available.
+    """
+
+    # True if the channel receives notify_workers() wakeups
+    notified = False
+
+    def __init__(self):
+        self._reader, self._writer = socket.socketpair()
+        self._reader.setblocking(False)
+        self._writer.setblocking(False)
+
+    #_____________________________instance methods______________________
+
+    def wait(self, timeout: float) -> bool:
+        """ blocks for at most {timeout} seconds. Returns True if woken up. """
+        ready, _, _ = select.select(self._sources(), [], [], timeout)
+        for source in ready:
+            self._drain(source)
+        return bool(ready)
+
+    def interrupt(self) -> None:
+        """ wakes up wait() from another thread of this process """
+        try:
+            self._writer.send(b"\0")
+        except OSError:
+            pass
+
+    def close(self) -> None:
+        self._reader.close()
+        self._writer.close()
+
+    #_____________________________helpers________________________________
+
+    def _sources(self) -> list:
+        return [self._reader]
+
+    def _drain(self, source) -> None:
+        try:
+            while source.recv(1024):
+                pass
+        except OSError:
+            pass
+
+
+class SocketWakeupChannel(WakeupChannel):
+    """ receives wakeups through a unix datagram socket inside the wakeup dir """
+
+    notified = True
+
+    def __init__(self, name: str, using: str = DEFAULT_DB_ALIAS):
+        super().__init__()
+        directory = get_wakeup_dir(using)
+        os.makedirs(directory, exist_ok=True)
+        # socket paths are limited to ~100 chars, so the name is hashed
+        self.path = os.path.join(directory, f"{sha1(name.encode()).hexdigest()[:16]}.sock")
+        self._socket = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        self._socket.setblocking(False)
+        self._socket.bind(self.path)
+
+    def close(self) -> None:
+        self._socket.close()
+        try:
+            os.unlink(self.path)
+        except OSError:
+            pass
+        super().close()
+
+    def _sources(self) -> list:
+        return [self._reader, self._socket]
+
+
+class PostgresWakeupChannel(WakeupChannel):
+    """ receives wakeups through LISTEN on a dedicated db connection """
+
+    notified = True
+
+    def __init__(self, using: str = DEFAULT_DB_ALIAS):
+        super().__init__()
+        self._connection = connections.create_connection(using)
+        self._connection.ensure_connection()
+        with self._connection.cursor() as cursor:
+            cursor.execute(f'LISTEN "{CHANNEL}"')
+
+    def close(self) -> None:
+        self._connection.close()
+        super().close()
+
+    def _sources(self) -> list:
+        return [self._reader, self._connection.connection]
+
+    def _drain(self, source) -> None:
+        if source is not self._connection.connection:
+            return super()._drain(source)
+
+        from django.db.backends.postgresql.psycopg_any import is_psycopg3
+        if is_psycopg3:
+            # running any statement consumes the pending notifications
+            source.execute("SELECT 1")
+        else:
+            source.poll()
+            source.notifies.clear()
+
+
+def open_channel(name: str, using: str = DEFAULT_DB_ALIAS) -> WakeupChannel:
+    """ opens the best wakeup channel available for the db {using} """
+    try:
+        if connections[using].vendor == "postgresql":
+            return PostgresWakeupChannel(using)
+        if hasattr(socket, "AF_UNIX"):
+            return SocketWakeupChannel(name, using)
+    except Exception:
+        pass
+    return WakeupChannel()
+
+
+#___________________________________________backoff________________________________________________
+
+class Backoff:
+    """ exponentially growing poll interval, from {minimum} up to {maximum} seconds """
+
+    def __init__(self, minimum: float, maximum: float):
+        self.minimum = minimum
+        self.maximum = maximum
+        self.current = minimum
+
+    def next(self) -> float:
+        """ returns the interval to wait now, and doubles the next one """
+        interval = self.current
+        self.current = min(self.current * 2, self.maximum)
+        return interval
+
+    def reset(self) -> None:
+        self.current = self.minimum
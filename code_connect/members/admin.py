@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Member, CustomUser, Invitation
+from .models import Member, CustomUser, Invitation, InviteImportJob
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin as DjangoUserAdmin
 from django.utils.translation import gettext_lazy as _
@@ -7,7 +7,45 @@ from django.utils.translation import gettext_lazy as _
 
 
 admin.site.register(Member)
-admin.site.register(Invitation)
+
+
+class InvitationStatusFilter(admin.SimpleListFilter):
+    """ filters Invitations by their status, computed by the db (see InvitationQuerySet) """
+
+    title = _('status')
+    parameter_name = 'status'
+
+    def lookups(self, request, model_admin):
+        return (
+            ('active', _('Active')),
+            ('pending_send', _('Not sent yet')),
+            ('expired', _('Expired')),
+            ('accepted', _('Accepted')),
+        )
+
+    def queryset(self, request, queryset):
+        if self.value() in ('active', 'pending_send', 'expired'):
+            return getattr(queryset, self.value())()
+        if self.value() == 'accepted':
+            return queryset.filter(accepted=True)
+        return queryset
+
+
+@admin.register(Invitation)
+class InvitationAdmin(admin.ModelAdmin):
+    list_display = ('mail_address', 'code', 'timestamp', 'sent_at', 'accepted', 'is_expired')
+    list_filter = (InvitationStatusFilter,)
+    search_fields = ('mail_address', 'code')
+    ordering = ('-timestamp',)
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).with_expiry()
+
+    @admin.display(boolean=True, ordering='is_expired')
+    def is_expired(self, invite):
+        return invite.is_expired
+
+admin.site.register(InviteImportJob)
 
 @admin.register(CustomUser)
 class UserAdmin(DjangoUserAdmin):
@@ -3,10 +3,11 @@ from django import forms
 from django.core.exceptions import ObjectDoesNotExist, MultipleObjectsReturned
 from django.utils.translation import gettext_lazy as _
 
-import os, csv
+import csv
 from . import utils
 
-from .models import Member, Invitation
+from .models import Member, Invitation, InviteImportJob
+from home.models import SendInviteTask
 
 
 
@@ -97,11 +98,11 @@ class MemberForm(ModelForm):
         """
         data = self.cleaned_data["invitation_code"]
         try:
-            invite = Invitation.objects.get(code=data)
+            invite = Invitation.objects.with_expiry().get(code=data)
             if invite.accepted:
                 raise ValidationError("This invitation code was already accepted! Please contact club authorities if this was not done by you.")
             else:  # if not accepted
-                if invite.has_expired():
+                if invite.is_expired:
                     raise ValidationError("This invitation code has expired! Please contact club authorities to request a new one.")
                 else:   # if not expired and not accepted, only then the field is valid
                     pass
@@ -126,6 +127,9 @@ class InviteForm(forms.Form):
             db either. The user must make sure all mails are valid.
         *   If a mail address is present in both the csv file and the text-area, then it is taken as a single
             entity and doesn't get repeated.
+        *   More than JOB_INVITES mails are not invited right away. An InviteImportJob is queued for them
+            instead (available as {job} once the form is valid), which validates and creates the Invitations
+            in the background, with the same rules. Its errors are then shown on the status page of the job.
         *   If an Invitation object already exists for a provided mail address, then three things can happen-
                 1) If the Invitation was accepted, i.e the recepient has registered as a Member using that mail,
                     then an error stating such is generated.
@@ -137,6 +141,15 @@ class InviteForm(forms.Form):
     # form template
     template_name = "members/inviteForm.html"
 
+    # up to this many invites are sent right away, more are queued in the
+    # BULK lane so that they don't hold up other tasks (see Task.PRIORITY_WEIGHTS)
+    BULK_INVITES = 20
+    # more invites than this are created in the background (see InviteImportJob)
+    JOB_INVITES = 200
+
+    # the InviteImportJob queued by clean(), if any
+    job = None
+
     #_______________________form fields_________________________
 
     csv_file = forms.FileField(required=False)
@@ -158,7 +171,10 @@ class InviteForm(forms.Form):
             raise ValidationError("No input provided.")
         
         if not self.errors:
-            self.create_invites()
+            if len(mails := self.get_mails()) > self.JOB_INVITES:
+                self.job = InviteImportJob.enqueue(mails)
+            else:
+                self.create_invites()
 
     #_______________________field-level validation_________________________
 
@@ -167,8 +183,6 @@ class InviteForm(forms.Form):
             - validates user uploaded file
 
             *   checks that file, if provided, has a .csv extension.
-            *   for reading the in-memory-file, it is temporarily saved to disk by calling 
-                handle_uploaded_file() which returns the file path.
             *   for further validation, it calls get_mails_from_csv(), which return a set of 
                 extracted mails on successful validation. Though if an error occurs, a ValidationError 
                 gets raised inside and will be propagated above.
@@ -177,9 +191,8 @@ class InviteForm(forms.Form):
         if csv_file:
             if not csv_file.name.endswith('.csv'):
                 raise ValidationError("Invalid file format. Please upload a CSV file.")
-            
-            csv_file_path = utils.handle_uploaded_file(csv_file)
-            return InviteForm.get_mails_from_csv(csv_file_path)  # returns the set of extracted mails
+
+            return InviteForm.get_mails_from_csv(csv_file)  # returns the set of extracted mails
 
         return csv_file  # always return the value you want this form-field to have when accessed again
 
@@ -208,6 +221,8 @@ class InviteForm(forms.Form):
         """
             - handles further validation of the uploaded csv_file.
 
+            *   the file is parsed in a single pass over its chunks as they are read
+                (see utils.iter_uploaded_lines()), it is never copied to disk.
             *   raises Validation error if:
                     1) No 'email' column was found in the file
                     2) No mail-addresses were found in the email column
@@ -219,54 +234,52 @@ class InviteForm(forms.Form):
             return mails
 
         try:
-            with open(file, "r") as f:
-                # when `skipinitialspace` is True, whitespace immediately following the delimiter is ignored.
-                csv_data = csv.DictReader(f, skipinitialspace=True)
-                if 'email' not in csv_data.fieldnames:
-                    raise ValueError
-                for row in csv_data:
-                    email = row['email'].strip()
-                    if email:   # skip empty email records
-                        mails.add(email)  
-                if not mails:
-                    raise TypeError
+            # when `skipinitialspace` is True, whitespace immediately following the delimiter is ignored.
+            csv_data = csv.DictReader(utils.iter_uploaded_lines(file), skipinitialspace=True)
+            if 'email' not in csv_data.fieldnames:
+                raise ValueError
+            for row in csv_data:
+                email = row['email'].strip()
+                if email:   # skip empty email records
+                    mails.add(email)  
+            if not mails:
+                raise TypeError
+        except UnicodeDecodeError:
+            raise ValidationError("Error processing CSV file. Check your file format.")
         except ValueError:
-            os.remove(file)
             raise ValidationError("Error processing CSV file. No 'email' column was found.")
         except TypeError:
-            os.remove(file)
             raise ValidationError("No mail addresses were found in the file.")
         except Exception:
-            os.remove(file)
             raise ValidationError("Error processing CSV file. Check your file format.")
         
-        os.remove(file)  # delete the file after you're done
         return mails
 
-    def create_invites(self):
-        """
-            - creates an Invitation object for each mail-address provided.
-
-            *   takes the union of the mail sets extracted from both the input fields
-        """
+    def get_mails(self):
+        """ returns the union of the mail sets extracted from both the input fields """
         # mails from text-area
         if not (mails_list := self.cleaned_data.get("mail_list")):
             mails_list = set()
         # mails from csv file
         if not (mails_csv := self.cleaned_data.get("csv_file")):
             mails_csv = set()
-        mails = mails_list | mails_csv  # union
-        invites = []
+        return mails_list | mails_csv  # union
+
+    def create_invites(self):
+        """
+            - creates an Invitation object for each mail-address provided.
+
+            *   uses the bulk versions of full_clean() and save() (see Invitation.clean_many()),
+                so the number of queries doesn't grow with the number of mails
+        """
+        mails = sorted(self.get_mails())
         Invitation.clean_db()   # deletes all expired AND unaccepted invitations
-        for mail in mails:
-            try:
-                invite = Invitation(mail_address=mail)
-                invite.full_clean()
-                invites.append(invite)
-            except ValidationError as e:
-                raise ValidationError(f"{mail} - {e.error_dict['mail_address'][0]}")
-            
-        #   * we haven't yet saved the objects to db. We wait until all of them have been created 
-        #   * and have passed the model-validation checks
-        for i in invites:
-            i.save()
+        # all the mails are validated at once, without saving anything yet
+        if errors := Invitation.clean_many(mails):
+            mail = next(m for m in mails if m in errors)
+            raise ValidationError(f"{mail} - {errors[mail].error_dict['mail_address'][0]}")
+
+        #   * only once all of them have passed the model-validation checks, the invitations
+        #   * and their tasks are saved, in a single transaction
+        priority = SendInviteTask.BULK if len(mails) > self.BULK_INVITES else SendInviteTask.HIGH
+        Invitation.create_many(mails, task_priority=priority)
@@ -0,0 +1,56 @@
+"""
+    - gender prediction from first names, used to pick a default profile pic for Members.
+
+    IndianGenderPredictor trains its classifier from two csv files the first time it
+    predicts, and importing it pulls in pandas and nltk. Both are done once per process
+    here, on first use, and predictions are cached by name.
+"""
+
+from functools import lru_cache
+import threading
+
+
+# number of names whose prediction is kept
+CACHE_SIZE = 4096
+
+_predictor = None
+_predictor_lock = threading.Lock()
+
+
+#_______________________utilities_________________________
+
+def get_predictor():
+    """ returns the trained predictor of the current process, creating it on first use """
+    global _predictor
+    with _predictor_lock:
+        if _predictor is None:
+            from guess_indian_gender import IndianGenderPredictor
+
+            predictor = IndianGenderPredictor()
+            predictor.predict(name="")   # trains the classifier, only once
+            _predictor = predictor
+        return _predictor
+
+def normalize(name: str) -> str:
+    """ the predictor is trained on lowercase names, with single spaces """
+    return " ".join(str(name).split()).lower()
+
+@lru_cache(maxsize=CACHE_SIZE)
+def _predict(name: str) -> str:
+    return get_predictor().predict(name=name)
+
+def predict(name: str) -> str:
+    """ returns 'male' or 'female' for the first {name} """
+    return _predict(normalize(name))
+
+def predict_many(names) -> dict:
+    """
+        - returns {name: 'male' or 'female'} for each of the {names}, eg. for
+        Members imported in bulk.
+
+        *   names are predicted once whatever the number of times they appear,
+            and those predicted before are taken from the cache.
+    """
+    normalized = {name: normalize(name) for name in set(names)}
+    predictions = {key: _predict(key) for key in set(normalized.values())}
+    return {name: predictions[key] for name, key in normalized.items()}
@@ -0,0 +1,179 @@
+#_____________________________________________________________________________________________________
+"""
+    - defines the `manage.py import_members` command
+"""
+
+__author__ = "Tejaswin Singh, "
+__copyright__ = "Copyright 2024, Code Connect Home"
+__credits__ = ["Tejaswin Singh", "", ]
+__license__ = "GPL"
+__version__ = "1.0.0"
+__maintainer__ = "Tejaswin Singh"
+__email__ = "tejaswin.cs08@gmail.com"
+__status__ = "Development"
+
+#______________________________________________imports_________________________________________________
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import IntegrityError
+
+from members.models import Member
+
+from itertools import islice
+from time import perf_counter
+import csv
+import json
+
+
+#___________________________________________commands________________________________________________
+
+class Command(BaseCommand):
+    """
+        import_members command. Imports a roster of members (eg. alumni) from a CSV file, or
+        a JSONL file with one JSON object per line.
+
+        *   columns (or keys) are the Member fields: firstname, lastname, email, roll, contact,
+            programme (CSE, CCS, ECE, AVI) and semester (1 to 8), plus has_graduated and about
+            which are optional.
+        *   the file is read as a stream, --chunk-size rows at a time. The rows of a chunk are
+            validated together with the same rules as registration (see Member.clean_many()),
+            and the valid ones saved in a single transaction (see Member.create_many()).
+        *   each member is linked to the CustomUser with the same email, the missing ones are
+            created with no usable password (they set one on the setup-password page).
+        *   invalid rows are skipped, and reported with their line number (on stderr, or as
+            CSV in --errors FILE).
+        *   with --dry-run nothing is saved. Rows duplicating each other across chunks aren't
+            caught then, as the first one isn't in the db.
+    """
+
+    help = "imports members from a CSV or JSONL roster"
+
+    FIELDS = ('firstname', 'lastname', 'email', 'roll', 'contact', 'programme', 'semester', 'has_graduated', 'about')
+    REQUIRED_FIELDS = FIELDS[:7]
+    TRUE_VALUES = {'1', 'true', 'yes', 'y'}
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help="CSV or JSONL file to import")
+        parser.add_argument(
+            "--format", choices=("csv", "jsonl"), default=None,
+            help="format of the file. Guessed from its extension by default"
+        )
+        parser.add_argument(
+            "--chunk-size", type=int, default=500,
+            help="rows validated and saved together"
+        )
+        parser.add_argument(
+            "--errors", default=None,
+            help="write the rows that failed to this CSV file, instead of stderr"
+        )
+        parser.add_argument(
+            "--dry-run", action="store_true",
+            help="validate the rows without saving anything"
+        )
+
+    def handle(self, *args, **options):
+        path = options["path"]
+        file_format = options["format"] or ("jsonl" if path.endswith((".jsonl", ".ndjson")) else "csv")
+        chunk_size = options["chunk_size"]
+        if chunk_size < 1:
+            raise CommandError("--chunk-size must be at least 1.")
+
+        self.dry_run = options["dry_run"]
+        self.imported = 0
+        self.failed = []    # (line, email, error) of each invalid row
+        start = perf_counter()
+        try:
+            with open(path, encoding="utf-8-sig", newline="") as file:
+                rows = self.read_csv(file) if file_format == "csv" else self.read_jsonl(file)
+                while chunk := list(islice(rows, chunk_size)):
+                    self.import_chunk(chunk)
+        except (OSError, UnicodeDecodeError, csv.Error) as e:
+            raise CommandError(f"Can't read {path}: {e}")
+
+        self.report(options["errors"])
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"{'Validated' if self.dry_run else 'Imported'} {self.imported} member(s) in "
+                f"{perf_counter() - start:.2f}s, {len(self.failed)} row(s) failed"
+            )
+        )
+
+    #___________________________________________reading________________________________________________
+
+    def read_csv(self, file):
+        """ yields (line number, row dict or error message) for each row of a CSV {file} """
+        reader = csv.DictReader(file, skipinitialspace=True)
+        if missing := [field for field in self.REQUIRED_FIELDS if field not in (reader.fieldnames or [])]:
+            raise CommandError(f"Missing column(s): {', '.join(missing)}")
+        for row in reader:
+            yield reader.line_num, row
+
+    def read_jsonl(self, file):
+        """ yields (line number, row dict or error message) for each line of a JSONL {file} """
+        for line_num, line in enumerate(file, start=1):
+            if not line.strip():
+                continue
+            try:
+                row = json.loads(line)
+            except ValueError as e:
+                yield line_num, f"invalid JSON: {e}"
+                continue
+            yield line_num, row if isinstance(row, dict) else "not a JSON object"
+
+    #___________________________________________importing________________________________________________
+
+    def build_member(self, row: dict):
+        """ returns the (unsaved) Member of a {row}, or an error message if fields are missing """
+        if missing := [field for field in self.REQUIRED_FIELDS if row.get(field) in (None, "")]:
+            return f"missing {', '.join(missing)}"
+        has_graduated = row.get('has_graduated') or False
+        if not isinstance(has_graduated, bool):
+            has_graduated = str(has_graduated).strip().lower() in self.TRUE_VALUES
+        return Member(
+            **{field: str(row[field]).strip() for field in self.REQUIRED_FIELDS},
+            about=str(row.get('about') or "").strip(),
+            has_graduated=has_graduated,
+        )
+
+    def import_chunk(self, chunk: list):
+        """ validates the rows of a {chunk} and saves the valid ones """
+        lines, members = [], []
+        for line, row in chunk:
+            member = self.build_member(row) if isinstance(row, dict) else row
+            if isinstance(member, str):
+                self.failed.append((line, row.get('email', '') if isinstance(row, dict) else '', member))
+            else:
+                lines.append(line)
+                members.append(member)
+
+        errors = Member.clean_many(members)
+        for i, e in sorted(errors.items()):
+            message = "; ".join(f"{field}: {' '.join(messages)}" for field, messages in e.message_dict.items())
+            self.failed.append((lines[i], members[i].email, message))
+
+        valid = [member for i, member in enumerate(members) if i not in errors]
+        if valid and not self.dry_run:
+            try:
+                Member.create_many(valid)
+            except IntegrityError as e:
+                # eg. a member registered meanwhile, nothing of this chunk was saved
+                for i, member in enumerate(members):
+                    if i not in errors:
+                        self.failed.append((lines[i], member.email, f"not saved, {e}"))
+                return
+        self.imported += len(valid)
+
+    def report(self, path: str = None):
+        """ reports the rows that failed, to stderr or to the CSV file at {path} """
+        self.failed.sort()
+        if path:
+            with open(path, "w", newline="") as file:
+                writer = csv.writer(file)
+                writer.writerow(("line", "email", "error"))
+                writer.writerows(self.failed)
+            return
+        for line, email, error in self.failed:
+            # red-colored output
+            self.stderr.write(
+                self.style.ERROR(f'line {line}: {email} - {error}')
+            )
@@ -0,0 +1,17 @@
+# Generated by Django 5.0.3 on 2026-10-17 19:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('members', '0013_alter_member_user'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='invitation',
+            index=models.Index(fields=['accepted', 'sent_at'], name='invitation_accepted_sent_idx'),
+        ),
+    ]
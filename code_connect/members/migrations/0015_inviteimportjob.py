@@ -0,0 +1,28 @@
+# Generated by Django 5.0.3 on 2026-10-17 19:44
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('members', '0014_invitation_accepted_sent_idx'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='InviteImportJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('mails', models.JSONField(default=list)),
+                ('state', models.CharField(choices=[('Q', 'QUEUED'), ('V', 'VALIDATING'), ('C', 'CREATING'), ('D', 'DONE'), ('F', 'FAILED')], default='Q', max_length=1)),
+                ('total', models.PositiveIntegerField(default=0)),
+                ('validated', models.PositiveIntegerField(default=0)),
+                ('created', models.PositiveIntegerField(default=0)),
+                ('error_count', models.PositiveIntegerField(default=0)),
+                ('errors', models.JSONField(blank=True, default=list)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+            ],
+        ),
+    ]
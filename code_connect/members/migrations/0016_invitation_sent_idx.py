@@ -0,0 +1,17 @@
+# Generated by Django 5.0.3 on 2026-10-17 19:49
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('members', '0015_inviteimportjob'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='invitation',
+            index=models.Index(fields=['sent_at'], name='invitation_sent_idx'),
+        ),
+    ]
@@ -1,18 +1,19 @@
-from django.db import models
+from django.db import models, transaction, IntegrityError
 from django.conf import settings
 from django.core.exceptions import ValidationError, ObjectDoesNotExist, MultipleObjectsReturned
 from django.utils.translation import gettext_lazy as _
 from django.contrib.auth.models import AbstractUser, BaseUserManager
+from django.core import signing
 from django.utils import timezone
 
 from phonenumber_field.modelfields import PhoneNumberField
-from guess_indian_gender import IndianGenderPredictor
 
-from home.models import SendInviteTask
+from home.models import SendInviteTask, ImportInvitesTask
+from members import gender as gender_predictor
 
 import re
 import string
-import random
+import secrets
 from datetime import timedelta
 
 #_______________________________________models___________________________________________
@@ -56,18 +57,52 @@ class UserManager(BaseUserManager):
 
 
 class CustomUser(AbstractUser):
-    """ User model. """
+    """
+        - User model.
+
+        *   users created along with a Member have no usable password, until they set one
+            on the setup-password page. They get there with a setup token (see
+            make_setup_token()), which logs them in without any password to check.
+    """
 
     username = None
     email = models.EmailField(_('email address'), unique=True)
 
-    DEFAULT_PASSWORD = "12345678"
+    SETUP_TOKEN_SALT = "members.CustomUser.setup-password"
 
     USERNAME_FIELD = 'email'
     REQUIRED_FIELDS = []
 
     objects = UserManager()
 
+    #______________________instance methods_________________________
+
+    def make_setup_token(self) -> str:
+        """ returns a signed token logging this user in to set their password, see from_setup_token() """
+        return signing.TimestampSigner(salt=self.SETUP_TOKEN_SALT).sign(str(self.pk))
+
+    #______________________class methods_________________________
+
+    @classmethod
+    def from_setup_token(cls, token: str):
+        """
+            - returns the user of a setup {token}, or None if the token is invalid.
+
+            *   a token expires after PASSWORD_SETUP_TOKEN_MAX_AGE seconds.
+            *   it is only valid while the user has no usable password, so it can't be
+                used again once the password is set.
+        """
+        try:
+            pk = signing.TimestampSigner(salt=cls.SETUP_TOKEN_SALT).unsign(
+                token, max_age=settings.PASSWORD_SETUP_TOKEN_MAX_AGE
+            )
+            user = cls.objects.get(pk=pk)
+        except (signing.BadSignature, ObjectDoesNotExist):
+            return None
+        if user.has_usable_password() or not user.is_active:
+            return None
+        return user
+
 
 
 class Member(models.Model):
@@ -88,6 +123,11 @@ class Member(models.Model):
     AVI = {'tag': "AVI", 'roll_fmt': "BEAVI", 'name': "Avionics"}
     PROGRAMMES = [CSE, CCS, ECE, AVI]
     PROGRAMME_CHOICES= {prog['tag']: prog['name'] for prog in PROGRAMMES}
+    # roll format of each programme, eg. 22BECSE44 for CSE
+    ROLL_PATTERNS = {
+        prog['tag']: re.compile(r'^\d{2}(' + re.escape(prog['roll_fmt']) + r')\d{2}$', re.IGNORECASE)
+        for prog in PROGRAMMES
+    }
 
     SEMESTER = [
         ("1", "1st Semester"), ("2", "2nd Semester"),
@@ -150,7 +190,8 @@ class Member(models.Model):
             - custom save method 
 
             *   before saving a Member object, creates a CustomUser object first with
-                same firstname, lastname and email attributes and a default password
+                same firstname, lastname and email attributes and no usable password (it is
+                set by the member afterwards, see CustomUser). Nothing is hashed here.
             *   If a CustomUser with the same email already exists, then we simply refer
                 to that CustomUser via {user}. If no CustomUser exists and {user} is set
                 to NULL, then only we create a new CustomUser for our Member
@@ -166,7 +207,7 @@ class Member(models.Model):
 
                 user = CustomUser.objects.create_user(
                     first_name=self.firstname, last_name=self.lastname, 
-                    email=self.email, password=CustomUser.DEFAULT_PASSWORD
+                    email=self.email, password=None
                 )
                 self.user = user 
 
@@ -178,20 +219,13 @@ class Member(models.Model):
 
         #______________________inner functions_________________________
 
-        def is_valid_format(input_str, constant_part):
-            """ checks if the input_str contains the constant_part """
-            pattern = re.compile(r'^\d{2}(' + re.escape(constant_part) + r')\d{2}$', re.IGNORECASE)
-            return bool(pattern.match(input_str))
-        
         def check_roll(self):
             """ checks if the roll number matches the roll format of the selected programme """
-            for prog in self.PROGRAMMES:
-                if prog['tag'] == self.programme:
-                    if not is_valid_format(self.roll, prog['roll_fmt']):
-                        raise ValidationError(
-                            {"roll": _("Roll number doesn't match the roll-format of the selected programme.")}
-                        )
-                    break
+            pattern = self.ROLL_PATTERNS.get(self.programme)
+            if pattern and not pattern.match(self.roll):
+                raise ValidationError(
+                    {"roll": _("Roll number doesn't match the roll-format of the selected programme.")}
+                )
         
         def can_graduate(self):
             """ checks if Member is allowed to graduate """
@@ -204,7 +238,7 @@ class Member(models.Model):
             """ 
                 - tries to predict gender of the user based on their name and then assigns an appropiate profile pic
             """
-            gender = IndianGenderPredictor().predict(name=self.firstname)
+            gender = gender_predictor.predict(self.firstname)
             if gender == 'male':
                 self.profile_pic = 'defaults/male.png'
             else:
@@ -227,6 +261,112 @@ class Member(models.Model):
         return self.full_name()
 
 
+    #______________________class methods_________________________
+
+    @classmethod
+    def clean_many(cls, members: list) -> dict:
+        """
+            - bulk version of full_clean() for new {members}. Returns {index in members: ValidationError}
+            for the ones that can't be saved.
+
+            *   fields and clean() are checked in memory for each member. Profile pics are predicted
+                once per distinct first name (see `members.gender`).
+            *   {email}, {roll} and {contact} must be unique: each is looked up for all the {members}
+                with a single IN query. If several of the {members} share a value, the first one keeps it.
+        """
+        errors = {}
+        # fills the cache that clean() predicts from
+        gender_predictor.predict_many(member.firstname for member in members)
+        for i, member in enumerate(members):
+            try:
+                member.full_clean(validate_unique=False)
+            except ValidationError as e:
+                errors[i] = e.message_dict
+
+        unique_errors = {}
+        for name in ('email', 'roll', 'contact'):
+            values = {}
+            for i, member in enumerate(members):
+                if i not in errors:
+                    values.setdefault(str(getattr(member, name)), []).append(i)
+            taken = {
+                str(value) for value in
+                cls.objects.filter(**{f'{name}__in': list(values)}).values_list(name, flat=True)
+            }
+            for value, indexes in values.items():
+                for i in (indexes if value in taken else indexes[1:]):
+                    unique_errors.setdefault(i, {})[name] = members[i].unique_error_message(cls, (name,)).messages
+
+        errors.update(unique_errors)
+        return {i: ValidationError(message_dict) for i, message_dict in errors.items()}
+
+    @classmethod
+    def create_many(cls, members: list) -> list:
+        """
+            - bulk version of save() for new {members}, which must have passed clean_many().
+            Returns the created Members.
+
+            *   like save(), each member refers to the CustomUser with the same email. Those are
+                looked up with a single IN query, the missing ones are created (with no usable
+                password) with one bulk insert.
+            *   everything happens in one transaction, if any insert fails nothing is saved.
+        """
+        with transaction.atomic():
+            users = CustomUser.objects.in_bulk([member.email for member in members], field_name='email')
+            new_users = []
+            for member in members:
+                if member.email in users:
+                    member.user = users[member.email]
+                elif not member.user:
+                    member.user = CustomUser(
+                        first_name=member.firstname, last_name=member.lastname,
+                        email=CustomUser.objects.normalize_email(member.email),
+                    )
+                    member.user.set_unusable_password()
+                    new_users.append(member.user)
+            CustomUser.objects.bulk_create(new_users)
+            return cls.objects.bulk_create(members)
+
+
+
+class InvitationQuerySet(models.QuerySet):
+    """
+        - queries on Invitations by their expiry, evaluated by the db rather than by
+        calling has_expired() on every row.
+
+        *   expired(): sent more than VALID_DURATION ago (like has_expired()).
+        *   active(): not accepted, and either unsent or still valid.
+        *   pending_send(): not accepted and not sent yet.
+        *   with_expiry(): annotates each Invitation with {is_expired}, same value as has_expired().
+
+        NOTE: `accepted=False` is rendered as `NOT accepted`, which sqlite can't look up
+        in an index, so it is written as `accepted__in=[False]` below.
+    """
+
+    def cutoff(self):
+        """ Invitations sent at or before this are expired """
+        return timezone.now() - self.model.VALID_DURATION
+
+    def expired(self):
+        return self.filter(sent_at__lte=self.cutoff())
+
+    def active(self):
+        return self.filter(
+            models.Q(sent_at__isnull=True) | models.Q(sent_at__gt=self.cutoff()),
+            accepted__in=[False],
+        )
+
+    def pending_send(self):
+        return self.filter(accepted__in=[False], sent_at__isnull=True)
+
+    def with_expiry(self):
+        return self.annotate(is_expired=models.Case(
+            models.When(sent_at__lte=self.cutoff(), then=models.Value(True)),
+            default=models.Value(False),
+            output_field=models.BooleanField(),
+        ))
+
+
 
 class Invitation(models.Model):
     """
@@ -247,6 +387,10 @@ class Invitation(models.Model):
 
     VALID_DURATION = timedelta(days=7)
     CODE_LENGTH = 10
+    CODE_PREFIX = 'CUJ'
+    CODE_CHARS = string.ascii_uppercase + string.digits
+    # times an insert is retried with new codes if another process took one of them meanwhile
+    CODE_ATTEMPTS = 5
 
 
     #______________________model-fields_________________________
@@ -257,6 +401,17 @@ class Invitation(models.Model):
     sent_at = models.DateTimeField(blank=True, null=True)
     accepted = models.BooleanField(default=False)
 
+    objects = InvitationQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            # expired, unaccepted invitations are looked up on every invite (see clean_db()),
+            # also serves active() and pending_send()
+            models.Index(fields=['accepted', 'sent_at'], name='invitation_accepted_sent_idx'),
+            # expired() regardless of {accepted}, eg. in the admin list filter
+            models.Index(fields=['sent_at'], name='invitation_sent_idx'),
+        ]
+
 
     #______________________instance methods_________________________
 
@@ -265,28 +420,42 @@ class Invitation(models.Model):
         return f"Invite generated on {timezone.localtime(self.timestamp).strftime('%d-%m-%y %I:%M:%S')} for {self.mail_address}"
 
     def has_expired(self):
-        """ returns True if the given object has expired """
+        """ returns True if the given object has expired (see InvitationQuerySet for the db version) """
         if not self.sent_at: # if invitation exists but is not sent yet
             return False
         if timezone.now() - self.sent_at >= self.VALID_DURATION:
             return True
         return False
     
-    def save(self, *args, **kwargs):
+    def save(self, *args, task_priority=SendInviteTask.NORMAL, **kwargs):
         """
             - custom save method 
 
             *   after saving the Invitation, we create a SendEmail task
             that is responsible for actually sending the invitation mail to
             the provided {mail_address}
+            *   the task is queued in the {task_priority} lane (see Task.PRIORITY_CHOICES)
         """  
-        super().save(*args, **kwargs)  # Call the "real" save() method.
+        if self._state.adding:
+            for attempt in range(self.CODE_ATTEMPTS):
+                try:
+                    with transaction.atomic():
+                        super().save(*args, **kwargs)  # Call the "real" save() method.
+                    break
+                except IntegrityError:
+                    # the unique constraint is the final guard against code collisions
+                    if attempt + 1 == self.CODE_ATTEMPTS or not Invitation.objects.filter(code=self.code).exists():
+                        raise
+                    self.code = self.generate_codes(1)[0]
+        else:
+            super().save(*args, **kwargs)  # Call the "real" save() method.
 
         # create task only the first time when the Invitation was created
         if not self.sent_at:
             task = SendInviteTask(
                 name=f"Invitation to {self.mail_address}",
-                invite=self
+                invite=self,
+                priority=task_priority,
             )
             task.full_clean()
             task.save()
@@ -297,43 +466,129 @@ class Invitation(models.Model):
 
 
     #______________________class methods_________________________
-    
-    def clean_db():
-        """ deletes all expired Invitations that were not accepted """
-        for invite in Invitation.objects.all():
-            if invite.has_expired() and not invite.accepted:
-                invite.delete()
 
+    @classmethod
+    def clean_many(cls, mails) -> dict:
+        """
+            - bulk version of full_clean() for new Invitations to the given {mails}.
+            Returns {mail: ValidationError} for the mails that can't be invited.
 
-    #______________________model-level validation_________________________
+            *   the addresses are validated in memory, and the existing Invitations of
+                all the {mails} are looked up in a single query. The same errors as
+                full_clean() are returned (see clean_check_for_existing()).
+            *   an expired, unaccepted Invitation is not an error, create_many() replaces it.
+        """
+        errors = {}
+        field = cls._meta.get_field('mail_address')
+        for mail in mails:
+            try:
+                field.clean(mail, None)
+            except ValidationError as e:
+                errors[mail] = ValidationError({'mail_address': e.error_list})
+
+        existing = cls.objects.with_expiry().filter(mail_address__in=[m for m in mails if m not in errors])
+        for invite in existing:
+            if invite.accepted:
+                errors[invite.mail_address] = ValidationError(
+                    {"mail_address": _("This mail has already accepted an Invitation before.")}
+                )
+            elif not invite.is_expired:
+                errors[invite.mail_address] = ValidationError(
+                    {"mail_address": _("A valid invitation already exists for this mail.")}
+                )
+        return errors
 
-    def clean(self):
+    @classmethod
+    def create_many(cls, mails, task_priority=SendInviteTask.NORMAL) -> list:
         """
-            - custom clean method
+            - bulk version of save() for new Invitations to the given {mails}, which
+            must have passed clean_many(). Returns the created Invitations.
+
+            *   everything happens in one transaction: expired, unaccepted Invitations of
+                the {mails} are deleted, then the Invitations and their SendInviteTasks
+                (in the {task_priority} lane) are inserted with a few bulk queries.
+            *   if any insert fails (eg. another admin invited the same mail meanwhile),
+                nothing is saved.
+        """
+        mails = list(mails)
+        with transaction.atomic():
+            cls.objects.expired().filter(mail_address__in=mails, accepted=False).delete()
+            invites = [cls(mail_address=mail, code=code) for mail, code in zip(mails, cls.generate_codes(len(mails)))]
+            for attempt in range(cls.CODE_ATTEMPTS):
+                try:
+                    with transaction.atomic():
+                        invites = cls.objects.bulk_create(invites)
+                    break
+                except IntegrityError:
+                    # some codes were taken since they were generated, replace only those
+                    taken = set(cls.objects.filter(code__in=[i.code for i in invites]).values_list('code', flat=True))
+                    if attempt + 1 == cls.CODE_ATTEMPTS or not taken:
+                        raise
+                    conflicts = [i for i in invites if i.code in taken]
+                    for invite, code in zip(conflicts, cls.generate_codes(len(conflicts))):
+                        invite.code = code
+            SendInviteTask.create_tasks([
+                SendInviteTask(name=f"Invitation to {i.mail_address}", invite=i, priority=task_priority)
+                for i in invites
+            ])
+        return invites
+
+    @classmethod
+    def generate_codes(cls, n: int) -> list:
+        """
+            - generates {n} distinct codes that no Invitation uses yet.
+
+            *   codes are drawn with `secrets`, as they grant access to registration.
+            *   duplicates are dropped in memory, and the codes are checked against the
+                db with a single IN query. Only the ones already taken are drawn again
+                (with 36^7 possible codes, there rarely are any).
+            *   a code can still be taken by another process before it is saved, the
+                unique constraint catches that (see save() and create_many()).
+        """
+        codes = set()
+        while len(codes) < n:
+            while len(codes) < n:
+                codes.add(cls.CODE_PREFIX + ''.join(
+                    secrets.choice(cls.CODE_CHARS) for _ in range(cls.CODE_LENGTH - len(cls.CODE_PREFIX))
+                ))
+            codes -= set(cls.objects.filter(code__in=codes).values_list('code', flat=True))
+        return list(codes)
+
+    @classmethod
+    def clean_db(cls, chunk_size: int = 1000) -> int:
+        """
+            - deletes all expired Invitations that were not accepted. Returns how many were deleted.
 
-            *   fills 'code' field with randomly generated strings
+            *   same condition as has_expired(), but evaluated by the db (using the
+                invitation_accepted_sent_idx index) rather than on every row in Python.
+                See InvitationQuerySet.
+            *   deletes {chunk_size} Invitations at a time, so a large backlog doesn't
+                lock the table for long.
         """
+        expired = cls.objects.expired().filter(accepted__in=[False])
+        deleted = 0
+        while pks := list(expired.values_list('pk', flat=True)[:chunk_size]):
+            # the SendInviteTasks of these Invitations are kept, with {invite} set to NULL
+            cls.objects.filter(pk__in=pks).delete()
+            deleted += len(pks)
+        return deleted
 
-        #______________________inner functions_________________________
 
-        def get_random_string(length=6, chars=string.ascii_uppercase+string.digits):
-            """ generates pseudo random strings of required length  """
-            return ''.join(random.choice(chars) for _ in range(length))
-        
-        def generate_code():
-            """ keep generating random strings until you get a unique one """
-            while True:
-                self.code = 'CUJ' + get_random_string(self.CODE_LENGTH - 3)
-                if not Invitation.objects.filter(code=self.code).all():
-                    break
+    #______________________model-level validation_________________________
 
+    def clean(self):
+        """
+            - custom clean method
+
+            *   fills 'code' field with a randomly generated, unused string (see generate_codes())
+        """
         self.clean_check_for_existing()
         super().clean() # always call this method
         try:
             Invitation.objects.get(mail_address=self.mail_address)
             # only generate code at the time of object creation
         except ObjectDoesNotExist:
-            generate_code()            
+            self.code = self.generate_codes(1)[0]
         
     def clean_check_for_existing(self):
         """
@@ -348,7 +603,7 @@ class Invitation(models.Model):
                     generated until the first one expires.
         """
         try:
-            invite = Invitation.objects.get(mail_address=self.mail_address)
+            invite = Invitation.objects.with_expiry().get(mail_address=self.mail_address)
             if invite == self:
                 return
         except ObjectDoesNotExist:
@@ -358,9 +613,159 @@ class Invitation(models.Model):
                 {"mail_address": _("This mail has already accepted an Invitation before.")}
             )
         else:   
-            if invite.has_expired():
+            if invite.is_expired:
                 invite.delete() # delete the expired invite, so that a new one can be generated
             else:
                 raise ValidationError(
                     {"mail_address": _("A valid invitation already exists for this mail.")}
                 )
+
+
+
+class InviteImportJob(models.Model):
+    """
+        - a bulk invite running in the background, so that the admin's request doesn't wait
+        for thousands of Invitations to be validated and saved (see InviteForm.JOB_INVITES).
+
+        *   {mails}: the sorted addresses to invite.
+        *   the job is executed by an ImportInvitesTask in `run_tasks` (see run()). It first
+            validates all the mails: if any of them can't be invited, nothing is saved (like
+            InviteForm) and the errors are kept in {errors}. Then the Invitations are created
+            CHUNK_SIZE at a time.
+        *   {validated} and {created} count the mails done in each phase, they are shown on
+            the status page of the job.
+        *   a chunk is created in the same transaction as the {created} update, so a job whose
+            worker died picks up where it stopped once its task is requeued.
+    """
+
+    #______________________field choices_________________________
+
+    QUEUED = 'Q'
+    VALIDATING = 'V'
+    CREATING = 'C'
+    DONE = 'D'
+    FAILED = 'F'
+
+    STATE_CHOICES = {
+        QUEUED: 'QUEUED',
+        VALIDATING: 'VALIDATING',
+        CREATING: 'CREATING',
+        DONE: 'DONE',
+        FAILED: 'FAILED',
+    }
+
+    #______________________const_________________________
+
+    CHUNK_SIZE = 500
+    MAX_ERRORS = 100    # errors kept on a failed job, the rest are only counted
+
+
+    #______________________model-fields_________________________
+
+    mails = models.JSONField(default=list)
+    state = models.CharField(max_length=1, choices=STATE_CHOICES, default=QUEUED)
+    total = models.PositiveIntegerField(default=0)
+    validated = models.PositiveIntegerField(default=0)
+    created = models.PositiveIntegerField(default=0)
+    error_count = models.PositiveIntegerField(default=0)
+    errors = models.JSONField(default=list, blank=True)     # [{'mail': ..., 'error': ...}, ...]
+    created_at = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField(blank=True, null=True)
+
+
+    #______________________class methods_________________________
+
+    @classmethod
+    def enqueue(cls, mails) -> 'InviteImportJob':
+        """ creates a job for the given {mails}, and the task executing it """
+        mails = sorted(mails)
+        with transaction.atomic():
+            job = cls.objects.create(mails=mails, total=len(mails))
+            task = ImportInvitesTask(
+                name=f"Import of {len(mails)} invitations",
+                job=job,
+                # the admin is waiting on the status page
+                priority=ImportInvitesTask.HIGH,
+            )
+            task.full_clean()
+            task.save()
+        return job
+
+
+    #______________________instance methods_________________________
+
+    def run(self) -> None:
+        """
+            - validates and creates the Invitations of the job, updating its progress on the way.
+            Called by the ImportInvitesTask of the job.
+        """
+        if self.state in (self.QUEUED, self.VALIDATING):
+            self.update(state=self.VALIDATING, validated=0)
+            Invitation.clean_db()   # deletes all expired AND unaccepted invitations
+            errors, error_count = [], 0
+            for start in range(0, self.total, self.CHUNK_SIZE):
+                chunk = self.mails[start:start + self.CHUNK_SIZE]
+                found = Invitation.clean_many(chunk)
+                for mail in chunk:
+                    if mail in found:
+                        error_count += 1
+                        if len(errors) < self.MAX_ERRORS:
+                            errors.append({'mail': mail, 'error': found[mail].messages[0]})
+                self.update(validated=start + len(chunk))
+            if error_count:
+                self.update(state=self.FAILED, errors=errors, error_count=error_count, finished_at=timezone.now())
+                return
+            self.update(state=self.CREATING)
+
+        # bulk jobs don't hold up the invites of other admins (see Task.PRIORITY_WEIGHTS)
+        for start in range(self.created, self.total, self.CHUNK_SIZE):
+            chunk = self.mails[start:start + self.CHUNK_SIZE]
+            with transaction.atomic():
+                # written first: on sqlite, a transaction that reads first can't wait for
+                # the write lock held by another worker, it fails with "database is locked"
+                self.update(created=start + len(chunk))
+                Invitation.create_many(chunk, task_priority=SendInviteTask.BULK)
+        self.update(state=self.DONE, finished_at=timezone.now())
+
+    def fail(self, error: Exception) -> None:
+        """
+            - marks the job as failed because of an unexpected {error}. The invitations of
+            the chunks committed so far are kept, {created} counts them.
+        """
+        self.update(
+            state=self.FAILED, errors=self.errors + [{'mail': None, 'error': str(error)}],
+            error_count=self.error_count + 1, finished_at=timezone.now(),
+        )
+
+    def update(self, **fields) -> None:
+        """ sets and saves only the given {fields} """
+        for name, value in fields.items():
+            setattr(self, name, value)
+        self.save(update_fields=list(fields))
+
+    def is_finished(self) -> bool:
+        return self.state in (self.DONE, self.FAILED)
+
+    def progress(self) -> int:
+        """ percentage of the job done, validation and creation each count for half of it """
+        if not self.total:
+            return 100
+        return (self.validated + self.created) * 100 // (2 * self.total)
+
+    def status(self) -> dict:
+        """ progress of the job, as returned by the status endpoint """
+        return {
+            'id': self.pk,
+            'state': self.STATE_CHOICES[self.state],
+            'finished': self.is_finished(),
+            'progress': self.progress(),
+            'total': self.total,
+            'validated': self.validated,
+            'created': self.created,
+            'error_count': self.error_count,
+            'errors': self.errors,
+        }
+
+    def __str__(self):
+        """ eg: 'Import of 3000 invitations [State: CREATING]' """
+        return f"Import of {self.total} invitations [State: {self.STATE_CHOICES[self.state]}]"
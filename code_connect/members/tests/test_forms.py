@@ -1,4 +1,6 @@
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.db import connection
 from django.core.files.uploadedfile import SimpleUploadedFile
 from django.core.exceptions import ObjectDoesNotExist, ValidationError
 # from django.core.files import File
@@ -6,6 +8,7 @@ from django.core.exceptions import ObjectDoesNotExist, ValidationError
 from members.forms import MemberForm, InviteForm
 from members.models import Invitation, Member, CustomUser
 from members import utils
+from home.models import SendInviteTask, ImportInvitesTask
 
 
 
@@ -83,6 +86,50 @@ class InviteFormTests(TestCase):
             errors=["No mail addresses were found in the file."]
         )
         
+    def test_csv_streamed(self):
+        """
+            - tests that the csv file is parsed correctly from small chunks, even when
+            a character or a quoted field is split between two of them
+        """
+        content = (
+            '\ufeffname, email\n"Zoë\nSmith", zoe@mail.com\r\nJosé, jose@mail.com'
+        ).encode('utf-8')
+        lines = list(utils.iter_uploaded_lines(self.create_simple_csv(content=content), chunk_size=3))
+        self.assertEqual(lines, ['name, email\n', '"Zoë\n', 'Smith", zoe@mail.com\n', 'José, jose@mail.com'])
+
+        file = self.create_simple_csv(name='streamed.csv', content=content)
+        form = self.create_simple_form(csv_file=file)
+        self.assertTrue(form.is_valid(), form.errors)
+        self.assertEqual(
+            set(Invitation.objects.values_list('mail_address', flat=True)), {'zoe@mail.com', 'jose@mail.com'}
+        )
+
+    def test_csv_carriage_returns(self):
+        """
+            - tests that lines ending with a lone carriage return (Excel's "CSV (Macintosh)")
+            are split, even when a "\r\n" is split between two chunks
+        """
+        lines = list(utils.iter_uploaded_lines(self.create_simple_csv(content=b'email\ra@x.com\r\nb@x.com\r'), chunk_size=14))
+        self.assertEqual(lines, ['email\n', 'a@x.com\n', 'b@x.com\n'])
+
+        file = self.create_simple_csv(name='mac.csv', content=b'email\ra@x.com\rb@x.com\r')
+        form = self.create_simple_form(csv_file=file)
+        self.assertTrue(form.is_valid(), form.errors)
+        self.assertEqual(
+            set(Invitation.objects.values_list('mail_address', flat=True)), {'a@x.com', 'b@x.com'}
+        )
+
+    def test_csv_encoding(self):
+        """
+            - tests that a file which isn't valid utf-8 is rejected
+        """
+        file = self.create_simple_csv(name='latin1.csv', content='name, email\nJosé, jose@mail.com'.encode('latin-1'))
+        form = self.create_simple_form(csv_file=file)
+        self.assertFormError(
+            form, field='csv_file', 
+            errors=["Error processing CSV file. Check your file format."]
+        )
+
     def test_invalid_mail_address(self):
         """
             - tests that mail addresses provided are in correct format.
@@ -126,6 +173,57 @@ class InviteFormTests(TestCase):
         else:
             raise ValidationError(f"{form.errors}")
 
+    def test_invite_priority(self):
+        """
+            - tests that a few invites are queued in the HIGH lane, while larger batches
+            go to the BULK lane
+        """
+        form = self.create_simple_form(mail_list='one@mail.com, two@mail.com')
+        self.assertTrue(form.is_valid(), form.errors)
+        self.assertEqual(
+            set(SendInviteTask.objects.values_list('priority', flat=True)), {SendInviteTask.HIGH}
+        )
+
+        mails = ", ".join(f"bulk{i}@mail.com" for i in range(InviteForm.BULK_INVITES + 1))
+        form = self.create_simple_form(mail_list=mails)
+        self.assertTrue(form.is_valid(), form.errors)
+        self.assertEqual(
+            SendInviteTask.objects.filter(priority=SendInviteTask.BULK).count(), InviteForm.BULK_INVITES + 1
+        )
+
+    def test_bulk_invites(self):
+        """
+            - tests that the number of queries doesn't grow with the number of mails,
+            and that every invitation gets its task
+        """
+        def queries(n, prefix):
+            mails = ", ".join(f"{prefix}{i}@mail.com" for i in range(n))
+            with CaptureQueriesContext(connection) as ctx:
+                form = self.create_simple_form(mail_list=mails)
+                self.assertTrue(form.is_valid(), form.errors)
+            return len(ctx.captured_queries)
+
+        # (the inserts are split into batches of a few hundred rows on sqlite)
+        self.assertEqual(queries(5, "few"), queries(50, "many"))
+        self.assertEqual(Invitation.objects.count(), 55)
+        tasks = SendInviteTask.objects.select_related('invite')
+        self.assertEqual(len(tasks), 55)
+        self.assertEqual({t.task_function_id for t in tasks}, {SendInviteTask.TASK_FUNCTION_ID})
+        self.assertEqual({t.invite.mail_address for t in tasks}, set(Invitation.objects.values_list('mail_address', flat=True)))
+        self.assertEqual(len(set(Invitation.objects.values_list('code', flat=True))), 55)
+
+    def test_invite_job(self):
+        """
+            - tests that more than JOB_INVITES mails are handed over to an InviteImportJob
+            instead of being invited right away
+        """
+        mails = ", ".join(f"job{i}@mail.com" for i in range(InviteForm.JOB_INVITES + 1))
+        form = self.create_simple_form(mail_list=mails)
+        self.assertTrue(form.is_valid(), form.errors)
+        self.assertEqual(form.job.total, InviteForm.JOB_INVITES + 1)
+        self.assertEqual(Invitation.objects.count(), 0)
+        self.assertEqual(ImportInvitesTask.objects.get().job, form.job)
+
     def test_accepted_invite(self):
         """
             - tests that if an invitation sent to a mail was accepted, then
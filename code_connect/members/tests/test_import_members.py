@@ -0,0 +1,117 @@
+#_____________________________________________________________________________________________________
+"""
+    - defines tests for the `import_members` command.
+"""
+
+__author__ = "Tejaswin Singh, "
+__copyright__ = "Copyright 2024, Code Connect Home"
+__credits__ = ["Tejaswin Singh", "", ]
+__license__ = "GPL"
+__version__ = "1.0.0"
+__maintainer__ = "Tejaswin Singh"
+__email__ = "tejaswin.cs08@gmail.com"
+__status__ = "Development"
+
+#______________________________________________imports_________________________________________________
+
+from django.test import TestCase
+from django.core.management import call_command
+from django.core.management.base import CommandError
+
+from members import gender as gender_predictor
+from members.models import Member, CustomUser
+
+from io import StringIO
+from unittest import mock
+import csv
+import json
+import os
+import tempfile
+
+
+class ImportMembersTests(TestCase):
+    """ tests for the `import_members` command """
+
+    #_______________________utilities_________________________
+
+    def setUp(self):
+        # no need to train the gender predictor here
+        patcher = mock.patch.object(gender_predictor, "_predict", return_value='female')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.dir.cleanup)
+
+    def write(self, name, content):
+        path = os.path.join(self.dir.name, name)
+        with open(path, "w", newline="") as file:
+            file.write(content)
+        return path
+
+    def import_members(self, path, *args):
+        stdout, stderr = StringIO(), StringIO()
+        call_command("import_members", path, *args, stdout=stdout, stderr=stderr)
+        return stdout.getvalue(), stderr.getvalue()
+
+    CSV = (
+        "firstname,lastname,email,roll,contact,programme,semester,has_graduated\n"
+        "Priya,Sharma,priya@mail.dev,20becse01,+91 9999999901,CSE,8,yes\n"
+        "Anita,Rao,anita@mail.dev,21BEAVI02,+91 9999999902,AVI,4,\n"
+        "Neha,Gupta,neha@mail.dev,21BEECE03,+91 9999999903,CSE,4,no\n"
+        "Isha,Verma,priya@mail.dev,21becse04,+91 9999999904,CSE,4,no\n"
+        ",Das,ria@mail.dev,21becse05,+91 9999999905,CSE,4,no\n"
+    )
+
+    #_______________________tests_________________________
+
+    def test_import_csv(self):
+        """
+            - tests that the valid rows are imported, and the invalid ones reported by line
+        """
+        path = self.write("roster.csv", self.CSV)
+        stdout, stderr = self.import_members(path, "--chunk-size", "2")
+
+        self.assertIn("Imported 2 member(s)", stdout)
+        self.assertIn("3 row(s) failed", stdout)
+        self.assertEqual(
+            [line.split(":")[0] for line in stderr.splitlines()], ["line 4", "line 5", "line 6"]
+        )
+        self.assertTrue(Member.objects.get(email="priya@mail.dev").has_graduated)
+        self.assertFalse(Member.objects.get(email="anita@mail.dev").has_graduated)
+        self.assertFalse(CustomUser.objects.get(email="anita@mail.dev").has_usable_password())
+
+    def test_import_jsonl(self):
+        """
+            - tests that a JSONL roster is read line by line, with bad lines reported
+        """
+        row = {
+            'firstname': "Priya", 'lastname': "Sharma", 'email': "priya@mail.dev", 'roll': "20becse01",
+            'contact': "+91 9999999901", 'programme': "CSE", 'semester': 8, 'has_graduated': True,
+        }
+        path = self.write("roster.jsonl", f"{json.dumps(row)}\n\n{{not json\n[1, 2]\n")
+        errors = os.path.join(self.dir.name, "errors.csv")
+        stdout, stderr = self.import_members(path, "--errors", errors)
+
+        self.assertIn("Imported 1 member(s)", stdout)
+        self.assertEqual(stderr, "")
+        with open(errors, newline="") as file:
+            self.assertEqual([row['line'] for row in csv.DictReader(file)], ["3", "4"])
+        self.assertTrue(Member.objects.get(email="priya@mail.dev").has_graduated)
+
+    def test_dry_run(self):
+        """
+            - tests that --dry-run validates the rows without saving them
+        """
+        path = self.write("roster.csv", self.CSV)
+        stdout, _ = self.import_members(path, "--dry-run")
+        self.assertIn("Validated 2 member(s)", stdout)
+        self.assertFalse(Member.objects.exists())
+        self.assertFalse(CustomUser.objects.exists())
+
+    def test_missing_columns(self):
+        """
+            - tests that a CSV without the required columns is refused
+        """
+        path = self.write("roster.csv", "firstname,lastname,email\nPriya,Sharma,priya@mail.dev\n")
+        with self.assertRaisesMessage(CommandError, "roll, contact, programme, semester"):
+            self.import_members(path)
@@ -1,11 +1,17 @@
 from django.test import TestCase, SimpleTestCase
 from django.core.exceptions import ValidationError, ObjectDoesNotExist, MultipleObjectsReturned
 from django.utils import timezone
+from django.conf import settings
 
 from datetime import timedelta
+from unittest import mock
+import subprocess
+import sys
 
 from members import utils
-from members.models import Member, CustomUser, Invitation
+from members import gender as gender_predictor
+from members.models import Member, CustomUser, Invitation, InviteImportJob
+from home.models import SendInviteTask, ImportInvitesTask
 
 
 
@@ -89,6 +95,129 @@ class MemberModelTests(TestCase):
         self.assertEqual(m.profile_pic, 'defaults/profile.png')
 
 
+class MemberBulkTests(TestCase):
+    """ tests for Member.clean_many() and Member.create_many() """
+
+    #_______________________utilities_________________________
+
+    def setUp(self):
+        # no need to train the gender predictor here
+        patcher = mock.patch.object(gender_predictor, "_predict", return_value='male')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def create_member(self, n, **fields):
+        return Member(**{
+            'firstname': "John", 'lastname': "Oliver", 'email': f"bulk{n}@mail.dev",
+            'roll': f"22becse{n:02d}", 'contact': f"+91 99999999{n:02d}", 'programme': 'CSE',
+            'semester': '4', **fields
+        })
+
+    #_______________________tests_________________________
+
+    def test_clean_many(self):
+        """
+            - tests that clean_many() returns the errors of full_clean(), by index of the member
+        """
+        members = [
+            self.create_member(0),
+            self.create_member(1, programme='AVI'),
+            self.create_member(2, has_graduated=True),
+            self.create_member(3, semester='8', has_graduated=True),
+        ]
+        errors = Member.clean_many(members)
+        self.assertEqual(sorted(errors), [1, 2])
+        self.assertIn('roll', errors[1].message_dict)
+        self.assertIn('has_graduated', errors[2].message_dict)
+
+    def test_clean_many_unique(self):
+        """
+            - tests that values taken in the db, or by an earlier member of the batch, are errors
+        """
+        existing = self.create_member(0)
+        existing.save()
+        members = [
+            self.create_member(1, email=existing.email),
+            self.create_member(2),
+            self.create_member(3, roll="22becse02"),
+            self.create_member(4, contact="+91 9999999902"),
+        ]
+        with self.assertNumQueries(3):
+            errors = Member.clean_many(members)
+        self.assertEqual(
+            {i: list(e.message_dict) for i, e in errors.items()},
+            {0: ['email'], 2: ['roll'], 3: ['contact']}
+        )
+
+    def test_create_many(self):
+        """
+            - tests that create_many() refers existing CustomUsers by email, and creates the
+            others with no usable password, in a fixed number of queries
+        """
+        user = CustomUser.objects.create_user(email="bulk0@mail.dev")
+        members = [self.create_member(n) for n in range(5)]
+        # lookup users, insert users, insert members (+ the savepoint)
+        with self.assertNumQueries(5):
+            Member.create_many(members)
+
+        self.assertEqual(Member.objects.count(), 5)
+        self.assertEqual(Member.objects.get(email="bulk0@mail.dev").user, user)
+        for member in Member.objects.exclude(email="bulk0@mail.dev").select_related('user'):
+            self.assertEqual(member.user.email, member.email)
+            self.assertFalse(member.user.has_usable_password())
+
+
+class GenderPredictionTests(SimpleTestCase):
+    """ Tests for `members.gender` """
+
+    #_______________________utilities_________________________
+
+    def setUp(self):
+        # a fresh (untrained) predictor and cache for every test
+        patcher = mock.patch.object(gender_predictor, "_predictor", None)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        gender_predictor._predict.cache_clear()
+        self.addCleanup(gender_predictor._predict.cache_clear)
+
+    #_______________________tests_________________________
+
+    def test_predictor_cached(self):
+        """
+            - tests that the predictor is created and trained once, and that each
+            normalized name is predicted once
+        """
+        with mock.patch("guess_indian_gender.IndianGenderPredictor") as predictor_class:
+            predictor = predictor_class.return_value
+            predictor.predict.side_effect = lambda name: 'female' if name.endswith('a') else 'male'
+
+            self.assertEqual(gender_predictor.predict("  Priya "), 'female')
+            self.assertEqual(
+                gender_predictor.predict_many(["PRIYA", "rahul", "Rahul"]),
+                {"PRIYA": 'female', "rahul": 'male', "Rahul": 'male'}
+            )
+        predictor_class.assert_called_once()
+        # "" trains the classifier
+        self.assertEqual(
+            [call.kwargs['name'] for call in predictor.predict.call_args_list], ["", "priya", "rahul"]
+        )
+
+    def test_not_imported_at_startup(self):
+        """
+            - tests that starting the project doesn't import the predictor, nor the
+            heavy packages it depends on (see `manage.py bench_startup`)
+        """
+        script = (
+            "import sys, django; django.setup(); "
+            "from django.urls import get_resolver; get_resolver().url_patterns; "
+            "print(' '.join(m for m in ('guess_indian_gender', 'pandas', 'nltk') if m in sys.modules))"
+        )
+        result = subprocess.run(
+            [sys.executable, "-c", script], cwd=settings.BASE_DIR, capture_output=True, text=True, check=True
+        )
+        self.assertEqual(result.stdout.strip(), "")
+
+
 class InvitationModelTests(TestCase):
     """ Tests for Invitation """
 
@@ -145,6 +274,44 @@ class InvitationModelTests(TestCase):
         self.assertEqual(i.has_expired(), True)
         self.assertEqual(i2.has_expired(), False)
 
+    def test_generate_codes(self):
+        """
+            - tests that generated codes are distinct, and that codes already taken
+            (or drawn twice) are drawn again
+        """
+        i = self.create_simple_invitation()
+        i.full_clean()
+        i.save()
+        suffix = i.code[len(Invitation.CODE_PREFIX):]
+
+        # the first draw repeats the taken code, twice
+        draws = iter(suffix + suffix + "AAAAAAA" + "BBBBBBB")
+        with mock.patch("members.models.secrets.choice", lambda chars: next(draws)):
+            codes = Invitation.generate_codes(2)
+        self.assertEqual(sorted(codes), ["CUJAAAAAAA", "CUJBBBBBBB"])
+
+    def test_code_collision_retried(self):
+        """
+            - tests that invites are still created if their code got taken before
+            they were saved
+        """
+        i = self.create_simple_invitation()
+        i.full_clean()
+        i.save()
+
+        generate_codes = Invitation.generate_codes
+        with mock.patch.object(
+            Invitation, "generate_codes", side_effect=[[i.code], generate_codes(1)]
+        ):
+            invites = Invitation.create_many(["other@mail.dev"])
+        self.assertNotEqual(invites[0].code, i.code)
+        self.assertTrue(Invitation.objects.filter(mail_address="other@mail.dev").exists())
+
+        # same for a single invite
+        i2 = Invitation(mail_address="third@mail.dev", code=i.code)
+        i2.save()
+        self.assertNotEqual(i2.code, i.code)
+
     def test_clean_db(self):
         """
             - tests `clean_db()` class method to see if it deletes all expired and 
@@ -160,6 +327,59 @@ class InvitationModelTests(TestCase):
         with self.assertRaises(ObjectDoesNotExist):
             Invitation.objects.get(id=i.pk) # i doesn't exist thus it was deleted
 
+    def test_clean_db_chunks(self):
+        """
+            - tests that `clean_db()` deletes expired invites in chunks, and keeps
+            accepted, unsent and unexpired ones
+        """
+        expired = utils.get_expired_invitation_time()
+        for n in range(5):
+            i = self.create_simple_invitation(mail_address=f"expired{n}@mail.edu", sent_at=expired)
+            i.full_clean()
+            i.save()
+        kept = [
+            self.create_simple_invitation(mail_address="accepted@mail.edu", sent_at=expired, accepted=True),
+            self.create_simple_invitation(mail_address="unsent@mail.edu"),
+            self.create_simple_invitation(mail_address="valid@mail.edu", sent_at=timezone.now()),
+        ]
+        for i in kept:
+            i.full_clean()
+            i.save()
+
+        self.assertEqual(Invitation.clean_db(chunk_size=2), 5)
+        self.assertEqual(
+            set(Invitation.objects.values_list('mail_address', flat=True)),
+            {i.mail_address for i in kept}
+        )
+
+    def test_querysets(self):
+        """
+            - tests the `expired()`, `active()` and `pending_send()` querysets, and that
+            {is_expired} annotated by `with_expiry()` agrees with `has_expired()`
+        """
+        invites = {
+            'expired': self.create_simple_invitation(
+                mail_address="expired@mail.edu", sent_at=utils.get_expired_invitation_time()
+            ),
+            'valid': self.create_simple_invitation(mail_address="valid@mail.edu", sent_at=timezone.now()),
+            'unsent': self.create_simple_invitation(mail_address="unsent@mail.edu"),
+            'accepted': self.create_simple_invitation(
+                mail_address="accepted@mail.edu", sent_at=timezone.now(), accepted=True
+            ),
+        }
+        for i in invites.values():
+            i.full_clean()
+            i.save()
+
+        def mails(queryset):
+            return set(queryset.values_list('mail_address', flat=True))
+
+        self.assertEqual(mails(Invitation.objects.expired()), {"expired@mail.edu"})
+        self.assertEqual(mails(Invitation.objects.active()), {"valid@mail.edu", "unsent@mail.edu"})
+        self.assertEqual(mails(Invitation.objects.pending_send()), {"unsent@mail.edu"})
+        for i in Invitation.objects.with_expiry():
+            self.assertEqual(i.is_expired, i.has_expired(), i.mail_address)
+
     def test_accepted_invite(self):
         """
             - tests that a new Invitation object won't be created
@@ -211,4 +431,88 @@ class InvitationModelTests(TestCase):
 
         # we can also check that 'i' was deleted
         with self.assertRaises(ObjectDoesNotExist):
-            Invitation.objects.get(id=i.pk)
\ No newline at end of file
+            Invitation.objects.get(id=i.pk)
+
+
+
+class InviteImportJobTests(TestCase):
+    """ tests for InviteImportJob """
+
+    #_______________________utilities_________________________
+
+    def setUp(self):
+        # a few chunks, even with a handful of mails
+        self.chunk_size = mock.patch.object(InviteImportJob, "CHUNK_SIZE", 2)
+        self.chunk_size.start()
+
+    def tearDown(self):
+        self.chunk_size.stop()
+
+    def create_job(self, n=5, prefix="job"):
+        return InviteImportJob.enqueue({f"{prefix}{i}@mail.dev" for i in range(n)})
+
+    #_______________________tests_________________________
+
+    def test_enqueue(self):
+        """
+            - tests that a queued job has its task, and hasn't invited anyone yet
+        """
+        job = self.create_job()
+        self.assertEqual(job.state, job.QUEUED)
+        self.assertEqual(job.mails, sorted(job.mails))
+        self.assertEqual(ImportInvitesTask.objects.get().job, job)
+        self.assertEqual(Invitation.objects.count(), 0)
+
+    def test_run(self):
+        """
+            - tests that running a job creates all its invitations, in the BULK lane
+        """
+        job = self.create_job()
+        job.run()
+        job.refresh_from_db()
+        self.assertEqual(job.state, job.DONE)
+        self.assertEqual((job.validated, job.created, job.progress()), (5, 5, 100))
+        self.assertEqual(Invitation.objects.count(), 5)
+        self.assertEqual(
+            SendInviteTask.objects.filter(priority=SendInviteTask.BULK).count(), 5
+        )
+
+    def test_run_invalid_mails(self):
+        """
+            - tests that nothing is created if any mail can't be invited, and that
+            the errors are kept on the job
+        """
+        i = Invitation(mail_address="job3@mail.dev", accepted=True)
+        i.full_clean()
+        i.save()
+        job = InviteImportJob.enqueue({"job1@mail.dev", "job2@mail.dev", "job3@mail.dev", "job@"})
+        job.run()
+        job.refresh_from_db()
+        self.assertEqual(job.state, job.FAILED)
+        self.assertEqual(job.error_count, 2)
+        self.assertEqual(job.errors, [
+            {'mail': "job3@mail.dev", 'error': "This mail has already accepted an Invitation before."},
+            {'mail': "job@", 'error': "Enter a valid email address."},
+        ])
+        self.assertEqual(Invitation.objects.count(), 1)
+
+    def test_run_resumed(self):
+        """
+            - tests that a job interrupted while creating invitations picks up where it stopped
+        """
+        job = self.create_job()
+        with mock.patch.object(Invitation, "create_many", wraps=Invitation.create_many) as create_many:
+            create_many.side_effect = [None, RuntimeError("worker died")]
+            with self.assertRaises(RuntimeError):
+                job.run()
+        job.refresh_from_db()
+        self.assertEqual((job.state, job.created), (job.CREATING, 2))
+
+        job.run()
+        job.refresh_from_db()
+        self.assertEqual((job.state, job.created), (job.DONE, 5))
+        # the first chunk was mocked away, only the 3 mails after it were created
+        self.assertEqual(
+            sorted(Invitation.objects.values_list('mail_address', flat=True)),
+            ["job2@mail.dev", "job3@mail.dev", "job4@mail.dev"]
+        )
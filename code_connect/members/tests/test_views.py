@@ -0,0 +1,170 @@
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.contrib.auth.hashers import PBKDF2PasswordHasher
+
+from members.forms import InviteForm
+from members.models import CustomUser, Invitation, InviteImportJob
+
+from unittest import mock
+
+
+
+class InviteJobViewTests(TestCase):
+    """ tests for the invite view and the status views of InviteImportJob """
+
+    #_______________________utilities_________________________
+
+    def setUp(self):
+        self.admin = CustomUser.objects.create_superuser(email="admin@mail.dev", password="password")
+        self.client.force_login(self.admin)
+
+    #_______________________tests_________________________
+
+    def test_large_invite_redirects_to_job(self):
+        """
+            - tests that a large list is handed over to a job, and the user redirected
+            to its status page
+        """
+        mails = ", ".join(f"view{i}@mail.com" for i in range(InviteForm.JOB_INVITES + 1))
+        response = self.client.post(reverse('members:invite'), {'mail_list': mails})
+        job = InviteImportJob.objects.get()
+        self.assertRedirects(response, reverse('members:invite-job', args=[job.pk]))
+
+        response = self.client.get(reverse('members:invite-job', args=[job.pk]))
+        self.assertContains(response, reverse('members:invite-job-status', args=[job.pk]))
+
+    def test_job_status(self):
+        """
+            - tests that the status endpoint returns the progress of the job
+        """
+        job = InviteImportJob.enqueue({"a@mail.dev", "b@mail.dev"})
+        job.run()
+        response = self.client.get(reverse('members:invite-job-status', args=[job.pk]))
+        self.assertEqual(response.json()['state'], 'DONE')
+        self.assertEqual(response.json()['progress'], 100)
+        self.assertEqual(response.json()['created'], 2)
+
+    def test_job_failed_midway(self):
+        """
+            - tests that a job failing after some of its chunks were created shows how
+            many invites were created, instead of "No invites were created"
+        """
+        job = InviteImportJob.enqueue({f"part{i}@mail.dev" for i in range(5)})
+        create_many = Invitation.create_many
+        calls = []
+
+        def fail_second_chunk(*args, **kwargs):
+            calls.append(args)
+            if len(calls) == 2:
+                raise RuntimeError("unexpected")
+            return create_many(*args, **kwargs)
+
+        with mock.patch.object(InviteImportJob, "CHUNK_SIZE", 2), \
+                mock.patch.object(Invitation, "create_many", side_effect=fail_second_chunk):
+            with self.assertRaises(RuntimeError):
+                job.run()
+        job.fail(RuntimeError("unexpected"))   # as done by the ImportInvitesTask
+        job.refresh_from_db()
+        self.assertEqual((job.state, job.created), (job.FAILED, 2))
+        self.assertEqual(Invitation.objects.count(), 2)
+
+        response = self.client.get(reverse('members:invite-job', args=[job.pk]))
+        self.assertContains(response, "2</span> of 5 invites were created before the job failed")
+        self.assertContains(response, 'class="job-failed-none" hidden')
+        self.assertEqual(
+            self.client.get(reverse('members:invite-job-status', args=[job.pk])).json()['created'], 2
+        )
+
+    def test_job_status_forbidden(self):
+        """
+            - tests that only users allowed to invite can see the status of a job
+        """
+        job = InviteImportJob.enqueue({"a@mail.dev"})
+        self.client.force_login(CustomUser.objects.create_user(email="user@mail.dev"))
+        response = self.client.get(reverse('members:invite-job-status', args=[job.pk]))
+        self.assertEqual(response.status_code, 403)
+
+
+class RegistrationViewTests(TestCase):
+    """ tests for the register and setup_password views """
+
+    #_______________________utilities_________________________
+
+    def setUp(self):
+        # no need to train the gender predictor
+        patcher = mock.patch("members.gender.predict", return_value="male")
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def register(self, email="johncarter001@dev.cs"):
+        invite = Invitation(mail_address=email)
+        invite.full_clean()
+        invite.save()
+        return self.client.post(reverse('members:member_registration'), {
+            'firstname': "John",
+            'lastname': "Carter",
+            'email': email,
+            'roll': "22BECSE44",
+            'contact': "+91 9999999999",
+            'programme': "CSE",
+            'semester': "4",
+            'invitation_code': invite.code,
+        })
+
+    #_______________________tests_________________________
+
+    def test_register_without_hashing(self):
+        """
+            - tests that a new member is logged in and sent to set up their password,
+            without any password being hashed or checked
+        """
+        with mock.patch.object(PBKDF2PasswordHasher, "encode") as encode, \
+                mock.patch.object(PBKDF2PasswordHasher, "verify") as verify:
+            response = self.register()
+            user = CustomUser.objects.get(email="johncarter001@dev.cs")
+            self.assertRedirects(
+                response, f"{reverse('members:setup-password')}?t={user.make_setup_token()}",
+                fetch_redirect_response=False
+            )
+            # the token logs the user in, and is dropped from the url
+            response = self.client.get(response.url)
+            self.assertRedirects(response, reverse('members:setup-password'))
+        encode.assert_not_called()
+        verify.assert_not_called()
+        self.assertFalse(user.has_usable_password())
+
+        response = self.client.get(reverse('members:setup-password'))
+        self.assertEqual(response.context['user'], user)
+        self.assertNotIn('old_password', response.context['form'].fields)
+
+        response = self.client.post(reverse('members:setup-password'), {
+            'new_password1': "a-long-passphrase", 'new_password2': "a-long-passphrase",
+        })
+        self.assertRedirects(response, reverse('members:profile'))
+        user.refresh_from_db()
+        self.assertTrue(user.check_password("a-long-passphrase"))
+
+    def test_setup_token_single_use(self):
+        """
+            - tests that a setup token can't be used once the password is set
+        """
+        self.register()
+        user = CustomUser.objects.get(email="johncarter001@dev.cs")
+        token = user.make_setup_token()
+        self.assertEqual(CustomUser.from_setup_token(token), user)
+        self.assertIsNone(CustomUser.from_setup_token(token + "x"))
+
+        user.set_password("a-long-passphrase")
+        user.save()
+        self.client.logout()
+        response = self.client.get(reverse('members:setup-password'), {'t': token})
+        self.assertEqual(response.status_code, 400)
+
+    @override_settings(PASSWORD_SETUP_TOKEN_MAX_AGE=-1)
+    def test_setup_token_expired(self):
+        """
+            - tests that an expired setup token doesn't log the user in
+        """
+        self.register()
+        token = CustomUser.objects.get(email="johncarter001@dev.cs").make_setup_token()
+        self.assertIsNone(CustomUser.from_setup_token(token))
@@ -1,23 +1,14 @@
 from django.urls import path
-from django.contrib.auth import views as auth_views
-from django.urls import reverse_lazy
 
 from members import views
-from members.models import CustomUser
 
 app_name = "members"
 
 urlpatterns = [
     path("registration/", views.register, name="member_registration"),
     path("invite/", views.invite, name="invite"),
-    path(
-        "account/setup-password/", 
-        auth_views.PasswordChangeView.as_view(
-            success_url=reverse_lazy('members:profile'), 
-            template_name='members/password-setup.html', 
-            extra_context={'old_password': CustomUser.DEFAULT_PASSWORD}
-        ), 
-        name="setup-password"
-    ),
+    path("invite/jobs/<int:pk>/", views.invite_job, name="invite-job"),
+    path("invite/jobs/<int:pk>/status/", views.invite_job_status, name="invite-job-status"),
+    path("account/setup-password/", views.setup_password, name="setup-password"),
     path("profile/", views.profile, name="profile"),
 ]
\ No newline at end of file
@@ -4,7 +4,8 @@ from django.contrib.auth.decorators import login_required
 from django.conf import settings
 
 from datetime import timedelta
-import os
+import codecs
+import io
 
 from members.models import Invitation
 
@@ -36,22 +37,28 @@ def permission_required(perm):
         return wrapper
     return decorator
 
-def handle_uploaded_file(f):
+def iter_uploaded_lines(f, encoding="utf-8-sig", chunk_size=None):
     """ 
-        - saves the user-uploaded file which is in memory to disk and 
-        returns the file path. 
-    """
-    directory = f"invite_csv_files/"
-    os.makedirs(directory, exist_ok=True)
-
-    original_filename = f.name.replace(' ', '_')
-    file_path = os.path.join(directory, original_filename)
-    
-    with open(file_path, "wb+") as destination:
-        for chunk in f.chunks():
-            destination.write(chunk)
+        - yields the lines of the user-uploaded file {f}, decoded from its chunks as they
+        are read. Nothing is written to disk and only the current line is kept in memory,
+        so the result can be fed straight to `csv.reader`.
 
-    return file_path
+        *   a character split over two chunks is decoded once the rest of it is read.
+        *   lines may end with "\n", "\r\n" or a lone "\r" (eg. "CSV (Macintosh)" files
+            saved by Excel), all yielded as "\n". Line endings are kept, so quoted fields
+            spanning several lines are parsed correctly. A byte order mark is dropped ("utf-8-sig").
+        *   raises UnicodeDecodeError if the file isn't valid {encoding}.
+    """
+    decoder = io.IncrementalNewlineDecoder(codecs.getincrementaldecoder(encoding)(), translate=True)
+    pending = ""
+    for chunk in f.chunks(chunk_size):
+        lines = (pending + decoder.decode(chunk)).split("\n")
+        pending = lines.pop()   # the last line may go on in the next chunk
+        for line in lines:
+            yield line + "\n"
+    pending += decoder.decode(b"", final=True)
+    if pending:
+        yield pending
 
 def get_Invitation_or_None(code):
     """ rarely needed utility for Invitation model """
@@ -1,11 +1,14 @@
-from django.shortcuts import render, redirect
-from django.http import HttpResponse
-from django.contrib.auth import authenticate, login, logout
+from django.shortcuts import render, redirect, get_object_or_404
+from django.http import HttpResponse, JsonResponse
+from django.urls import reverse
+from django.contrib.auth import login, logout, update_session_auth_hash
 from django.contrib.auth.decorators import login_required
+from django.contrib.auth.forms import SetPasswordForm, PasswordChangeForm
+from django.contrib.auth.views import redirect_to_login
 from django.conf import settings
 
 from members.forms import MemberForm, InviteForm
-from members.models import Member, CustomUser
+from members.models import Member, CustomUser, InviteImportJob
 
 from . import utils
 from .utils import permission_required
@@ -27,6 +30,8 @@ def register(request):
             Member.user model-field referencing CustomUser through a One-One relationship.
             Member is used for storing user attributes, whereas CustomUser is for authentication 
             and authorisation tasks.     
+        *   The new user is then sent to setup_password() with a setup token, which logs them in.
+            Their account has no usable password until then, so no password is hashed or checked.
     """
 
     # displays the last 10 people who registered
@@ -36,14 +41,13 @@ def register(request):
     if request.method == "POST":
         form = MemberForm(request.POST)
         if form.is_valid():
-            form.save()
-            
-            # authenticate the newly created user and then
-            # redirect to "account/password-setup/" route
-            user = authenticate(email=form.cleaned_data['email'], password=CustomUser.DEFAULT_PASSWORD)
-            if user:
-                login(request, user)
-            return redirect('members:setup-password')
+            user = form.save().user
+
+            # a CustomUser that existed before (and has a password) logs in as usual
+            if user.has_usable_password():
+                return redirect('members:profile')
+            # redirect to "account/setup-password/" route, which logs the new user in
+            return redirect(f"{reverse('members:setup-password')}?t={user.make_setup_token()}")
 
     else:
         #   * autofill 'invitation_code' and 'email' form-fields if query parameter 
@@ -58,6 +62,50 @@ def register(request):
     return render(request, "members/registration.html", context)
 
 
+def setup_password(request):
+    """
+        - lets a user set the password of their account.
+
+        *   register() sends new users here with a setup token (?t=...), which logs them in
+            (see CustomUser.from_setup_token()). The page is then reloaded without the token,
+            so that it doesn't stay in the browser history.
+        *   users without a usable password set one with a SetPasswordForm, others change
+            theirs with a PasswordChangeForm, which asks for the current one.
+    """
+    if token := request.GET.get('t'):
+        user = CustomUser.from_setup_token(token)
+        if user is None:
+            return render(
+                request,
+                "error.html",
+                {
+                    'error_code': "400 (Bad Request)",
+                    'error': "This link has expired or was already used. Please contact club authorities if you can't log in."
+                },
+                status=400,
+            )
+        login(request, user, backend=settings.AUTHENTICATION_BACKENDS[0])
+        return redirect('members:setup-password')
+
+    if not request.user.is_authenticated:
+        return redirect_to_login(request.get_full_path(), settings.LOGIN_URL)
+
+    setup = not request.user.has_usable_password()
+    form_class = SetPasswordForm if setup else PasswordChangeForm
+    if request.method == "POST":
+        form = form_class(request.user, request.POST)
+        if form.is_valid():
+            form.save()
+            # changing the password logs the user out of their other sessions, not this one
+            update_session_auth_hash(request, form.user)
+            return redirect('members:profile')
+    else:
+        form = form_class(request.user)
+
+    context = {'form': form, 'setup': setup, 'title': "Password setup" if setup else "Password change"}
+    return render(request, "members/password-setup.html", context)
+
+
 @permission_required('members.add_invitation')
 def invite(request):
     """
@@ -67,11 +115,15 @@ def invite(request):
             a .csv file containing the said mails.
         *   An Invitation object with a unique invite-code will be created for each mail specified. 
             A background task will then send invitations via mail.      
+        *   Large lists are handed over to an InviteImportJob, the user is then redirected to
+            the status page of the job.
     """
 
     if request.method == "POST":
         form = InviteForm(request.POST, request.FILES)
         if form.is_valid():
+            if form.job:
+                return redirect('members:invite-job', pk=form.job.pk)
             return render(request, "members/invite_page.html", {'form': InviteForm(), 'success': True})
 
     else:
@@ -80,6 +132,23 @@ def invite(request):
     return render(request, "members/invite_page.html", {'form': form})
 
 
+@permission_required('members.add_invitation')
+def invite_job(request, pk):
+    """
+        - status page of an InviteImportJob. It polls invite_job_status() until the job
+        is finished, and then shows its result.
+    """
+    job = get_object_or_404(InviteImportJob, pk=pk)
+    return render(request, "members/invite_job_page.html", {'job': job})
+
+
+@permission_required('members.add_invitation')
+def invite_job_status(request, pk):
+    """ returns the progress of an InviteImportJob as JSON, without loading its mails """
+    job = get_object_or_404(InviteImportJob.objects.defer('mails'), pk=pk)
+    return JsonResponse(job.status())
+
+
 @login_required(login_url=settings.LOGIN_URL)
 def profile(request):
     if hasattr(request.user, 'member'):